@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+"""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+
+Copyright ANDRÉS PÉREZ LÓPEZ, January 2014
+contact@andresperezlopez.com
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+            AMBISONICS DECODER
+
+Decoding matrices for arbitrary speaker layouts, from ACN/N3D B-format as rendered
+by offlineRender.py (up to third order, or higher)
+
+- a layout is a list of speaker directions in degrees: either azimuths only, as for
+  VBAPSpeakerArray in SpatialRender.sc (e.g. [-30,30,0,-110,110]), or [azimuth, elevation]
+  pairs; AmbDec presets (.ambdec files, see AmbDec.sc) can be read with readAmbDecLayout()
+
+- methods:
+    'modeMatching': solve the re-encoding equations Y^T D = I exactly;
+                    needs at least as many speakers as channels, and a regular enough layout
+    'pinv': pseudo-inverse of the speaker encoding matrix, dropping the singular values
+            below rcond; works for any layout (e.g. higher orders on horizontal rings)
+    'allrad': sampling decoder on a dense virtual layout, panned to the real speakers with VBAP
+              (see vbap.py);
+              the most robust choice for irregular layouts and domes
+  every matrix is scaled to unit mean energy over the sphere, so that methods and layouts
+  are level matched
+
+- matrices are cached on disk, named after the hash of the method, order and layout:
+      <cacheDir>/<method>-<order>-<hash>.npy
+
+- decoding is one matrix multiply per block: (frames, channels) x (channels, speakers)
+
+"""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+import hashlib
+import json
+import os
+import numpy as np
+import plotSphericalHarmonics as psh
+import vbap
+
+
+METHODS=('modeMatching','pinv','allrad')
+DEFAULT_CACHE_DIR=os.path.join(os.path.expanduser('~'),'.cache','3Dj','decoders')
+
+def readAmbDecLayout(filepath):
+    """
+    read the speaker directions of an AmbDec preset (add_spkr id dist azim elev conn)
+
+    Returns a (speakers, 2) array of azimuth, elevation in degrees
+    """
+    speakers=[]
+    with open(filepath,'r') as f:
+        for line in f:
+            tokens=line.split()
+            if tokens and tokens[0]=='add_spkr':
+                speakers.append((float(tokens[3]),float(tokens[4])))
+    if not speakers:
+        raise ValueError('%s has no speakers' % filepath)
+    return np.array(speakers)
+
+def speakerLayout(layout):
+    """
+    (speakers, 2) array of azimuth, elevation in degrees, from a list of azimuths,
+    a list of [azimuth, elevation] pairs or the path to an AmbDec preset
+    """
+    if isinstance(layout,str):
+        return readAmbDecLayout(layout)
+    return vbap.speakerLayout(layout)
+
+def sphereGrid(n):
+    """
+    (n, 2) array of azimuth, elevation in degrees, nearly uniform on the sphere (Fibonacci grid)
+    """
+    i=np.arange(n)+0.5
+    ele=np.degrees(np.arcsin(1.-2.*i/n))
+    azi=np.degrees(np.mod(np.pi*(3.-np.sqrt(5.))*i,2*np.pi))
+    return np.column_stack((azi,ele))
+
+def speakerMatrix(layout,order):
+    """
+    (speakers, channels) matrix of spherical harmonics at the speaker directions
+    """
+    return psh.encode(np.radians(layout[:,1]),np.radians(layout[:,0]),order)
+
+
+"""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+decoding matrices
+"""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+
+def modeMatchingDecoder(layout,order):
+    Y=speakerMatrix(layout,order)
+    if Y.shape[0]<Y.shape[1]:
+        raise ValueError('mode matching needs at least %d speakers for order %d; use pinv or allrad'
+                         % (Y.shape[1],order))
+    gram=Y.T.dot(Y)
+    if np.linalg.cond(gram)>1e8:
+        raise ValueError('the layout cannot reproduce order %d; use pinv or allrad' % order)
+    return Y.dot(np.linalg.inv(gram))
+
+def pinvDecoder(layout,order,rcond=1e-3):
+    return np.linalg.pinv(speakerMatrix(layout,order).T,rcond=rcond)
+
+def allradDecoder(layout,order,numVirtual=2000):
+    virtual=sphereGrid(numVirtual)
+    gains=vbap.layoutVBAP(layout,dim=3).gains(virtual[:,0],virtual[:,1])
+    return gains.T.dot(speakerMatrix(virtual,order))/numVirtual
+
+def normalizeEnergy(D,order,numDirections=2000):
+    """
+    scale D so that the mean speaker energy of a plane wave over the sphere is 1
+    """
+    Y=speakerMatrix(sphereGrid(numDirections),order)
+    energy=((Y.dot(D.T))**2).sum(axis=1).mean()
+    return D/np.sqrt(energy)
+
+def decoderMatrix(layout,order=3,method='allrad',**params):
+    """
+    (speakers, channels) decoding matrix, computed without any cache
+
+    Parameters:
+        layout: speaker directions (see speakerLayout)
+        order: ambisonics order (default:3)
+        method: 'modeMatching', 'pinv' or 'allrad' (default:'allrad')
+        params: rcond for pinv, numVirtual for allrad
+    """
+    layout=speakerLayout(layout)
+    if method=='modeMatching':
+        D=modeMatchingDecoder(layout,order)
+    elif method=='pinv':
+        D=pinvDecoder(layout,order,**params)
+    elif method=='allrad':
+        D=allradDecoder(layout,order,**params)
+    else:
+        raise ValueError('unknown method %s, should be one of %s' % (method,', '.join(METHODS)))
+    return np.ascontiguousarray(normalizeEnergy(D,order))
+
+def matrixKey(layout,order,method,params):
+    """
+    hash of everything a decoding matrix depends on
+    """
+    description=json.dumps([method,order,np.round(layout,6).tolist(),sorted(params.items())])
+    return hashlib.sha1(description.encode('utf-8')).hexdigest()
+
+# matrices already loaded or computed in this session
+_matrices={}
+
+def loadDecoderMatrix(layout,order=3,method='allrad',cacheDir=DEFAULT_CACHE_DIR,**params):
+    """
+    decoderMatrix(), read from (or written to) the disk cache; cacheDir None disables it
+    """
+    layout=speakerLayout(layout)
+    key=matrixKey(layout,order,method,params)
+    if key in _matrices:
+        return _matrices[key]
+    path=None
+    if cacheDir is not None:
+        path=os.path.join(cacheDir,'%s-%d-%s.npy' % (method,order,key[:16]))
+        if os.path.exists(path):
+            _matrices[key]=np.load(path)
+            return _matrices[key]
+
+    D=decoderMatrix(layout,order,method,**params)
+
+    if path is not None:
+        try:
+            if not os.path.isdir(cacheDir):
+                os.makedirs(cacheDir)
+            tmp=path+'.tmp'
+            with open(tmp,'wb') as f:
+                np.save(f,D)
+            os.replace(tmp,path)
+        except (IOError,OSError):
+            # read-only location: keep the matrix in memory
+            pass
+    _matrices[key]=D
+    return D
+
+
+class Decoder(object):
+    """
+    B-format to speaker feeds decoder
+
+    Parameters:
+        layout: speaker directions (see speakerLayout)
+        order: ambisonics order (default:3)
+        method: 'modeMatching', 'pinv' or 'allrad' (default:'allrad')
+        cacheDir: directory of cached matrices (default: ~/.cache/3Dj/decoders)
+        params: rcond for pinv, numVirtual for allrad
+
+    usage:
+        decoder=Decoder([-30,30,0,-110,110],order=3)
+        feeds=decoder.decode(bformat) # (frames, 16) -> (frames, 5)
+    """
+    def __init__(self,layout,order=3,method='allrad',cacheDir=DEFAULT_CACHE_DIR,**params):
+        self.layout=speakerLayout(layout)
+        self.order=order
+        self.method=method
+        self.matrix=loadDecoderMatrix(self.layout,order,method,cacheDir,**params)
+        self._transposed=np.ascontiguousarray(self.matrix.T)
+
+    @property
+    def numSpeakers(self):
+        return self.matrix.shape[0]
+
+    @property
+    def numChannels(self):
+        return self.matrix.shape[1]
+
+    def decode(self,bformat,out=None):
+        """
+        decode a (frames, channels) block into (frames, speakers) feeds;
+        extra (higher order) input channels are ignored
+        """
+        return np.dot(bformat[:,:self.numChannels],self._transposed,out=out)
+
+    def decodeFile(self,inpath,outpath,blockSize=4096):
+        """
+        decode a B-format WAV file (as written by offlineRender.py) into a multichannel WAV file
+        """
+        import offlineRender as render
+        with render.WavReader(inpath) as reader:
+            if reader.numChannels<self.numChannels:
+                raise ValueError('%s has %d channels, %d needed for order %d'
+                                 % (inpath,reader.numChannels,self.numChannels,self.order))
+            out=np.empty((blockSize,self.numSpeakers))
+            with render.WavWriter(outpath,self.numSpeakers,reader.sampleRate) as writer:
+                while True:
+                    block=reader.read(blockSize)
+                    if block.shape[0]==0:
+                        break
+                    writer.write(self.decode(block,out=out[:block.shape[0]]))
+                return writer.peak
@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+"""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+
+Copyright ANDRÉS PÉREZ LÓPEZ, January 2014
+contact@andresperezlopez.com
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+            BINAURAL DECODER
+
+Block based binaural decoding of ACN/N3D B-format, as rendered by offlineRender.py,
+with the HRIR kernels used by SpatialRender.setBinauralDecoder (FoaDecoderKernel)
+
+- kernels: one stereo (left, right) impulse response per B-format channel;
+  loadATKKernels() reads the ATK kernel folders:
+      <kernelDir>/FOA/decoders/<cipic|listen|spherical>/SR_<rate>/<size>/<subject>/*.wav
+  one file per FuMa channel (W, X, Y, Z in alphabetical order), which are converted to ACN/N3D
+
+- convolution: uniformly partitioned overlap-add, in the frequency domain:
+  the kernels are split into partitions of blockSize taps, whose spectra are computed once;
+  each block costs one FFT per input channel, one multiply-accumulate over all partitions
+  and two inverse FFTs, whatever the kernel length; the output is sample aligned with
+  the direct convolution, so there is no latency beyond the caller's own block buffering
+
+- kernel spectra are cached on disk for each decoder type, subject, sample rate and block size:
+      <cacheDir>/<type>-<subject>-<rate>-<size>-<blockSize>-<hash>.npy
+  so that every session using the same subject loads them directly
+
+"""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+import glob
+import hashlib
+import os
+import numpy as np
+
+
+DEFAULT_KERNEL_DIR=os.path.join(os.path.expanduser('~'),'.local','share','ATK','kernels')
+DEFAULT_CACHE_DIR=os.path.join(os.path.expanduser('~'),'.cache','3Dj','hrtf')
+
+# FuMa (W, X, Y, Z) to ACN/N3D: channel index and gain of each ACN channel
+FUMA_TO_ACN=((0,1./np.sqrt(2.)),(2,1./np.sqrt(3.)),(3,1./np.sqrt(3.)),(1,1./np.sqrt(3.)))
+
+def atkKernelPath(decoderType,subjectID,sampleRate=44100,kernelSize=512,kernelDir=DEFAULT_KERNEL_DIR):
+    """
+    folder of the ATK FOA decoder kernels for a subject, as FoaDecoderKernel looks for them
+    """
+    return os.path.join(kernelDir,'FOA','decoders',str(decoderType),'SR_%06d' % sampleRate,
+                        '%04d' % kernelSize,'%04d' % int(subjectID))
+
+def kernelFiles(path):
+    files=sorted(glob.glob(os.path.join(path,'*.wav')))
+    if not files:
+        raise IOError('no kernels found in %s' % path)
+    return files
+
+def loadATKKernels(path):
+    """
+    (4, taps, 2) ACN/N3D first order kernels from an ATK subject folder
+    """
+    import offlineRender as render
+    fuma=[]
+    for filepath in kernelFiles(path):
+        with render.WavReader(filepath) as reader:
+            if reader.numChannels!=2:
+                raise ValueError('%s: kernels should have 2 channels' % filepath)
+            fuma.append(reader.read(reader.numFrames))
+    if len(fuma)!=4:
+        raise ValueError('%s: 4 kernels (W, X, Y, Z) expected, %d found' % (path,len(fuma)))
+    # the decoded signal is sum(fuma_c * h_c), with fuma_c = gain * acn_k
+    return np.array([fuma[c]*gain for c,gain in FUMA_TO_ACN])
+
+def kernelSpectra(kernels,blockSize):
+    """
+    (partitions, channels, blockSize+1, 2) spectra of the kernel partitions
+
+    Parameters:
+        kernels: (channels, taps, 2) impulse responses
+        blockSize: partition size, equal to the processing block size
+    """
+    channels,taps,ears=kernels.shape
+    partitions=max(1,(taps+blockSize-1)//blockSize)
+    padded=np.zeros((partitions,blockSize,channels,ears))
+    padded.reshape(partitions*blockSize,channels,ears)[:taps]=kernels.transpose(1,0,2)
+    spectra=np.fft.rfft(padded,n=2*blockSize,axis=1) # (partitions, bins, channels, ears)
+    return np.ascontiguousarray(spectra.transpose(0,2,1,3))
+
+def spectraPath(cacheDir,decoderType,subjectID,sampleRate,kernelSize,blockSize,path):
+    """
+    cache path of the kernel spectra, with a hash of the kernel files names, sizes and dates
+    """
+    h=hashlib.sha1()
+    for filepath in kernelFiles(path):
+        st=os.stat(filepath)
+        h.update(('%s %d %d\n' % (os.path.basename(filepath),st.st_size,st.st_mtime_ns)).encode('utf-8'))
+    return os.path.join(cacheDir,'%s-%04d-%d-%d-%d-%s.npy' % (decoderType,int(subjectID),sampleRate,kernelSize,
+                                                              blockSize,h.hexdigest()[:16]))
+
+# spectra already loaded in this session
+_spectra={}
+
+def subjectSpectra(decoderType,subjectID,blockSize,sampleRate=44100,kernelSize=512,
+                   kernelDir=DEFAULT_KERNEL_DIR,cacheDir=DEFAULT_CACHE_DIR):
+    """
+    kernel spectra of an ATK subject, read from (or written to) the disk cache;
+    cacheDir None disables it
+    """
+    path=atkKernelPath(decoderType,subjectID,sampleRate,kernelSize,kernelDir)
+    cachePath=None
+    if cacheDir is not None:
+        cachePath=spectraPath(cacheDir,decoderType,subjectID,sampleRate,kernelSize,blockSize,path)
+        if cachePath in _spectra:
+            return _spectra[cachePath]
+        if os.path.exists(cachePath):
+            _spectra[cachePath]=np.load(cachePath,mmap_mode='r')
+            return _spectra[cachePath]
+
+    spectra=kernelSpectra(loadATKKernels(path),blockSize)
+
+    if cachePath is not None:
+        try:
+            if not os.path.isdir(cacheDir):
+                os.makedirs(cacheDir)
+            tmp=cachePath+'.tmp'
+            with open(tmp,'wb') as f:
+                np.save(f,spectra)
+            os.replace(tmp,cachePath)
+        except (IOError,OSError):
+            # read-only location: keep the spectra in memory
+            pass
+        _spectra[cachePath]=spectra
+    return spectra
+
+
+class BinauralDecoder(object):
+    """
+    partitioned convolution of B-format blocks with binaural kernels
+
+    Parameters:
+        spectra: kernel spectra, as returned by kernelSpectra() or subjectSpectra()
+        blockSize: frames per block, the same used for the spectra (64 to 256 for low latency)
+
+    usage:
+        decoder=BinauralDecoder(subjectSpectra('cipic',21,128),128)
+        for block in blocks: # (128, channels) B-format, extra channels are ignored
+            stereo=decoder.process(block)
+    """
+    def __init__(self,spectra,blockSize):
+        self.numPartitions,self.numChannels,bins,ears=np.shape(spectra)
+        if bins!=blockSize+1:
+            raise ValueError('the spectra were computed for blocks of %d frames' % (bins-1))
+        self.blockSize=blockSize
+        # partitions and channels flattened, to accumulate them in a single product
+        self.spectra=np.asarray(spectra).reshape(self.numPartitions*self.numChannels,bins,ears)
+        self.reset()
+
+    def reset(self):
+        """
+        clear the convolution state
+        """
+        bins=self.blockSize+1
+        # frequency-domain delay line, stored twice so that the last partitions spectra
+        # are always a contiguous view, newest first
+        self._delayLine=np.zeros((2*self.numPartitions,self.numChannels,bins),dtype=np.complex128)
+        self._position=0
+        self._input=np.zeros((self.numChannels,2*self.blockSize))
+        self._sum=np.zeros((bins,2),dtype=np.complex128)
+        self._tail=np.zeros((self.blockSize,2))
+
+    def process(self,block,out=None):
+        """
+        decode a (blockSize, channels) B-format block into a (blockSize, 2) binaural block;
+        only the last block of a stream may be shorter
+        """
+        B=self.blockSize
+        P=self.numPartitions
+        frames=block.shape[0]
+        self._input[:,:frames]=block[:,:self.numChannels].T
+        self._input[:,frames:B]=0.
+        self._position=(self._position-1)%P
+        spectrum=np.fft.rfft(self._input,axis=1)
+        self._delayLine[self._position]=spectrum
+        self._delayLine[self._position+P]=spectrum
+
+        window=self._delayLine[self._position:self._position+P].reshape(P*self.numChannels,B+1)
+        np.einsum('kb,kbe->be',window,self.spectra,out=self._sum)
+        y=np.fft.irfft(self._sum,n=2*B,axis=0)
+
+        if out is None:
+            out=np.empty((B,2))
+        np.add(y[:B],self._tail,out=out)
+        self._tail[:]=y[B:]
+        return out[:frames]
+
+    def decodeFile(self,inpath,outpath):
+        """
+        decode a B-format WAV file into a stereo WAV file, including the kernel tail
+        """
+        import offlineRender as render
+        out=np.empty((self.blockSize,2))
+        silence=np.zeros((self.blockSize,self.numChannels))
+        with render.WavReader(inpath) as reader:
+            if reader.numChannels<self.numChannels:
+                raise ValueError('%s has %d channels, %d needed' % (inpath,reader.numChannels,self.numChannels))
+            with render.WavWriter(outpath,2,reader.sampleRate) as writer:
+                while True:
+                    block=reader.read(self.blockSize)
+                    if block.shape[0]==0:
+                        break
+                    writer.write(self.process(block,out=out))
+                for i in range(self.numPartitions):
+                    writer.write(self.process(silence,out=out))
+                return writer.peak
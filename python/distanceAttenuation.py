@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+
+Copyright ANDRÉS PÉREZ LÓPEZ, January 2014
+contact@andresperezlopez.com
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+            DISTANCE ATTENUATION
+
+Block based versions of the distanceAttenuation SynthDefs of SpatialRender
+(SpatialRender_synthdefs.sc), for many sources at once
+
+- models, with the /spatdif/distance-cues parameters:
+    0: no attenuation
+    1: linear rolloff
+        rof = (refDistance/maxAttenuation - refDistance) / (maxDistance - refDistance)
+        amp = refDistance / ((r - refDistance) * rof + refDistance)
+    2: exponential (default in SpatialRender)
+        a = log(maxAttenuation) / log(refDistance/maxDistance)
+        amp = (refDistance / r)^a
+  with amp clipped to [maxAttenuation, 1]
+
+- DistanceAttenuation.process() ramps every source gain linearly from the previous block
+  to the current one, and multiplies the (sources, frames) buffer in place:
+  the ramps are written into a preallocated buffer, so each block costs
+  three array operations, whatever the number of sources
+
+"""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+import numpy as np
+
+
+# SpatialRender defaults
+REFERENCE_DISTANCE=1.
+MAXIMUM_ATTENUATION=0.000016
+MAXIMUM_DISTANCE=62500.
+ATTENUATION_MODEL=2
+
+def attenuation(r,model=ATTENUATION_MODEL,refDistance=REFERENCE_DISTANCE,maxAttenuation=MAXIMUM_ATTENUATION,
+                maxDistance=MAXIMUM_DISTANCE,out=None):
+    """
+    amplitude gains for the distances r (any shape), as the distanceAttenuation<model> SynthDefs
+
+    Parameters:
+        r: source distance(s)
+        model: 0 (none), 1 (linear rolloff) or 2 (exponential) (default:2)
+        refDistance: distance with no attenuation (default:1)
+        maxAttenuation: minimum gain, as a linear amplitude (default:0.000016, -96 dB)
+        maxDistance: distance reaching maxAttenuation (default:62500)
+        out: optional output array, of the shape of r
+    """
+    r=np.asarray(r,dtype=np.float64)
+    if out is None:
+        out=np.empty(r.shape)
+    if model==0:
+        out.fill(1.)
+        return out
+    if model==1:
+        rof=(refDistance/maxAttenuation-refDistance)/(maxDistance-refDistance)
+        np.subtract(r,refDistance,out=out)
+        out*=rof
+        out+=refDistance
+        with np.errstate(divide='ignore'):
+            np.divide(refDistance,out,out=out)
+    elif model==2:
+        a=np.log(maxAttenuation)/np.log(float(refDistance)/maxDistance)
+        # (refDistance/r)^a, with r=0 giving the maximum gain
+        with np.errstate(divide='ignore'):
+            np.divide(refDistance,r,out=out)
+        np.power(out,a,out=out)
+    else:
+        raise ValueError('unknown attenuation model %s, should be 0, 1 or 2' % model)
+    # negative amplitudes (model 1 beyond its pole) are clipped as in scsynth
+    return np.clip(out,maxAttenuation,1.,out=out)
+
+
+class DistanceAttenuation(object):
+    """
+    per-sample distance attenuation of blocks of source signals
+
+    Parameters:
+        numSources: number of sources (rows of the processed buffers)
+        blockSize: maximum frames per block
+        model, refDistance, maxAttenuation, maxDistance: as attenuation()
+
+    usage:
+        att=DistanceAttenuation(len(names),512)
+        att.process(signals,state.distance) # signals: (sources, frames), modified in place
+    """
+    def __init__(self,numSources,blockSize,model=ATTENUATION_MODEL,refDistance=REFERENCE_DISTANCE,
+                 maxAttenuation=MAXIMUM_ATTENUATION,maxDistance=MAXIMUM_DISTANCE):
+        self.numSources=numSources
+        self.blockSize=blockSize
+        self.model=model
+        self.refDistance=refDistance
+        self.maxAttenuation=maxAttenuation
+        self.maxDistance=maxDistance
+        self._ramp=np.arange(blockSize)/float(blockSize)
+        self._gains=np.empty((numSources,blockSize))
+        self._delta=np.empty(numSources)
+        self.gains=np.empty(numSources)
+        self.reset()
+
+    def reset(self,distances=None):
+        """
+        forget the previous gains: the next block will not be ramped
+        (or will be ramped from the gains of the given distances)
+        """
+        self._previous=None
+        if distances is not None:
+            self._previous=self.targetGains(distances).copy()
+
+    def targetGains(self,distances):
+        return attenuation(distances,self.model,self.refDistance,self.maxAttenuation,self.maxDistance,out=self.gains)
+
+    def process(self,signals,distances):
+        """
+        attenuate a (sources, frames) block in place, ramping the gains from the previous block
+        to those of the given distances; returns signals
+        """
+        frames=signals.shape[1]
+        g1=self.targetGains(distances)
+        if self._previous is None:
+            self._previous=g1.copy()
+        ramp=self._ramp[:frames] if frames==self.blockSize else np.arange(frames)/float(frames)
+        gains=self._gains[:,:frames]
+
+        # gains = g0 + (g1-g0) * ramp
+        np.subtract(g1,self._previous,out=self._delta)
+        np.multiply(self._delta[:,None],ramp[None,:],out=gains)
+        gains+=self._previous[:,None]
+        signals*=gains
+
+        self._previous[:]=g1
+        return signals
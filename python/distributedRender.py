@@ -0,0 +1,467 @@
+# -*- coding: utf-8 -*-
+"""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+
+Copyright ANDRÉS PÉREZ LÓPEZ, January 2014
+contact@andresperezlopez.com
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+            SPATDIF SEGMENTED RENDER
+
+Render long SpatDIF sessions as independent time segments, then stitch them
+
+- planSegments() splits the session into segments aligned to the audio blocks, with a
+  small overlap, and writes a plan.json in a working directory; for each segment, the plan holds
+  its frame range, the byte offset of its first log block and the scene state at
+  that point, so that workers seek straight to their part of the log
+
+- renderSegment() renders one segment (in a separate process, or on any node
+  sharing the working directory) into <workdir>/segment_NNNN.wav
+
+- stitch() joins the segments, with sample-accurate raised-cosine crossfades
+  over the overlapping frames
+
+- renderIncremental() keeps the rendered segments in a size-bounded cache, named after
+  the hash of their commands, initial state and source audio, so that after an edit
+  only the segments which changed are encoded again
+
+command line usage, e.g. for a render farm with a shared filesystem:
+    python distributedRender.py plan TimeFileLog.txt workdir bass=sounds/bass.wav drums=...
+    python distributedRender.py render workdir/plan.json 3
+    python distributedRender.py stitch workdir/plan.json out.wav
+or, on a single machine, to bounce a log again after editing it:
+    python distributedRender.py bounce TimeFileLog.txt out.wav bass=sounds/bass.wav drums=...
+
+"""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+import hashlib
+import json
+import os
+import sys
+import time as _time
+import numpy as np
+import plotSphericalHarmonics as psh
+import spatDif
+import offlineRender as render
+
+
+def planSegments(logpath,sources,workdir,segmentDuration=60.,overlap=0.05,order=3,blockSize=512,duration=None):
+    """
+    split a session into segments and write the plan into <workdir>/plan.json
+
+    this is the only step reading the whole log (once, streaming)
+
+    Parameters:
+        logpath: path to the SpatDIF log
+        sources: dictionary {source name: path to mono WAV file}
+        workdir: directory for the plan and the rendered segments
+        segmentDuration: segment length in seconds, rounded to whole audio blocks (default:60)
+        overlap: minimum crossfade length in seconds, rounded up to whole audio blocks (default:0.05)
+        order: ambisonics order (default:3)
+        blockSize: frames per processing block (default:512)
+        duration: seconds to render (default: the longest of the log and the sources)
+
+    Returns the plan dictionary
+    """
+    names=list(sources.keys())
+    lengths=[]
+    for name in names:
+        with render.WavReader(sources[name]) as r:
+            sampleRate=r.sampleRate
+            lengths.append(r.numFrames/float(r.sampleRate))
+
+    log=spatDif.SpatDifReader(logpath)
+    times=log.times
+    offsets=log.offsets
+    if duration is None:
+        duration=max([log.duration]+lengths)
+    numFrames=int(round(duration*sampleRate))
+    # segment starts and overlaps lie on the audio block grid, so that every segment
+    # computes the same gains as a single pass render
+    overlapFrames=blockSize*max(1,int(np.ceil(overlap*sampleRate/blockSize)))
+    segmentFrames=blockSize*max(1,int(round(segmentDuration*sampleRate/blockSize)))
+    starts=[0]
+    for startFrame in range(segmentFrames,numFrames-2*overlapFrames,segmentFrames):
+        if startFrame>starts[-1]+2*overlapFrames:
+            starts.append(startFrame)
+
+    # first log block of each segment: the first one after its start
+    # (earlier blocks are already applied when the first audio block ends)
+    boundaries=[int(np.searchsorted(times,startFrame/float(sampleRate),side='right')) for startFrame in starts[1:]]
+
+    # scene state at each boundary, in a single pass
+    state=render.SceneState(names)
+    snapshots=[]
+    k=0
+    for time,commands in log.blocks():
+        if time is not None:
+            while len(snapshots)<len(boundaries) and k==boundaries[len(snapshots)]:
+                snapshots.append(state.snapshot())
+            k+=1
+        state.apply(commands)
+    while len(snapshots)<len(boundaries):
+        snapshots.append(state.snapshot())
+
+    fileSize=os.path.getsize(logpath)
+    segments=[]
+    for i,startFrame in enumerate(starts):
+        endFrame=numFrames if i==len(starts)-1 else starts[i+1]+overlapFrames
+        # log blocks read by the segment, up to its end
+        e=int(np.searchsorted(times,endFrame/float(sampleRate),side='right'))
+        segments.append({'index':i,
+                         'startFrame':startFrame,
+                         'endFrame':endFrame,
+                         'byteStart':0 if i==0 else (int(offsets[boundaries[i-1]]) if boundaries[i-1]<len(offsets) else fileSize),
+                         'byteEnd':int(offsets[e]) if e<len(offsets) else fileSize,
+                         'state':None if i==0 else snapshots[i-1],
+                         'path':os.path.join(workdir,'segment_%04d.wav'%i)})
+
+    plan={'logpath':os.path.abspath(logpath),
+          'sources':dict((name,os.path.abspath(path)) for name,path in sources.items()),
+          'order':order,
+          'blockSize':blockSize,
+          'sampleRate':sampleRate,
+          'numFrames':numFrames,
+          'segments':segments}
+
+    if not os.path.isdir(workdir):
+        os.makedirs(workdir)
+    with open(os.path.join(workdir,'plan.json'),'w') as f:
+        json.dump(plan,f,indent=1)
+    return plan
+
+def loadPlan(planpath):
+    with open(planpath,'r') as f:
+        return json.load(f)
+
+def renderSegment(plan,index):
+    """
+    render one segment of a plan (a dictionary or the path to plan.json)
+
+    the log is read from the segment byte offset only, and the output is written to a
+    temporary file which is renamed when complete
+    """
+    if not isinstance(plan,dict):
+        plan=loadPlan(plan)
+    segment=plan['segments'][index]
+    sampleRate=plan['sampleRate']
+    names=list(plan['sources'].keys())
+
+    state=render.SceneState(names)
+    gains0=None
+    if segment['state'] is not None:
+        state.restore(segment['state'])
+        gains0=state.coefficients(plan['order'])
+    blocks=spatDif.SpatDifReader(plan['logpath'],cache=False).blocks(offset=segment['byteStart'],
+                                                                     end=segment['endFrame']/float(sampleRate))
+    gains=render.blockGains(blocks,state,plan['order'],plan['blockSize'],sampleRate,
+                            segment['startFrame'],segment['endFrame'])
+
+    readers=[render.WavReader(plan['sources'][name]) for name in names]
+    for r in readers:
+        r.seek(segment['startFrame'])
+
+    tmp=segment['path']+'.tmp'
+    with render.WavWriter(tmp,psh.numChannels(plan['order']),sampleRate) as writer:
+        render.renderFrames(readers,gains,writer,plan['order'],plan['blockSize'],
+                            segment['endFrame']-segment['startFrame'],gains0)
+    for r in readers:
+        r.close()
+    os.replace(tmp,segment['path'])
+    return segment['path']
+
+def _copy(reader,writer,frames,blockSize=65536):
+    while frames>0:
+        data=reader.read(min(blockSize,frames))
+        if data.shape[0]==0:
+            raise ValueError('%s is shorter than expected' % reader.filepath)
+        writer.write(data)
+        frames-=data.shape[0]
+
+def stitch(plan,outpath):
+    """
+    join the rendered segments of a plan into outpath, crossfading the overlapping frames
+    """
+    if not isinstance(plan,dict):
+        plan=loadPlan(plan)
+    segments=plan['segments']
+
+    tail=None
+    with render.WavWriter(outpath,psh.numChannels(plan['order']),plan['sampleRate']) as writer:
+        for i,segment in enumerate(segments):
+            with render.WavReader(segment['path']) as reader:
+                frame=segment['startFrame']
+                if tail is not None:
+                    # crossfade with the end of the previous segment
+                    head=reader.read(tail.shape[0])
+                    fade=0.5-0.5*np.cos(np.pi*(np.arange(tail.shape[0])+0.5)/tail.shape[0])
+                    writer.write(tail*(1.-fade)[:,None]+head*fade[:,None])
+                    frame+=tail.shape[0]
+                if i<len(segments)-1:
+                    nextStart=segments[i+1]['startFrame']
+                    _copy(reader,writer,nextStart-frame)
+                    tail=reader.read(segment['endFrame']-nextStart)
+                else:
+                    _copy(reader,writer,segment['endFrame']-frame)
+    return outpath
+
+def _renderSegments(planpath,indices,processes):
+    indices=list(indices)
+    if processes==1 or len(indices)<2:
+        for i in indices:
+            renderSegment(planpath,i)
+        return
+    import multiprocessing
+    pool=multiprocessing.Pool(processes)
+    try:
+        pool.starmap(renderSegment,[(planpath,i) for i in indices])
+    finally:
+        pool.close()
+        pool.join()
+
+def renderDistributed(logpath,sources,outpath,segmentDuration=60.,overlap=0.05,order=3,blockSize=512,
+                      duration=None,processes=None,workdir=None,verbose=True):
+    """
+    render a SpatDIF log into a B-format file, segment by segment in a pool of processes
+
+    Parameters:
+        (as renderScene and planSegments)
+        processes: number of worker processes (default: number of cpus)
+        workdir: directory for the plan and segments (default: <outpath>.segments)
+
+    Returns a dictionary with the rendered duration, elapsed time and real-time factor
+    """
+    start=_time.time()
+    if workdir is None:
+        workdir=outpath+'.segments'
+    plan=planSegments(logpath,sources,workdir,segmentDuration,overlap,order,blockSize,duration)
+    planpath=os.path.join(workdir,'plan.json')
+
+    _renderSegments(planpath,range(len(plan['segments'])),processes)
+    stitch(plan,outpath)
+
+    elapsed=_time.time()-start
+    duration=plan['numFrames']/float(plan['sampleRate'])
+    stats={'duration':duration,'elapsed':elapsed,'realTimeFactor':duration/elapsed if elapsed>0 else np.inf,
+           'segments':len(plan['segments'])}
+    if verbose:
+        print('rendered %.2f s in %d segments, %.2f s (%.1fx real time)' % (duration,stats['segments'],elapsed,stats['realTimeFactor']))
+    return stats
+
+
+"""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+incremental rendering: segments are cached by the hash of everything they depend on
+"""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+
+def segmentHash(plan,index,chunkFrames=65536):
+    """
+    content hash of a plan segment: render settings, frame range, initial scene state,
+    log commands and source audio in the segment range
+
+    an edit in the log only changes the hash of the segments it falls in
+    (and of the following ones, if it changes the scene state at their start)
+    """
+    segment=plan['segments'][index]
+    h=hashlib.sha1()
+    h.update(json.dumps([plan['order'],plan['blockSize'],plan['sampleRate'],
+                         segment['startFrame'],segment['endFrame'],segment['state']]).encode('utf-8'))
+    with open(plan['logpath'],'rb') as f:
+        f.seek(segment['byteStart'])
+        remaining=segment['byteEnd']-segment['byteStart']
+        while remaining>0:
+            data=f.read(min(remaining,1<<20))
+            if not data:
+                break
+            h.update(data)
+            remaining-=len(data)
+    for name in sorted(plan['sources'].keys()):
+        h.update(name.encode('utf-8'))
+        with render.WavReader(plan['sources'][name]) as reader:
+            reader.seek(min(segment['startFrame'],reader.numFrames))
+            remaining=segment['endFrame']-segment['startFrame']
+            while remaining>0:
+                data=reader.read(min(remaining,chunkFrames))
+                if data.shape[0]==0:
+                    break
+                h.update(np.ascontiguousarray(data,dtype=np.float64).tobytes())
+                remaining-=data.shape[0]
+    return h.hexdigest()
+
+
+class SegmentCache(object):
+    """
+    directory of rendered segments named <hash>.wav, bounded in size:
+    the least recently used segments are removed first
+
+    Parameters:
+        directory: cache directory, created if needed
+        maxBytes: maximum total size of the cached segments (default: 4 GB)
+    """
+    def __init__(self,directory,maxBytes=4<<30):
+        self.directory=directory
+        self.maxBytes=maxBytes
+        self.hits=0
+        self.misses=0
+        self.evictions=0
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def path(self,key):
+        return os.path.join(self.directory,key+'.wav')
+
+    def get(self,key):
+        """
+        path of the cached segment, or None; a hit refreshes its modification time
+        """
+        path=self.path(key)
+        if os.path.exists(path):
+            os.utime(path,None)
+            self.hits+=1
+            return path
+        self.misses+=1
+        return None
+
+    def entries(self):
+        """
+        list of (mtime, size, path) of the cached segments, oldest first
+        """
+        entries=[]
+        for name in os.listdir(self.directory):
+            if name.endswith('.wav'):
+                st=os.stat(os.path.join(self.directory,name))
+                entries.append((st.st_mtime,st.st_size,os.path.join(self.directory,name)))
+        return sorted(entries)
+
+    def evict(self,keep=()):
+        """
+        remove the oldest segments until the cache fits in maxBytes, except those in keep
+        """
+        keep=set(self.path(key) for key in keep)
+        entries=self.entries()
+        total=sum(size for mtime,size,path in entries)
+        for mtime,size,path in entries:
+            if total<=self.maxBytes:
+                break
+            if path in keep:
+                continue
+            os.remove(path)
+            total-=size
+            self.evictions+=1
+        return total
+
+    def info(self):
+        """
+        return a dictionary with the cache counters and its current size
+        """
+        entries=self.entries()
+        return {'hits':self.hits,'misses':self.misses,'evictions':self.evictions,'segments':len(entries),
+                'bytes':sum(size for mtime,size,path in entries),'maxBytes':self.maxBytes}
+
+
+def renderIncremental(logpath,sources,outpath,cacheDir=None,maxBytes=4<<30,segmentDuration=10.,overlap=0.05,
+                      order=3,blockSize=512,duration=None,processes=1,verbose=True):
+    """
+    render a SpatDIF log into a B-format file, re-encoding only the segments
+    whose content changed since the previous renders
+
+    Parameters:
+        (as renderDistributed)
+        cacheDir: directory for the plan and cached segments (default: <outpath>.cache)
+        maxBytes: maximum size of the cached segments (default: 4 GB)
+
+    Returns a dictionary with the rendered duration, elapsed time, real-time factor
+    and the number of segments rendered and reused
+    """
+    start=_time.time()
+    if cacheDir is None:
+        cacheDir=outpath+'.cache'
+    cache=SegmentCache(cacheDir,maxBytes)
+    plan=planSegments(logpath,sources,cacheDir,segmentDuration,overlap,order,blockSize,duration)
+
+    keys=[]
+    missing=[]
+    for i,segment in enumerate(plan['segments']):
+        key=segmentHash(plan,i)
+        keys.append(key)
+        segment['path']=cache.path(key)
+        if cache.get(key) is None:
+            missing.append(i)
+
+    planpath=os.path.join(cacheDir,'plan.json')
+    with open(planpath,'w') as f:
+        json.dump(plan,f,indent=1)
+    _renderSegments(planpath,missing,processes)
+    stitch(plan,outpath)
+    cache.evict(keep=keys)
+
+    elapsed=_time.time()-start
+    duration=plan['numFrames']/float(plan['sampleRate'])
+    stats={'duration':duration,'elapsed':elapsed,'realTimeFactor':duration/elapsed if elapsed>0 else np.inf,
+           'segments':len(keys),'rendered':len(missing),'reused':len(keys)-len(missing)}
+    if verbose:
+        print('rendered %.2f s, %d of %d segments re-encoded, %.2f s (%.1fx real time)'
+              % (duration,len(missing),len(keys),elapsed,stats['realTimeFactor']))
+    return stats
+
+
+if __name__=='__main__':
+    import argparse
+    parser=argparse.ArgumentParser(description='segmented offline rendering of SpatDIF logs')
+    commands=parser.add_subparsers(dest='command')
+
+    p=commands.add_parser('plan',help='split a log into segments')
+    p.add_argument('logpath')
+    p.add_argument('workdir')
+    p.add_argument('sources',nargs='+',help='name=path.wav')
+    p.add_argument('--segment',type=float,default=60.,help='segment duration in seconds')
+    p.add_argument('--overlap',type=float,default=0.05,help='crossfade duration in seconds')
+    p.add_argument('--order',type=int,default=3)
+    p.add_argument('--block',type=int,default=512)
+
+    p=commands.add_parser('bounce',help='render a log, reusing the cached segments which did not change')
+    p.add_argument('logpath')
+    p.add_argument('outpath')
+    p.add_argument('sources',nargs='+',help='name=path.wav')
+    p.add_argument('--cache',default=None,help='cache directory')
+    p.add_argument('--max-size',type=float,default=4.,help='cache size in GB')
+    p.add_argument('--segment',type=float,default=10.,help='segment duration in seconds')
+    p.add_argument('--order',type=int,default=3)
+    p.add_argument('--processes',type=int,default=1)
+
+    p=commands.add_parser('render',help='render one segment of a plan')
+    p.add_argument('plan')
+    p.add_argument('index',type=int,nargs='+')
+
+    p=commands.add_parser('stitch',help='join the rendered segments')
+    p.add_argument('plan')
+    p.add_argument('outpath')
+
+    args=parser.parse_args()
+    if args.command=='plan':
+        sources=dict(s.split('=',1) for s in args.sources)
+        plan=planSegments(args.logpath,sources,args.workdir,args.segment,args.overlap,args.order,args.block)
+        print('%d segments' % len(plan['segments']))
+    elif args.command=='bounce':
+        sources=dict(s.split('=',1) for s in args.sources)
+        renderIncremental(args.logpath,sources,args.outpath,args.cache,int(args.max_size*(1<<30)),
+                          args.segment,order=args.order,processes=args.processes)
+    elif args.command=='render':
+        for index in args.index:
+            print(renderSegment(args.plan,index))
+    elif args.command=='stitch':
+        print(stitch(args.plan,args.outpath))
+    else:
+        parser.print_help()
+        sys.exit(1)
@@ -0,0 +1,502 @@
+# -*- coding: utf-8 -*-
+"""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+
+Copyright ANDRÉS PÉREZ LÓPEZ, January 2014
+contact@andresperezlopez.com
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+            SPATDIF OFFLINE RENDER
+
+Render a logged SpatDIF session into an Ambisonics B-format file, without scsynth
+
+- source signals are mono files, one per source name in the log
+  (e.g. sounds/bass.wav for /spatdif/source/bass/...)
+- source positions follow the /spatdif/source/name/position azi ele r aed messages,
+  with azimuth and elevation in degrees, as in SpatialRender.setPosition
+- encoding with the same math as AmbEnc1/2/3: ACN order, N3D normalization
+  (computed with plotSphericalHarmonics.encode)
+- audio is processed in fixed-size blocks, reading the log, the sources and writing
+  the output in a streaming way, so memory use does not depend on the session length;
+  coefficients are linearly interpolated along each block to avoid zipper noise
+
+- output files are written as 32 bit float WAV (WAVE_FORMAT_EXTENSIBLE),
+  since N3D channels can exceed the [-1,1] range
+
+"""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+import os
+import re
+import struct
+import time as _time
+import numpy as np
+import plotSphericalHarmonics as psh
+import spatDif
+
+
+""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+streaming WAV input/output
+"""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+
+WAVE_FORMAT_PCM=1
+WAVE_FORMAT_IEEE_FLOAT=3
+WAVE_FORMAT_EXTENSIBLE=0xFFFE
+# KSDATAFORMAT_SUBTYPE_xxx GUID, after the format tag
+GUID_TAIL=b'\x00\x00\x00\x00\x10\x00\x80\x00\x00\xaa\x00\x38\x9b\x71'
+
+class WavReader(object):
+    """
+    block reader for PCM (8, 16, 24, 32 bits) and float (32, 64 bits) WAV files
+
+    read() returns float64 arrays of shape (frames, channels), with PCM values scaled to [-1,1)
+    """
+    def __init__(self,filepath):
+        self.filepath=filepath
+        self._file=open(filepath,'rb')
+        riff,size,wave=struct.unpack('<4sI4s',self._file.read(12))
+        if riff!=b'RIFF' or wave!=b'WAVE':
+            raise ValueError('%s is not a WAV file' % filepath)
+        fmt=None
+        while True:
+            header=self._file.read(8)
+            if len(header)<8:
+                raise ValueError('%s has no data chunk' % filepath)
+            chunk,size=struct.unpack('<4sI',header)
+            if chunk==b'fmt ':
+                fmt=self._file.read(size+size%2)
+            elif chunk==b'data':
+                self._dataStart=self._file.tell()
+                self._dataSize=size
+                break
+            else:
+                self._file.seek(size+size%2,1)
+        tag,self.numChannels,self.sampleRate,_,self._blockAlign,bits=struct.unpack('<HHIIHH',fmt[:16])
+        if tag==WAVE_FORMAT_EXTENSIBLE:
+            tag,=struct.unpack('<H',fmt[24:26])
+        self._bytes=bits//8
+        if tag==WAVE_FORMAT_IEEE_FLOAT:
+            self._dtype=np.dtype('<f%d'%self._bytes)
+        elif tag==WAVE_FORMAT_PCM and self._bytes in (1,2,3,4):
+            self._dtype=None
+        else:
+            raise ValueError('%s: unsupported WAV format %d (%d bits)' % (filepath,tag,bits))
+        # some writers leave the data size unset while recording
+        if self._dataSize in (0,0xFFFFFFFF):
+            self._dataSize=os.path.getsize(filepath)-self._dataStart
+        self.numFrames=self._dataSize//self._blockAlign
+        self.position=0
+
+    def seek(self,frame):
+        frame=min(max(int(frame),0),self.numFrames)
+        self._file.seek(self._dataStart+frame*self._blockAlign)
+        self.position=frame
+
+    def read(self,frames):
+        """
+        read up to the given number of frames; fewer are returned at the end of the file
+        """
+        frames=max(min(frames,self.numFrames-self.position),0)
+        raw=self._file.read(frames*self._blockAlign)
+        frames=len(raw)//self._blockAlign
+        self.position+=frames
+        if self._dtype is not None:
+            data=np.frombuffer(raw,dtype=self._dtype,count=frames*self.numChannels).astype(np.float64)
+        elif self._bytes==1:
+            data=(np.frombuffer(raw,dtype=np.uint8).astype(np.float64)-128.)/128.
+        elif self._bytes==3:
+            b=np.frombuffer(raw,dtype=np.uint8).reshape(-1,3).astype(np.int32)
+            data=((b[:,0]|(b[:,1]<<8)|(b[:,2]<<16))<<8>>8)/8388608.
+        else:
+            data=np.frombuffer(raw,dtype='<i%d'%self._bytes)/float(2**(8*self._bytes-1))
+        return data.reshape(frames,self.numChannels)
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*args):
+        self.close()
+
+
+class WavWriter(object):
+    """
+    block writer for 32 bit float (default) or 16 bit PCM multichannel WAV files;
+    chunk sizes are patched when the file is closed
+
+    Parameters:
+        filepath: path to the new file
+        numChannels: number of channels
+        sampleRate: sample rate in Hz
+        sampleFormat: 'float32' or 'int16' (default:'float32')
+    """
+    def __init__(self,filepath,numChannels,sampleRate,sampleFormat='float32'):
+        self.filepath=filepath
+        self.numChannels=numChannels
+        self.sampleRate=sampleRate
+        self.sampleFormat=sampleFormat
+        if sampleFormat=='float32':
+            tag,bits,self._dtype=WAVE_FORMAT_IEEE_FLOAT,32,np.dtype('<f4')
+        elif sampleFormat=='int16':
+            tag,bits,self._dtype=WAVE_FORMAT_PCM,16,np.dtype('<i2')
+        else:
+            raise ValueError('unsupported sample format: %s' % sampleFormat)
+        self._blockAlign=numChannels*bits//8
+        self.numFrames=0
+        self.peak=0.
+
+        fmt=struct.pack('<HHIIHHHHI',WAVE_FORMAT_EXTENSIBLE,numChannels,sampleRate,
+                        sampleRate*self._blockAlign,self._blockAlign,bits,22,bits,0)
+        fmt+=struct.pack('<H',tag)+GUID_TAIL
+        self._file=open(filepath,'wb')
+        self._file.write(b'RIFF\x00\x00\x00\x00WAVE')
+        self._file.write(b'fmt '+struct.pack('<I',len(fmt))+fmt)
+        self._file.write(b'fact\x04\x00\x00\x00\x00\x00\x00\x00')
+        self._factPosition=self._file.tell()-4
+        self._file.write(b'data\x00\x00\x00\x00')
+        self._dataPosition=self._file.tell()-4
+
+    def write(self,block):
+        """
+        append a (frames, channels) block of float values
+        """
+        block=np.asarray(block)
+        if block.size:
+            self.peak=max(self.peak,float(np.abs(block).max()))
+        if self._dtype.kind=='i':
+            block=np.clip(np.rint(block*32768.),-32768,32767)
+        self._file.write(block.astype(self._dtype).tobytes())
+        self.numFrames+=block.shape[0]
+
+    def close(self):
+        if self._file.closed:
+            return
+        dataSize=self.numFrames*self._blockAlign
+        if dataSize%2:
+            self._file.write(b'\x00')
+        end=self._file.tell()
+        self._file.seek(4)
+        self._file.write(struct.pack('<I',end-8))
+        self._file.seek(self._factPosition)
+        self._file.write(struct.pack('<I',self.numFrames))
+        self._file.seek(self._dataPosition)
+        self._file.write(struct.pack('<I',dataSize))
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*args):
+        self.close()
+
+
+""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+scene state
+"""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+
+# /spatdif/source/<name>/<property>
+sourceAddress=re.compile(r'^/spatdif/source/([^/]+)/(.+)$')
+
+class SceneState(object):
+    """
+    current parameters of every source, updated with the log commands
+
+    Parameters:
+        names: list of source names; commands for other sources are ignored
+    """
+    def __init__(self,names):
+        self.names=list(names)
+        self._indices=dict((name,i) for i,name in enumerate(self.names))
+        # same defaults as SpatialRender: sources in front, present
+        self.azimuth=np.zeros(len(self.names))
+        self.elevation=np.zeros(len(self.names))
+        self.distance=np.ones(len(self.names))
+        self.present=np.ones(len(self.names))
+
+    def apply(self,commands):
+        """
+        update the state with a list of [address, args...] commands
+        """
+        for command in commands:
+            match=sourceAddress.match(command[0])
+            if match is None or match.group(1) not in self._indices:
+                continue
+            i=self._indices[match.group(1)]
+            prop=match.group(2)
+            if prop=='position' and len(command)>=4:
+                self.azimuth[i],self.elevation[i],self.distance[i]=command[1:4]
+            elif prop=='present' and len(command)>=2:
+                self.present[i]=0. if str(command[1]).lower() in ('false','0','0.0') else 1.
+
+    def snapshot(self):
+        """
+        dictionary {name: [azimuth, elevation, distance, present]} with the current state
+        """
+        return dict((name,[float(self.azimuth[i]),float(self.elevation[i]),float(self.distance[i]),float(self.present[i])])
+                    for i,name in enumerate(self.names))
+
+    def restore(self,snapshot):
+        """
+        set the state from a dictionary returned by snapshot()
+        """
+        for name,values in snapshot.items():
+            if name in self._indices:
+                i=self._indices[name]
+                self.azimuth[i],self.elevation[i],self.distance[i],self.present[i]=values
+
+    def coefficients(self,order):
+        """
+        (sources, channels) matrix of encoding gains for the current state
+        """
+        Y=psh.encode(np.radians(self.elevation),np.radians(self.azimuth),order)
+        Y*=self.present[:,None]
+        return Y
+
+
+""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+rendering
+"""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+
+def encodeBlock(signals,gains0,gains1,out=None):
+    """
+    encode and mix a block of source signals, ramping the gains linearly along the block
+
+    Parameters:
+        signals: (sources, frames) source samples
+        gains0: (sources, channels) gains at the beginning of the block
+        gains1: (sources, channels) gains at the end of the block
+        out: optional (frames, channels) output array
+
+    Returns the (frames, channels) B-format block
+    """
+    frames=signals.shape[1]
+    ramp=np.arange(frames)/float(frames)
+    out=np.dot(signals.T,gains0,out=out)
+    out+=np.dot((signals*ramp).T,gains1-gains0)
+    return out
+
+def sourceFiles(names,soundsDir):
+    """
+    map each source name to <soundsDir>/<name>.wav, for those files which exist
+    """
+    files={}
+    for name in names:
+        path=os.path.join(soundsDir,name+'.wav')
+        if os.path.exists(path):
+            files[name]=path
+    return files
+
+def blockGains(blocks,state,order,blockSize,sampleRate,startFrame,endFrame):
+    """
+    generator of the (sources, channels) gains at the end of each audio block,
+    streaming the log along the blocks
+
+    Parameters:
+        blocks: iterator of (time, commands), as SpatDifReader.blocks()
+        state: SceneState, updated along the log
+        startFrame, endFrame: range of frames to render
+    """
+    pending=next(blocks,None)
+    for frame in range(startFrame,endFrame,blockSize):
+        # apply every log block up to the end of this audio block
+        blockEnd=min(frame+blockSize,endFrame)/float(sampleRate)
+        while pending is not None and (pending[0] is None or pending[0]<=blockEnd):
+            state.apply(pending[1])
+            pending=next(blocks,None)
+        yield state.coefficients(order)
+
+def readSignals(readers,frames,out):
+    """
+    read the next frames of each mono reader into the rows of out, zero-padded at the end of file
+    """
+    for i,r in enumerate(readers):
+        data=r.read(frames)
+        out[i,:data.shape[0]]=data[:,0]
+        out[i,data.shape[0]:frames]=0.
+
+def renderFrames(readers,gains,writer,order,blockSize,numFrames,gains0=None):
+    """
+    encode the next numFrames of the source readers with the given gains generator,
+    and write them to writer
+
+    gains0 are the gains the first block ramps from (default: no ramp on the first block)
+    """
+    signals=np.zeros((len(readers),blockSize))
+    out=np.empty((blockSize,psh.numChannels(order)))
+    for frame in range(0,numFrames,blockSize):
+        frames=min(blockSize,numFrames-frame)
+        gains1=next(gains)
+        if gains0 is None:
+            gains0=gains1
+        readSignals(readers,frames,signals)
+        encodeBlock(signals[:,:frames],gains0,gains1,out=out[:frames])
+        writer.write(out[:frames])
+        gains0=gains1
+
+def renderScene(logpath,sources,outpath,order=3,blockSize=512,duration=None,processes=1,verbose=True):
+    """
+    render a SpatDIF log into a B-format file
+
+    Parameters:
+        logpath: path to the SpatDIF log
+        sources: dictionary {source name: path to mono WAV file}
+        outpath: path to the output WAV file, with (order+1)^2 channels
+        order: ambisonics order, 1, 2 or 3 for the AmbEnc1/2/3 equivalent (default:3)
+        blockSize: frames per processing block (default:512)
+        duration: seconds to render (default: the longest of the log and the sources)
+        processes: number of worker processes encoding groups of sources (default:1, no workers)
+        verbose: print the real-time factor (default:True)
+
+    Returns a dictionary with the rendered duration, elapsed time, real-time factor
+    (rendered seconds per second of computation) and output peak
+    """
+    start=_time.time()
+
+    names=list(sources.keys())
+    if not names:
+        raise ValueError('no sources to render: sources should map source names to sound files')
+    readers=[WavReader(sources[name]) for name in names]
+    sampleRate=readers[0].sampleRate
+    for r in readers:
+        if r.sampleRate!=sampleRate:
+            raise ValueError('%s: sample rate %d differs from %d' % (r.filepath,r.sampleRate,sampleRate))
+        if r.numChannels!=1:
+            raise ValueError('%s: sources should be mono, the file has %d channels' % (r.filepath,r.numChannels))
+    if duration is None:
+        duration=max([spatDif.SpatDifReader(logpath).duration]+[r.numFrames/float(sampleRate) for r in readers])
+    numFrames=int(round(duration*sampleRate))
+    gains=blockGains(spatDif.SpatDifReader(logpath).blocks(),SceneState(names),order,blockSize,sampleRate,0,numFrames)
+
+    with WavWriter(outpath,psh.numChannels(order),sampleRate) as writer:
+        if processes>1 and len(names)>1:
+            for r in readers:
+                r.close()
+            _renderParallel(sources,names,gains,writer,order,blockSize,numFrames,min(processes,len(names)))
+        else:
+            renderFrames(readers,gains,writer,order,blockSize,numFrames)
+            for r in readers:
+                r.close()
+        peak=writer.peak
+
+    elapsed=_time.time()-start
+    stats={'duration':duration,'elapsed':elapsed,'realTimeFactor':duration/elapsed if elapsed>0 else np.inf,'peak':peak}
+    if verbose:
+        print('rendered %.2f s in %.2f s (%.1fx real time)' % (duration,elapsed,stats['realTimeFactor']))
+    return stats
+
+
+""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+multi-process rendering
+
+the main process streams the log and writes, for each chunk of blocks, the gains of every
+source into a shared-memory array; each worker reads its own group of source files,
+encodes them and writes its partial mix into its own slot of a shared-memory accumulator,
+which the main process sums into the output: only chunk sizes go through the queues
+"""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+
+# blocks per chunk sent to the workers
+CHUNK_BLOCKS=64
+
+def _encodeWorker(files,indices,slot,order,blockSize,gainsName,gainsShape,accName,accShape,tasks,done):
+    from multiprocessing import shared_memory
+    gainsMemory=shared_memory.SharedMemory(name=gainsName)
+    accMemory=shared_memory.SharedMemory(name=accName)
+    try:
+        gains=np.ndarray(gainsShape,dtype=np.float64,buffer=gainsMemory.buf)
+        out=np.ndarray(accShape,dtype=np.float64,buffer=accMemory.buf)[slot]
+        readers=[WavReader(f) for f in files]
+        signals=np.zeros((len(readers),out.shape[0]))
+        while True:
+            frames=tasks.get()
+            if frames is None:
+                break
+            readSignals(readers,frames,signals)
+            for b,frame in enumerate(range(0,frames,blockSize)):
+                end=min(frame+blockSize,frames)
+                encodeBlock(signals[:,frame:end],gains[b,indices],gains[b+1,indices],out=out[frame:end])
+            done.put(slot)
+        for r in readers:
+            r.close()
+    finally:
+        del gains,out
+        gainsMemory.close()
+        accMemory.close()
+
+def _waitWorker(done,workers):
+    import queue
+    while True:
+        try:
+            return done.get(timeout=1.)
+        except queue.Empty:
+            for p,tasks in workers:
+                if not p.is_alive():
+                    raise RuntimeError('render worker %d exited with code %s' % (p.pid,p.exitcode))
+
+def _renderParallel(sources,names,gains,writer,order,blockSize,numFrames,processes):
+    import multiprocessing
+    from multiprocessing import shared_memory
+
+    numChannels=psh.numChannels(order)
+    chunkFrames=CHUNK_BLOCKS*blockSize
+    gainsShape=(CHUNK_BLOCKS+1,len(names),numChannels)
+    accShape=(processes,chunkFrames,numChannels)
+    gainsMemory=shared_memory.SharedMemory(create=True,size=int(np.prod(gainsShape))*8)
+    accMemory=shared_memory.SharedMemory(create=True,size=int(np.prod(accShape))*8)
+    workers=[]
+    sharedGains=acc=None
+    try:
+        sharedGains=np.ndarray(gainsShape,dtype=np.float64,buffer=gainsMemory.buf)
+        acc=np.ndarray(accShape,dtype=np.float64,buffer=accMemory.buf)
+        out=np.empty((chunkFrames,numChannels))
+
+        # groups of sources, round robin
+        done=multiprocessing.Queue()
+        for slot in range(processes):
+            indices=list(range(slot,len(names),processes))
+            tasks=multiprocessing.Queue()
+            p=multiprocessing.Process(target=_encodeWorker,
+                                      args=([sources[names[i]] for i in indices],indices,slot,order,blockSize,
+                                            gainsMemory.name,gainsShape,accMemory.name,accShape,tasks,done))
+            p.daemon=True
+            p.start()
+            workers.append((p,tasks))
+
+        last=None
+        for frame in range(0,numFrames,chunkFrames):
+            frames=min(chunkFrames,numFrames-frame)
+            numBlocks=(frames+blockSize-1)//blockSize
+            for b in range(numBlocks):
+                sharedGains[b+1]=next(gains)
+            sharedGains[0]=sharedGains[1] if last is None else last
+
+            for p,tasks in workers:
+                tasks.put(frames)
+            for p,tasks in workers:
+                _waitWorker(done,workers)
+
+            np.sum(acc[:,:frames],axis=0,out=out[:frames])
+            writer.write(out[:frames])
+            last=sharedGains[numBlocks].copy()
+    finally:
+        for p,tasks in workers:
+            tasks.put(None)
+        for p,tasks in workers:
+            p.join()
+        del sharedGains,acc
+        gainsMemory.close()
+        gainsMemory.unlink()
+        accMemory.close()
+        accMemory.unlink()
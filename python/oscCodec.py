@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+
+Copyright ANDRÉS PÉREZ LÓPEZ, January 2014
+contact@andresperezlopez.com
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+            OSC CODEC
+
+Minimal Open Sound Control 1.0 encoding and decoding, enough for the SpatDIF traffic
+between SpatialRender, SSWorld and the logs
+
+- messages are [address, arg1, arg2, ...] lists, as the commands of spatDif.py;
+  arguments are encoded as int32 (i), float32 (f) or string (s), and decoded from
+  i, h, f, d, s, S, T, F and N
+- bundles hold a list of messages (nested bundles are flattened when decoding),
+  with time tag 1 (immediately) by default, as NetAddr.sendBundle(0, ...)
+- the encoded address and type tags of each address/types pair are cached,
+  since SpatDIF streams repeat a few addresses at high rates
+
+"""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+import struct
+
+
+BUNDLE_TAG=b'#bundle\x00'
+IMMEDIATELY=1
+
+# (address, type tags) -> encoded prefix
+_prefixes={}
+PREFIX_CACHE_SIZE=65536
+
+def encodeString(value):
+    """
+    null terminated string, padded to a multiple of 4 bytes
+    """
+    if not isinstance(value,bytes):
+        value=value.encode('utf-8')
+    return value+b'\x00'*(4-len(value)%4)
+
+def _prefix(address,tags):
+    key=(address,tags)
+    prefix=_prefixes.get(key)
+    if prefix is None:
+        if len(_prefixes)>=PREFIX_CACHE_SIZE:
+            _prefixes.clear()
+        prefix=_prefixes[key]=encodeString(address)+encodeString(','+tags)
+    return prefix
+
+def encodeMessage(message):
+    """
+    bytes of an [address, arg1, arg2, ...] message
+    """
+    tags=[]
+    data=[]
+    for value in message[1:]:
+        if isinstance(value,bool) or value is None:
+            raise TypeError('unsupported OSC argument %r' % (value,))
+        if isinstance(value,int):
+            tags.append('i')
+            data.append(struct.pack('>i',value))
+        elif isinstance(value,float):
+            tags.append('f')
+            data.append(struct.pack('>f',value))
+        elif isinstance(value,(str,bytes)):
+            tags.append('s')
+            data.append(encodeString(value))
+        else:
+            raise TypeError('unsupported OSC argument %r' % (value,))
+    return _prefix(message[0],''.join(tags))+b''.join(data)
+
+def encodeBundle(messages,timeTag=IMMEDIATELY):
+    """
+    bytes of a bundle with the given messages (lists, or already encoded bytes)
+    """
+    data=[BUNDLE_TAG,struct.pack('>Q',timeTag)]
+    for message in messages:
+        if not isinstance(message,bytes):
+            message=encodeMessage(message)
+        data.append(struct.pack('>i',len(message)))
+        data.append(message)
+    return b''.join(data)
+
+def _readString(data,position):
+    end=data.index(b'\x00',position)
+    return data[position:end].decode('utf-8'),(end//4+1)*4
+
+def decodeMessage(data):
+    """
+    [address, arg1, arg2, ...] list of an encoded message
+    """
+    address,position=_readString(data,0)
+    if position>=len(data):
+        # messages without type tags, as sent by old implementations
+        return [address]
+    tags,position=_readString(data,position)
+    message=[address]
+    for tag in tags[1:]:
+        if tag=='i':
+            message.append(struct.unpack_from('>i',data,position)[0])
+            position+=4
+        elif tag=='f':
+            message.append(struct.unpack_from('>f',data,position)[0])
+            position+=4
+        elif tag=='s' or tag=='S':
+            value,position=_readString(data,position)
+            message.append(value)
+        elif tag=='d':
+            message.append(struct.unpack_from('>d',data,position)[0])
+            position+=8
+        elif tag=='h':
+            message.append(struct.unpack_from('>q',data,position)[0])
+            position+=8
+        elif tag=='T':
+            message.append(True)
+        elif tag=='F':
+            message.append(False)
+        elif tag=='N':
+            message.append(None)
+        else:
+            raise ValueError('unsupported OSC type tag %s' % tag)
+    return message
+
+def decode(data):
+    """
+    (time tag, messages) of an encoded packet; single messages get time tag None
+    """
+    if not data.startswith(BUNDLE_TAG):
+        return None,[decodeMessage(data)]
+    timeTag=struct.unpack_from('>Q',data,8)[0]
+    messages=[]
+    position=16
+    while position<len(data):
+        size=struct.unpack_from('>i',data,position)[0]
+        position+=4
+        messages.extend(decode(data[position:position+size])[1])
+        position+=size
+    return timeTag,messages
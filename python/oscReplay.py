@@ -0,0 +1,372 @@
+# -*- coding: utf-8 -*-
+"""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+
+Copyright ANDRÉS PÉREZ LÓPEZ, January 2014
+contact@andresperezlopez.com
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+            OSC REPLAY
+
+Load generator and latency benchmark for the OSC input of SpatialRender (or of any
+SpatDIF receiver): SpatDIF scenes are sent over UDP at 1x to 100x their speed,
+as SpatDifPlayer would send them
+
+- scenes: a SpatDIF log (logBlocks), or numSources sources moving in circles,
+  each sending positions at rate Hz (syntheticBlocks)
+
+- every block is sent when it is due with asyncio, as one bundle per message like
+  SpatDifPlayer (or, with bundle=True, as few bundles per block as fit in a datagram);
+  the lateness of every block against its schedule (send jitter) and the achieved
+  message rate are recorded in a ReplayStats
+
+- every probeInterval seconds a /3dj/probe message is sent as well: the bundled
+  stand-in receiver (EchoReceiver) decodes all the traffic, and answers each probe
+  with the number of messages received since the start of the replay, which gives
+  the round trip latency of the messages queued before it and the number of lost ones;
+  SpatialRender ignores the probes, so only the send statistics are available with it
+- the stand-in runs in its own process (echo command, or --local-echo), so that
+  it does not share the event loop with the sender
+
+command line usage:
+    python oscReplay.py echo --port 57121
+    python oscReplay.py replay TimeFileLog.txt --port 57121 --speed 1 10 100
+    python oscReplay.py synth --sources 1000 --rate 60 --duration 10 --speed 1 2 5 --local-echo
+several speeds give one report per speed, to find the rate at which the receiver falls behind
+
+"""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+import array
+import asyncio
+import numpy as np
+import oscCodec
+import spatDif
+
+
+DEFAULT_HOST='127.0.0.1'
+DEFAULT_PORT=57120 # sclang
+PROBE_ADDRESS='/3dj/probe'
+RESET_ADDRESS='/3dj/reset'
+# bundles are split to stay below this size
+MAX_DATAGRAM=8192
+
+def logBlocks(logpath,start=None,end=None):
+    """
+    (time, commands) blocks of a SpatDIF log, from start to end seconds
+    """
+    reader=spatDif.SpatDifReader(logpath)
+    for time,commands in reader.blocks(start,end):
+        yield (0. if time is None else time),commands
+
+def syntheticBlocks(numSources,rate,duration,radius=3.,prefix='s'):
+    """
+    (time, commands) blocks of numSources sources sending /position messages at rate Hz
+    for duration seconds, each one turning around the listener at its own speed;
+    the first block creates the sources, as SSWorld does
+    """
+    names=[prefix+str(i) for i in range(numSources)]
+    addresses=['/spatdif/source/'+name+'/position' for name in names]
+    commands=[]
+    for i,name in enumerate(names):
+        commands.append(['/spatdifcmd/addEntity',name])
+        commands.append(['/spatdif/source/'+name+'/media/type','jack'])
+        commands.append(['/spatdif/source/'+name+'/media/channel',i])
+    yield 0.,commands
+
+    speeds=np.linspace(10.,90.,numSources) # degrees per second
+    elevations=np.linspace(-30.,60.,numSources).tolist()
+    for n in range(int(round(duration*rate))):
+        time=n/float(rate)
+        azimuths=(np.mod(speeds*time+180.,360.)-180.).tolist()
+        yield time,[[address,a,e,radius,'aed'] for address,a,e in zip(addresses,azimuths,elevations)]
+
+
+class ReplayStats(object):
+    """
+    counters of a replay: messages, packets and bytes sent, lateness of every block,
+    and round trip latency of every answered probe
+    """
+    def __init__(self):
+        self.messages=0
+        self.packets=0
+        self.bytes=0
+        self.duration=0.
+        self.sceneDuration=0.
+        self.lateness=array.array('d')
+        self.latencies=array.array('d')
+        self.probes=0
+        self.lost=0
+
+    def summary(self):
+        """
+        dictionary with the totals, rates and lateness/latency percentiles (in seconds)
+        """
+        def percentiles(values):
+            if not len(values):
+                return None
+            values=np.frombuffer(values,dtype=np.float64)
+            return {'mean':values.mean(),'p50':np.percentile(values,50),'p99':np.percentile(values,99),
+                    'max':values.max()}
+        duration=max(self.duration,1e-9)
+        return {'messages':self.messages,'packets':self.packets,'bytes':self.bytes,'duration':self.duration,
+                'sceneDuration':self.sceneDuration,'messageRate':self.messages/duration,
+                'packetRate':self.packets/duration,'jitter':percentiles(self.lateness),
+                'probes':self.probes,'answered':len(self.latencies),'latency':percentiles(self.latencies),
+                'lost':self.lost}
+
+    def report(self):
+        s=self.summary()
+        lines=['%d messages in %d packets, %.3f s (scene: %.3f s): %.0f messages/s, %.0f packets/s'
+               % (s['messages'],s['packets'],s['duration'],s['sceneDuration'],s['messageRate'],s['packetRate'])]
+        if s['jitter']:
+            lines.append('send jitter: mean %(mean).6f  p50 %(p50).6f  p99 %(p99).6f  max %(max).6f s' % s['jitter'])
+        if s['latency']:
+            lines.append('round trip: mean %(mean).6f  p50 %(p50).6f  p99 %(p99).6f  max %(max).6f s' % s['latency'])
+            lines.append('probes: %d sent, %d answered; %d messages lost' % (s['probes'],s['answered'],s['lost']))
+        elif s['probes']:
+            lines.append('probes: %d sent, none answered' % s['probes'])
+        return '\n'.join(lines)
+
+
+class _Sender(asyncio.DatagramProtocol):
+    """
+    receives the probe answers: [PROBE_ADDRESS, number, messages received]
+    """
+    def __init__(self,stats):
+        self.stats=stats
+        self.probes={} # number -> (send time, messages sent before)
+        self.answered=asyncio.Event()
+
+    def datagram_received(self,data,addr):
+        try:
+            message=oscCodec.decode(data)[1][0]
+        except (ValueError,IndexError,UnicodeDecodeError):
+            return
+        if message[0]!=PROBE_ADDRESS or len(message)<3:
+            return
+        probe=self.probes.pop(message[1],None)
+        if probe is None:
+            return
+        sent,before=probe
+        self.stats.latencies.append(asyncio.get_running_loop().time()-sent)
+        self.stats.lost=max(self.stats.lost,before-message[2])
+        if not self.probes:
+            self.answered.set()
+
+def _packets(commands,bundle):
+    """
+    encoded packets of a block: a bundle per message, or bundles of as many messages as fit
+    """
+    if not bundle:
+        return [oscCodec.encodeBundle((command,)) for command in commands]
+    packets=[]
+    current=[]
+    size=16
+    for command in commands:
+        message=oscCodec.encodeMessage(command)
+        if current and size+4+len(message)>MAX_DATAGRAM:
+            packets.append(oscCodec.encodeBundle(current))
+            current=[]
+            size=16
+        current.append(message)
+        size+=4+len(message)
+    if current:
+        packets.append(oscCodec.encodeBundle(current))
+    return packets
+
+async def replay(blocks,host=DEFAULT_HOST,port=DEFAULT_PORT,speed=1.,bundle=False,probeInterval=0.1,
+                 probeTimeout=1.):
+    """
+    send the (time, commands) blocks to host:port at speed times their rate; returns a ReplayStats
+
+    Parameters:
+        blocks: iterable of (time, commands), e.g. logBlocks() or syntheticBlocks()
+        speed: time scale of the scene (default:1)
+        bundle: send each block in as few bundles as possible, instead of one bundle per message
+        probeInterval: seconds between latency probes, None to send no probes (default:0.1)
+        probeTimeout: seconds to wait for the last probe answers (default:1)
+    """
+    loop=asyncio.get_running_loop()
+    stats=ReplayStats()
+    transport,protocol=await loop.create_datagram_endpoint(lambda:_Sender(stats),remote_addr=(host,port))
+    try:
+        if probeInterval is not None:
+            transport.sendto(oscCodec.encodeMessage([RESET_ADDRESS]))
+        start=loop.time()
+        nextProbe=start
+        first=None
+        time=0.
+        for time,commands in blocks:
+            if first is None:
+                first=time
+            due=start+(time-first)/speed
+            now=loop.time()
+            if due>now:
+                await asyncio.sleep(due-now)
+                now=loop.time()
+            else:
+                # let the probe answers in, even when falling behind
+                await asyncio.sleep(0)
+            stats.lateness.append(now-due)
+            for packet in _packets(commands,bundle):
+                transport.sendto(packet)
+                stats.packets+=1
+                stats.bytes+=len(packet)
+            stats.messages+=len(commands)
+
+            if probeInterval is not None and now>=nextProbe:
+                protocol.answered.clear()
+                protocol.probes[stats.probes]=(loop.time(),stats.messages)
+                transport.sendto(oscCodec.encodeMessage([PROBE_ADDRESS,stats.probes]))
+                stats.probes+=1
+                nextProbe=now+probeInterval
+        stats.duration=loop.time()-start
+        stats.sceneDuration=0. if first is None else time-first
+
+        if protocol.probes:
+            try:
+                await asyncio.wait_for(protocol.answered.wait(),probeTimeout)
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        transport.close()
+    return stats
+
+
+class EchoReceiver(asyncio.DatagramProtocol):
+    """
+    stand-in for a SpatDIF receiver: decodes every packet, counts its messages,
+    and answers the probes with [PROBE_ADDRESS, number, messages received before];
+    RESET_ADDRESS sets the message counter back to 0
+
+    usage:
+        transport,receiver=await loop.create_datagram_endpoint(EchoReceiver,local_addr=('127.0.0.1',57121))
+    """
+    def __init__(self):
+        self.messages=0
+        self.packets=0
+        self.errors=0
+
+    def connection_made(self,transport):
+        self.transport=transport
+
+    def datagram_received(self,data,addr):
+        self.packets+=1
+        try:
+            messages=oscCodec.decode(data)[1]
+        except (ValueError,IndexError,UnicodeDecodeError):
+            self.errors+=1
+            return
+        for message in messages:
+            if message[0]==PROBE_ADDRESS:
+                self.transport.sendto(oscCodec.encodeMessage([PROBE_ADDRESS,message[1],self.messages]),addr)
+            elif message[0]==RESET_ADDRESS:
+                self.messages=0
+            else:
+                self.messages+=1
+
+async def serveEcho(host=DEFAULT_HOST,port=DEFAULT_PORT,duration=None,ready=None):
+    """
+    run an EchoReceiver for duration seconds (forever if None); returns it
+
+    ready: optional multiprocessing.Event, set once the socket is bound
+    """
+    loop=asyncio.get_running_loop()
+    transport,receiver=await loop.create_datagram_endpoint(EchoReceiver,local_addr=(host,port))
+    if ready is not None:
+        ready.set()
+    try:
+        if duration is None:
+            await asyncio.Event().wait()
+        await asyncio.sleep(duration)
+    finally:
+        transport.close()
+    return receiver
+
+def _echoProcess(host,port,ready):
+    asyncio.run(serveEcho(host,port,ready=ready))
+
+def startEcho(host=DEFAULT_HOST,port=DEFAULT_PORT,timeout=10.):
+    """
+    start the stand-in receiver in a new process; returns the process, to be terminated
+    """
+    import multiprocessing
+    ready=multiprocessing.Event()
+    process=multiprocessing.Process(target=_echoProcess,args=(host,port,ready),daemon=True)
+    process.start()
+    if not ready.wait(timeout):
+        process.terminate()
+        raise RuntimeError('the echo receiver could not start on %s:%d' % (host,port))
+    return process
+
+async def benchmark(makeBlocks,speeds,host=DEFAULT_HOST,port=DEFAULT_PORT,localEcho=False,**kwargs):
+    """
+    replay the scene given by makeBlocks() once per speed, printing a report for each one;
+    returns a list of (speed, ReplayStats)
+
+    with localEcho, the stand-in receiver is started on host:port in another process
+    """
+    process=startEcho(host,port) if localEcho else None
+    results=[]
+    try:
+        for speed in speeds:
+            stats=await replay(makeBlocks(),host,port,speed,**kwargs)
+            results.append((speed,stats))
+            print('speed %gx' % speed)
+            print(stats.report())
+    finally:
+        if process is not None:
+            process.terminate()
+            process.join()
+    return results
+
+
+if __name__=='__main__':
+    import argparse
+    parser=argparse.ArgumentParser(description='SpatDIF OSC load generator and latency benchmark')
+    commands=parser.add_subparsers(dest='command')
+
+    p=commands.add_parser('echo',help='run the stand-in receiver')
+    p.add_argument('--host',default=DEFAULT_HOST)
+    p.add_argument('--port',type=int,default=DEFAULT_PORT)
+
+    for name,description in (('replay','send a SpatDIF log'),('synth','send synthetic sources')):
+        p=commands.add_parser(name,help=description)
+        if name=='replay':
+            p.add_argument('logpath')
+        else:
+            p.add_argument('--sources',type=int,default=100)
+            p.add_argument('--rate',type=float,default=60.,help='position messages per second and source')
+            p.add_argument('--duration',type=float,default=10.)
+        p.add_argument('--host',default=DEFAULT_HOST)
+        p.add_argument('--port',type=int,default=DEFAULT_PORT)
+        p.add_argument('--speed',type=float,nargs='+',default=[1.])
+        p.add_argument('--bundle',action='store_true',help='send each block in as few bundles as possible')
+        p.add_argument('--probe',type=float,default=0.1,help='seconds between latency probes')
+        p.add_argument('--local-echo',action='store_true',help='start the stand-in receiver in a separate local process')
+
+    args=parser.parse_args()
+    if args.command=='echo':
+        print('receiving on %s:%d' % (args.host,args.port))
+        asyncio.run(serveEcho(args.host,args.port))
+    elif args.command in ('replay','synth'):
+        if args.command=='replay':
+            makeBlocks=lambda:logBlocks(args.logpath)
+        else:
+            makeBlocks=lambda:syntheticBlocks(args.sources,args.rate,args.duration)
+        asyncio.run(benchmark(makeBlocks,args.speed,args.host,args.port,args.local_echo,
+                              bundle=args.bundle,probeInterval=args.probe))
+    else:
+        parser.print_help()
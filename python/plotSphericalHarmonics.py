@@ -30,6 +30,7 @@ Conventions used:
     
 
 """""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+import collections
 from numpy import *
 import matplotlib.pyplot as plt
 from matplotlib import animation
@@ -84,7 +85,202 @@ def thirdOrder(theta,phi):
     P=sqrt(7.)*sqrt(5./8.)*cos(3.*phi)*cos(theta)**3.
     
     return Q,O,M,K,L,N,P
-    
+
+def numChannels(order):
+    """
+    number of ambisonics channels for a given order
+    """
+    return (order+1)**2
+
+def acn(n,m):
+    """
+    ambisonics channel number (ACN) for the harmonic of degree n and index m
+    """
+    return n*n+n+m
+
+def acnToDegree(k):
+    """
+    inverse of acn(): return the (n,m) pair for a given ambisonics channel number
+    """
+    n=int(sqrt(k))
+    return n,k-n*n-n
+
+def encode(theta,phi,order=3):
+    """
+    calculate all spherical harmonics up to the given order, for many directions at once
+
+    theta and phi are broadcasted against each other and flattened, so the result is
+    a contiguous matrix of shape (N_directions, (order+1)^2), with columns in ACN order
+    (W, Y,Z,X, V,T,R,S,U, Q,O,M,K,L,N,P, ...) and N3D normalization
+
+    the associated Legendre functions are computed with the normalized three-term recurrence,
+    and the azimuth terms cos(m*phi), sin(m*phi) with the Chebyshev recurrence,
+    so arbitrary orders can be evaluated without overflow
+
+    Parameters:
+        theta: elevation angle(s) [-pi/2,pi/2]
+        phi: azimuth angle(s)
+        order: ambisonics order (default:3)
+    """
+    theta,phi=broadcast_arrays(asarray(theta,dtype=float64),asarray(phi,dtype=float64))
+    theta=theta.ravel()
+    phi=phi.ravel()
+
+    Y=empty((theta.size,numChannels(order)))
+
+    x=sin(theta)
+    c=cos(theta)
+
+    # azimuth terms: cos(m*phi) and sin(m*phi), m=0..order
+    cosm=empty((order+1,phi.size))
+    sinm=empty((order+1,phi.size))
+    cosm[0]=1.
+    sinm[0]=0.
+    if order>0:
+        cosm[1]=cos(phi)
+        sinm[1]=sin(phi)
+    for m in range(2,order+1):
+        cosm[m]=2.*cosm[1]*cosm[m-1]-cosm[m-2]
+        sinm[m]=2.*cosm[1]*sinm[m-1]-sinm[m-2]
+
+    # normalized associated Legendre functions, sqrt((2n+1)(n-m)!/(n+m)!) * P_n^m(sin(theta))
+    # (without Condon-Shortley phase), degree by degree for each m
+    Pmm=ones(theta.size)
+    for m in range(order+1):
+        if m>0:
+            Pmm=sqrt((2.*m+1.)/(2.*m))*c*Pmm
+        # sqrt(2) factor for m!=0 in N3D
+        norm=1. if m==0 else sqrt(2.)
+
+        Pnm_2=Pmm
+        Y[:,acn(m,m)]=norm*Pmm*cosm[m]
+        if m>0:
+            Y[:,acn(m,-m)]=norm*Pmm*sinm[m]
+        if m==order:
+            break
+
+        Pnm_1=sqrt(2.*m+3.)*x*Pmm
+        Y[:,acn(m+1,m)]=norm*Pnm_1*cosm[m]
+        if m>0:
+            Y[:,acn(m+1,-m)]=norm*Pnm_1*sinm[m]
+
+        for n in range(m+2,order+1):
+            a=sqrt((4.*n*n-1.)/(n*n-m*m))
+            b=sqrt(((n-1.)**2-m*m)/(4.*(n-1.)**2-1.))
+            Pnm=a*(x*Pnm_1-b*Pnm_2)
+            Y[:,acn(n,m)]=norm*Pnm*cosm[m]
+            if m>0:
+                Y[:,acn(n,-m)]=norm*Pnm*sinm[m]
+            Pnm_2,Pnm_1=Pnm_1,Pnm
+
+    return Y
+
+class CoefficientCache(object):
+    """
+    LRU cache of source encoding coefficients, keyed on quantized (elevation, azimuth) and order
+
+    directions are rounded to a grid of the given resolution (in rads) and the coefficients are
+    evaluated at the grid point, so every direction falling into the same cell gets the same values
+
+    Parameters:
+        resolution: quantization step in rads (default:0.001 rads)
+        maxsize: maximum number of cached directions (default:4096)
+    """
+    def __init__(self,resolution=0.001,maxsize=4096):
+        self.resolution=float(resolution)
+        self.maxsize=int(maxsize)
+        self.hits=0
+        self.misses=0
+        self._table=collections.OrderedDict()
+        # azimuth cells are slightly adjusted so that they wrap exactly at 2*pi
+        self._aziSteps=int(rint(2*pi/self.resolution))
+        self._aziStep=2*pi/self._aziSteps
+
+    def __len__(self):
+        return len(self._table)
+
+    def quantize(self,theta,phi):
+        """
+        return the integer grid indices for the given elevation and azimuth
+        """
+        i=rint(asarray(theta,dtype=float64)/self.resolution).astype(int64)
+        j=rint(asarray(phi,dtype=float64)/self._aziStep).astype(int64)%self._aziSteps
+        return i,j
+
+    def get(self,theta,phi,order=3):
+        """
+        coefficients of a single direction, as a read-only array of (order+1)^2 values
+        """
+        i,j=self.quantize(theta,phi)
+        key=(int(i),int(j),order)
+        Y=self._table.get(key)
+        if Y is None:
+            self.misses+=1
+            Y=encode(key[0]*self.resolution,key[1]*self._aziStep,order)[0]
+            Y.flags.writeable=False
+            self._store(key,Y)
+        else:
+            self.hits+=1
+            self._table.move_to_end(key)
+        return Y
+
+    def encode(self,theta,phi,order=3):
+        """
+        cached equivalent of encode(): coefficients of many directions, as a (N_directions, (order+1)^2) matrix
+
+        all missing directions are evaluated with a single encode() call;
+        hits and misses are counted once per distinct grid cell in the call
+        """
+        i,j=self.quantize(*broadcast_arrays(theta,phi))
+        cells,inverse=unique((i*self._aziSteps+j).ravel(),return_inverse=True)
+        table=empty((cells.size,numChannels(order)))
+
+        missing=[]
+        for c,cell in enumerate(cells):
+            key=(int(cell//self._aziSteps),int(cell%self._aziSteps),order)
+            row=self._table.get(key)
+            if row is None:
+                missing.append(c)
+            else:
+                self._table.move_to_end(key)
+                table[c]=row
+        self.hits+=cells.size-len(missing)
+        self.misses+=len(missing)
+
+        if missing:
+            keys=cells[missing]
+            table[missing]=encode((keys//self._aziSteps)*self.resolution,(keys%self._aziSteps)*self._aziStep,order)
+            for c,cell in zip(missing,keys):
+                row=table[c].copy()
+                row.flags.writeable=False
+                self._store((int(cell//self._aziSteps),int(cell%self._aziSteps),order),row)
+
+        return table[inverse.ravel()]
+
+    def _store(self,key,Y):
+        self._table[key]=Y
+        if len(self._table)>self.maxsize:
+            self._table.popitem(last=False)
+
+    def clear(self):
+        """
+        remove all cached coefficients and reset the counters
+        """
+        self._table.clear()
+        self.hits=0
+        self.misses=0
+
+    def info(self):
+        """
+        return a dictionary with the cache counters, to help tuning resolution and maxsize
+        """
+        total=self.hits+self.misses
+        return {'hits':self.hits,'misses':self.misses,'size':len(self._table),'maxsize':self.maxsize,
+                'resolution':self.resolution,'hitRate':self.hits/float(total) if total else 0.}
+
+# shared by the plot functions below
+coefficientCache=CoefficientCache()
+
 """""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
 functions to help with computing and plotting
 """""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
@@ -105,15 +301,14 @@ def separateSign(x):
     given a ndarray, split it into two arrays, for positive and negative values respectively;
     negative array is further multiplied for -1
     
-    this function is useful for polar representations
+    this function is useful for polar representations; x may have any shape,
+    so all the frames of an animation are split at once
     """
-    condition=[x<0,x>=0]
     #positive array
-    choice_pos=[0,x]
-    pos=select(condition,choice_pos)
+    pos=maximum(x,0.)
     #negative array
-    choice_neg=[negative(x),0]
-    neg=select(condition,choice_neg)
+    neg=negative(x)
+    maximum(neg,0.,out=neg)
     
     return pos,neg
     
@@ -127,6 +322,88 @@ def plotSeparate(phi,x):
     if not(isZero(x_neg)):    
         plt.plot(phi,x_neg,'r')
     return
+
+def plotHarmonicsGrid(phi,Y):
+    """
+    plot each column of a (points, 16) ACN matrix with plotSeparate,
+    arranged as a pyramid of subplots: one row per order, one column per m
+    """
+    for k in range(Y.shape[1]):
+        n,m=acnToDegree(k)
+        plt.subplot(4,7,n*7+4+m,polar=True)
+        plotSeparate(phi,Y[:,k])
+        if n==3:
+            plt.xlabel('m='+str(m))
+    return
+
+def circleFrames(Y,theta_s=0,order=3,frames=200,period=200):
+    """
+    precompute the encoding of a source moving around a circle, for every frame of an animation
+
+    the source coefficients of all frames are evaluated at once, and multiplied with
+    the encoding of the plot directions into a single (frames, channels, points) array
+
+    Parameters:
+        Y: (points, channels) encoding of the plot directions
+        theta_s: source's elevation angle (default:0 rads)
+        order: ambisonics order of the source coefficients (default:3)
+        frames: number of frames (default:200)
+        period: number of frames for a complete turn (default:200)
+
+    returns the array and the (frames,) source azimuths
+    """
+    phi_s=2*pi*arange(frames)/period
+    Y_s=coefficientCache.encode(theta_s,phi_s,order)
+    return Y_s[:,:,newaxis]*Y.T[newaxis,:,:],phi_s
+
+def animateFrames(fig,curves,data,phi,phi_s,markers,interval=20):
+    """
+    animate precomputed frames on polar axes
+
+    data is split by sign once, for all frames; each curve is then drawn with two lines,
+    blue for the positive values and red for the negative ones, and the source position
+    with a marker on the given axes, so each frame only sets the data of the artists
+
+    Parameters:
+        fig: figure holding the axes
+        curves: list of (axes, linewidth) pairs, one per curve (linewidth None for the default one)
+        data: (frames, curves, points) values of each curve at each frame
+        phi: (points,) azimuths of the curves
+        phi_s: (frames,) source azimuth at each frame
+        markers: list of (axes, radius) pairs where the source is drawn
+        interval: time between frames in ms (default:20)
+
+    returns the animation, which must be kept referenced (e.g. from ipython) while it plays
+    """
+    #adapted from http://matplotlib.org/1.3.1/examples/animation/simple_anim.html
+    
+    pos,neg=separateSign(data)
+    lines=[]
+    for k,(ax,lw) in enumerate(curves):
+        lineA, = ax.plot(phi, pos[0,k],color='b',lw=lw)
+        lineB, = ax.plot(phi, neg[0,k],color='r',lw=lw)
+        lines+=[lineA,lineB]
+    sources=[ax.plot([], [],color='g',lw=5,linestyle='--',drawstyle='steps',marker='o')[0] for ax,r in markers]
+    radius=[r for ax,r in markers]
+    artists=lines+sources
+
+    # initialization function: first frame
+    def init():
+        return animate(0)
+
+    # animation function: only the radii of the curves change
+    def animate(i):
+        for k in range(len(curves)):
+            lines[2*k].set_ydata(pos[i,k])
+            lines[2*k+1].set_ydata(neg[i,k])
+        for line,r in zip(sources,radius):
+            line.set_data([phi_s[i]],[r])
+        return artists
+
+    # blit=True means only re-draw the parts that have changed.
+    return animation.FuncAnimation(fig, animate, init_func=init,
+                                   frames=len(data), interval=interval, blit=True)
+
         
 """""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
 functions to plot spherical harmonics
@@ -145,55 +422,10 @@ def plotHarmonics(step=1000,theta=0):
     theta=ones(step)*theta
     
     #encoding values
-    W=              nullOrder(theta,phi)
-    X,Y,Z=          firstOrder(theta,phi)
-    V,T,R,S,U=      secondOrder(theta,phi)
-    Q,O,M,K,L,N,P=  thirdOrder(theta,phi)
+    Y=encode(theta,phi,3)
 
     #plot
-    # order 0
-    plt.subplot(474,polar=True)        
-    plotSeparate(phi,W)
-    # order 1
-    plt.subplot(4,7,10,polar=True)
-    plotSeparate(phi,Y)
-    plt.subplot(4,7,11,polar=True)
-    plotSeparate(phi,Z)
-    plt.subplot(4,7,12,polar=True)
-    plotSeparate(phi,X)
-    #order 2
-    plt.subplot(4,7,16,polar=True)
-    plotSeparate(phi,V)
-    plt.subplot(4,7,17,polar=True)
-    plotSeparate(phi,T)
-    plt.subplot(4,7,18,polar=True)
-    plotSeparate(phi,R)
-    plt.subplot(4,7,19,polar=True)
-    plotSeparate(phi,S)
-    plt.subplot(4,7,20,polar=True)
-    plotSeparate(phi,U)
-    #order 3
-    plt.subplot(4,7,22,polar=True)
-    plotSeparate(phi,Q)
-    plt.xlabel('m=-3')
-    plt.subplot(4,7,23,polar=True)
-    plotSeparate(phi,O) 
-    plt.xlabel('m=-2')
-    plt.subplot(4,7,24,polar=True)
-    plotSeparate(phi,M)
-    plt.xlabel('m=-1')
-    plt.subplot(4,7,25,polar=True)
-    plotSeparate(phi,K)
-    plt.xlabel('m=0')
-    plt.subplot(4,7,26,polar=True)
-    plotSeparate(phi,L)
-    plt.xlabel('m=1')
-    plt.subplot(4,7,27,polar=True)
-    plotSeparate(phi,N)
-    plt.xlabel('m=2')
-    plt.subplot(4,7,28,polar=True)
-    plotSeparate(phi,P)
-    plt.xlabel('m=3')
+    plotHarmonicsGrid(phi,Y)
     
     return
 
@@ -214,61 +446,13 @@ def plotPointSource(step=1000,theta=0,theta_s=0,phi_s=0):
     theta=ones(step)*theta
     
     #encoding values
-    W=              nullOrder(theta,phi)
-    X,Y,Z=          firstOrder(theta,phi)
-    V,T,R,S,U=      secondOrder(theta,phi)
-    Q,O,M,K,L,N,P=  thirdOrder(theta,phi)
+    Y=encode(theta,phi,3)
     
     #source coefficients
-    W_s=                            nullOrder(theta_s,phi_s)
-    X_s,Y_s,Z_s=                    firstOrder(theta_s,phi_s)
-    V_s,T_s,R_s,S_s,U_s=            secondOrder(theta_s,phi_s)
-    Q_s,O_s,M_s,K_s,L_s,N_s,P_s=    thirdOrder(theta_s,phi_s)
+    Y_s=coefficientCache.get(theta_s,phi_s,3)
 
     #plot
-    # order 0
-    plt.subplot(474,polar=True)        
-    plotSeparate(phi,W*W_s)
-    # order 1
-    plt.subplot(4,7,10,polar=True)
-    plotSeparate(phi,Y*Y_s)
-    plt.subplot(4,7,11,polar=True)
-    plotSeparate(phi,Z*Z_s)
-    plt.subplot(4,7,12,polar=True)
-    plotSeparate(phi,X*X_s)
-    #order 2
-    plt.subplot(4,7,16,polar=True)
-    plotSeparate(phi,V*V_s)
-    plt.subplot(4,7,17,polar=True)
-    plotSeparate(phi,T*T_s)
-    plt.subplot(4,7,18,polar=True)
-    plotSeparate(phi,R*R_s)
-    plt.subplot(4,7,19,polar=True)
-    plotSeparate(phi,S*S_s)
-    plt.subplot(4,7,20,polar=True)
-    plotSeparate(phi,U*U_s)
-    #order 3
-    plt.subplot(4,7,22,polar=True)
-    plotSeparate(phi,Q*Q_s)
-    plt.xlabel('m=-3')
-    plt.subplot(4,7,23,polar=True)
-    plotSeparate(phi,O*O_s) 
-    plt.xlabel('m=-2')
-    plt.subplot(4,7,24,polar=True)
-    plotSeparate(phi,M*M_s)
-    plt.xlabel('m=-1')
-    plt.subplot(4,7,25,polar=True)
-    plotSeparate(phi,K*K_s)
-    plt.xlabel('m=0')
-    plt.subplot(4,7,26,polar=True)
-    plotSeparate(phi,L*L_s)
-    plt.xlabel('m=1')
-    plt.subplot(4,7,27,polar=True)
-    plotSeparate(phi,N*N_s)
-    plt.xlabel('m=2')
-    plt.subplot(4,7,28,polar=True)
-    plotSeparate(phi,P*P_s)
-    plt.xlabel('m=3')
+    plotHarmonicsGrid(phi,Y*Y_s)
     
     return
 
@@ -279,371 +463,93 @@ def plotPointSourceMoving(step=100,theta=0,theta_s=0):
     plot a polar representation of a circle-moving puntual source encoded with 3D spherical harmonics up to 3rd order
     
     Parameters:
-        step: number of points to calculate (default:1000)
+        step: number of points to calculate (default:100)
         theta: elevation angle of the plane (default:0 rads - horizontal plane)
         theta_s: source's elevation angle 
     """
     
-    #adapted from http://matplotlib.org/1.3.1/examples/animation/simple_anim.html
-    
     #plot parameters
     phi=arange(0,2*pi,2*pi/step)
     theta=ones(step)*theta
-    global phi_s #initial value
-    phi_s=0
     
     y_lim=5 #max amplitude value
+    source_position=4
     
     #encoding values
-    W=              nullOrder(theta,phi)
-    X,Y,Z=          firstOrder(theta,phi)
-    V,T,R,S,U=      secondOrder(theta,phi)
-    Q,O,M,K,L,N,P=  thirdOrder(theta,phi)
+    Y=encode(theta,phi,3)
     
-    #source coefficients
-    W_s=                            nullOrder(theta_s,phi_s)
-    X_s,Y_s,Z_s=                    firstOrder(theta_s,phi_s)
-    V_s,T_s,R_s,S_s,U_s=            secondOrder(theta_s,phi_s)
-    Q_s,O_s,M_s,K_s,L_s,N_s,P_s=    thirdOrder(theta_s,phi_s)
+    #all frames, one turn every 250 frames
+    B,phi_s=circleFrames(Y,theta_s,3,period=250)
 
-    # First set up the figure, the axis, and the plot element we want to animate
+    # set up the figure, one subplot per channel as in plotHarmonicsGrid
     fig = plt.figure(figsize=(20,10))
-    
-    ax4=fig.add_subplot(474,polar=True)
-    ax4.set_ylim(0,y_lim)
-    line4a, = ax4.plot([], [], color='b')
-    line4b, = ax4.plot([], [],color='r')
-    line4c, = ax4.plot([], [],color='g',lw=5,linestyle='steps--',marker='o')
-    
-    ax10=fig.add_subplot(4,7,10,polar=True)
-    ax10.set_ylim(0,y_lim)
-    line10a, = ax10.plot([], [], color='b')
-    line10b, = ax10.plot([], [],color='r')
-    line10c, = ax10.plot([], [],color='g',lw=5,linestyle='steps--',marker='o')    
-    
-    ax11=fig.add_subplot(4,7,11,polar=True)
-    ax11.set_ylim(0,y_lim)
-    line11a, = ax11.plot([], [], color='b')
-    line11b, = ax11.plot([], [],color='r')
-    line11c, = ax11.plot([], [],color='g',lw=5,linestyle='steps--',marker='o')   
-    
-    ax12=fig.add_subplot(4,7,12,polar=True)
-    ax12.set_ylim(0,y_lim)
-    line12a, = ax12.plot([], [], color='b')
-    line12b, = ax12.plot([], [],color='r')
-    line12c, = ax12.plot([], [],color='g',lw=5,linestyle='steps--',marker='o')   
-    
-    ax16=fig.add_subplot(4,7,16,polar=True)
-    ax16.set_ylim(0,y_lim)
-    line16a, = ax16.plot([], [], color='b')
-    line16b, = ax16.plot([], [],color='r')
-    line16c, = ax16.plot([], [],color='g',lw=5,linestyle='steps--',marker='o')   
-
-    ax17=fig.add_subplot(4,7,17,polar=True)
-    ax17.set_ylim(0,y_lim)
-    line17a, = ax17.plot([], [], color='b')
-    line17b, = ax17.plot([], [],color='r')
-    line17c, = ax17.plot([], [],color='g',lw=5,linestyle='steps--',marker='o')   
-    
-    ax18=fig.add_subplot(4,7,18,polar=True)
-    ax18.set_ylim(0,y_lim)
-    line18a, = ax18.plot([], [], color='b')
-    line18b, = ax18.plot([], [],color='r')
-    line18c, = ax18.plot([], [],color='g',lw=5,linestyle='steps--',marker='o')   
-
-    ax19=fig.add_subplot(4,7,19,polar=True)
-    ax19.set_ylim(0,y_lim)
-    line19a, = ax19.plot([], [], color='b')
-    line19b, = ax19.plot([], [],color='r')
-    line19c, = ax19.plot([], [],color='g',lw=5,linestyle='steps--',marker='o')   
-
-    ax20=fig.add_subplot(4,7,20,polar=True)
-    ax20.set_ylim(0,y_lim)
-    line20a, = ax20.plot([], [], color='b')
-    line20b, = ax20.plot([], [],color='r')
-    line20c, = ax20.plot([], [],color='g',lw=5,linestyle='steps--',marker='o')   
-
-    ax22=fig.add_subplot(4,7,22,polar=True)
-    ax22.set_ylim(0,y_lim)
-    line22a, = ax22.plot([], [], color='b')
-    line22b, = ax22.plot([], [],color='r')
-    line22c, = ax22.plot([], [],color='g',lw=5,linestyle='steps--',marker='o')   
-    plt.xlabel('m=-3')
-
-    ax23=fig.add_subplot(4,7,23,polar=True)
-    ax23.set_ylim(0,y_lim)
-    line23a, = ax23.plot([], [], color='b')
-    line23b, = ax23.plot([], [],color='r')
-    line23c, = ax23.plot([], [],color='g',lw=5,linestyle='steps--',marker='o')   
-    plt.xlabel('m=-2')
-
-    ax24=fig.add_subplot(4,7,24,polar=True)
-    ax24.set_ylim(0,y_lim)
-    line24a, = ax24.plot([], [], color='b')
-    line24b, = ax24.plot([], [],color='r')
-    line24c, = ax24.plot([], [],color='g',lw=5,linestyle='steps--',marker='o')   
-    plt.xlabel('m=-1')
-
-    ax25=fig.add_subplot(4,7,25,polar=True)
-    ax25.set_ylim(0,y_lim)
-    line25a, = ax25.plot([], [], color='b')
-    line25b, = ax25.plot([], [],color='r')
-    line25c, = ax25.plot([], [],color='g',lw=5,linestyle='steps--',marker='o')   
-    plt.xlabel('m=0')
-
-    ax26=fig.add_subplot(4,7,26,polar=True)
-    ax26.set_ylim(0,y_lim)
-    line26a, = ax26.plot([], [], color='b')
-    line26b, = ax26.plot([], [],color='r')
-    line26c, = ax26.plot([], [],color='g',lw=5,linestyle='steps--',marker='o')   
-    plt.xlabel('m=1')
-
-    ax27=fig.add_subplot(4,7,27,polar=True)
-    ax27.set_ylim(0,y_lim)
-    line27a, = ax27.plot([], [], color='b')
-    line27b, = ax27.plot([], [],color='r')
-    line27c, = ax27.plot([], [],color='g',lw=5,linestyle='steps--',marker='o')   
-    plt.xlabel('m=2')
-    
-    ax28=fig.add_subplot(4,7,28,polar=True)
-    ax28.set_ylim(0,y_lim)
-    line28a, = ax28.plot([], [], color='b')
-    line28b, = ax28.plot([], [],color='r')
-    line28c, = ax28.plot([], [],color='g',lw=5,linestyle='steps--',marker='o')   
-    plt.xlabel('m=3')
-
-
-    # initialization function: plot the background of each frame
-    def init():
-        #initialize empty lines        
-        line4a.set_data([], [])
-        line4b.set_data([], [])
-        line4c.set_data([], [])
-        line10a.set_data([], [])
-        line10b.set_data([], [])
-        line10c.set_data([], [])
-        line11a.set_data([], [])
-        line11b.set_data([], [])
-        line11c.set_data([], [])
-        line12a.set_data([], [])
-        line12b.set_data([], [])
-        line12c.set_data([], [])
-        line16a.set_data([], [])
-        line16b.set_data([], [])
-        line16c.set_data([], [])
-        line17a.set_data([], [])
-        line17b.set_data([], [])
-        line17c.set_data([], [])
-        line18a.set_data([], [])
-        line18b.set_data([], [])
-        line18c.set_data([], [])
-        line19a.set_data([], [])
-        line19b.set_data([], [])
-        line19c.set_data([], [])
-        line20a.set_data([], [])
-        line20b.set_data([], [])
-        line20c.set_data([], [])
-        line22a.set_data([], [])
-        line22b.set_data([], [])
-        line22c.set_data([], [])
-        line23a.set_data([], [])
-        line23b.set_data([], [])
-        line23c.set_data([], [])
-        line24a.set_data([], [])
-        line24b.set_data([], [])
-        line24c.set_data([], [])
-        line25a.set_data([], [])
-        line25b.set_data([], [])
-        line25c.set_data([], [])
-        line26a.set_data([], [])
-        line26b.set_data([], [])
-        line26c.set_data([], [])
-        line27a.set_data([], [])
-        line27b.set_data([], [])
-        line27c.set_data([], [])
-        line28a.set_data([], [])
-        line28b.set_data([], [])
-        line28c.set_data([], [])
-    
-    # animation function.  This is called sequentially
-    def animate(i):
-        global phi_s
-        phi_s =2*pi*i/250 
-        source_position=4
-
-        X_s,Y_s,Z_s=                    firstOrder(theta_s,phi_s)
-        V_s,T_s,R_s,S_s,U_s=            secondOrder(theta_s,phi_s)
-        Q_s,O_s,M_s,K_s,L_s,N_s,P_s=    thirdOrder(theta_s,phi_s)
-    
-        w_pos,w_neg=separateSign(W*W_s)
-        line4a.set_data(phi, w_pos)
-        line4b.set_data(phi, w_neg)
-        line4c.set_data([phi_s],[source_position]) 
-
-        y_pos,y_neg=separateSign(Y*Y_s)
-        line10a.set_data(phi, y_pos)
-        line10b.set_data(phi, y_neg)
-        line10c.set_data([phi_s],[source_position]) 
-        z_pos,z_neg=separateSign(Z*Z_s)
-        line11a.set_data(phi, z_pos)
-        line11b.set_data(phi, z_neg)
-        line11c.set_data([phi_s],[source_position]) 
-        x_pos,x_neg=separateSign(X*X_s)
-        line12a.set_data(phi, x_pos)
-        line12b.set_data(phi, x_neg)
-        line12c.set_data([phi_s],[source_position]) 
-        
-        v_pos,v_neg=separateSign(V*V_s)
-        line16a.set_data(phi, v_pos)
-        line16b.set_data(phi, v_neg)
-        line16c.set_data([phi_s],[source_position]) 
-        t_pos,t_neg=separateSign(T*T_s)
-        line17a.set_data(phi, t_pos)
-        line17b.set_data(phi, t_neg)
-        line17c.set_data([phi_s],[source_position]) 
-        r_pos,r_neg=separateSign(R*R_s)
-        line18a.set_data(phi, r_pos)
-        line18b.set_data(phi, r_neg)
-        line18c.set_data([phi_s],[source_position]) 
-        s_pos,s_neg=separateSign(S*S_s)
-        line19a.set_data(phi, s_pos)
-        line19b.set_data(phi, s_neg)
-        line19c.set_data([phi_s],[source_position]) 
-        u_pos,u_neg=separateSign(U*U_s)
-        line20a.set_data(phi, u_pos)
-        line20b.set_data(phi, u_neg)
-        line20c.set_data([phi_s],[source_position]) 
-        
-        q_pos,q_neg=separateSign(Q*Q_s)
-        line22a.set_data(phi, q_pos)
-        line22b.set_data(phi, q_neg)
-        line22c.set_data([phi_s],[source_position]) 
-        o_pos,o_neg=separateSign(O*O_s)
-        line23a.set_data(phi, o_pos)
-        line23b.set_data(phi, o_neg)
-        line23c.set_data([phi_s],[source_position]) 
-        m_pos,m_neg=separateSign(M*M_s)
-        line24a.set_data(phi, m_pos)
-        line24b.set_data(phi, m_neg)
-        line24c.set_data([phi_s],[source_position]) 
-        k_pos,k_neg=separateSign(K*K_s)
-        line25a.set_data(phi, k_pos)
-        line25b.set_data(phi, k_neg)
-        line25c.set_data([phi_s],[source_position]) 
-        l_pos,l_neg=separateSign(L*L_s)
-        line26a.set_data(phi, l_pos)
-        line26b.set_data(phi, l_neg)
-        line26c.set_data([phi_s],[source_position]) 
-        n_pos,n_neg=separateSign(N*N_s)
-        line27a.set_data(phi, n_pos)
-        line27b.set_data(phi, n_neg)
-        line27c.set_data([phi_s],[source_position]) 
-        p_pos,p_neg=separateSign(P*P_s)
-        line28a.set_data(phi, p_pos)
-        line28b.set_data(phi, p_neg)
-        line28c.set_data([phi_s],[source_position]) 
-        
-        return line4a,line4b,line4c, line10a,line10b,line10c, line11a,line11b,line11c, line12a,line12b,line12c, line16a,line16b,line16c, line17a,line17b,line17c, line18a,line18b,line18c, line19a,line19b,line19c, line20a,line20b,line20c, line22a,line22b,line22c, line23a,line23b,line23c, line24a,line24b,line24c, line25a,line25b,line25c, line26a,line26b,line26c, line27a,line27b,line27c, line28a,line28b,line28c,
-    
-    # call the animator.  blit=True means only re-draw the parts that have changed.
-    # interval= time between calculations in ms
-    # frames=  each frames iterations, start again
-    anim = animation.FuncAnimation(fig, animate, init_func=init,
-                                   frames=200, interval=20, blit=True)
+    axes=[]
+    for k in range(16):
+        n,m=acnToDegree(k)
+        ax=fig.add_subplot(4,7,n*7+4+m,polar=True)
+        ax.set_ylim(0,y_lim)
+        if n==3:
+            ax.set_xlabel('m='+str(m))
+        axes.append(ax)
 
+    anim=animateFrames(fig,[(ax,None) for ax in axes],B,phi,phi_s,[(ax,source_position) for ax in axes])
     
     return anim #in order to work from ipython
     
 
-""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
-def plotPointSourceMovingFirst(step=1000,theta=0):
+def plotComponentsMoving(order,channels,step=1000,theta=0,y_lim=5,source_position=4):
     """
     plot a polar representation in the horizontal plane of a circle-moving puntual source,
-    encoded with only first order 3D spherical harmonics
+    with some channels of its encoding and their addition in the same axes
     - narrow line: individual components
     - broad line: addition of all components 
 
     Parameters:
+        order: ambisonics order of the encoding
+        channels: list of the ACN channels to plot
         step: number of points to calculate (default:1000)
         theta: elevation angle of the plane (default:0 rads - horizontal plane)
+        y_lim: max amplitude value (default:5)
+        source_position: radius of the source marker (default:4)
     """
     
-    #adapted from http://matplotlib.org/1.3.1/examples/animation/simple_anim.html
-    
     #plot parameters
     phi=arange(0,2*pi,2*pi/step)
     theta=ones(step)*theta
-    phi_s=0
-    theta_s=0
     
     #encoding values
-    X,Y,Z=          firstOrder(theta,phi)
+    Y=encode(theta,phi,order)
     
-    #source coefficients
-    X_s,Y_s,Z_s=   firstOrder(theta_s,phi_s)
-
-    # First set up the figure, the axis, and the plot element we want to animate
+    #all frames: the components, and their addition as the last curve
+    B,phi_s=circleFrames(Y,0,order)
+    B=B[:,channels]
+    B=concatenate((B,B.sum(axis=1)[:,newaxis]),axis=1)
 
+    # set up the figure, the axis, and the plot elements we want to animate
     fig = plt.figure(figsize=(20,10))
     ax = plt.axes(polar=True)
-    ax.set_ylim(0,5)
-    
-    lineXa, = ax.plot([], [], color='b')
-    lineXb, = ax.plot([], [], color='r')
-    lineYa, = ax.plot([], [], color='b')
-    lineYb, = ax.plot([], [], color='r') 
-    line1a, = ax.plot([], [], color='b',lw=3)
-    line1b, = ax.plot([], [],color='r',lw=3)
+    ax.set_ylim(0,y_lim)
     
-    line_c, = ax.plot([], [],color='g',lw=5,linestyle='steps--',marker='o')
-    
-  
-    # initialization function: plot the background of each frame
-    def init():
-        #initialize empty lines: line_a positive values, line_b negative values, line_c point source
-        lineXa.set_data([], [])
-        lineXb.set_data([], [])
-        lineYa.set_data([], [])
-        lineYb.set_data([], [])
-        line1a.set_data([], [])
-        line1b.set_data([], [])
-        line_c.set_data([], [])
-
+    curves=[(ax,None)]*len(channels)+[(ax,3)]
+    anim=animateFrames(fig,curves,B,phi,phi_s,[(ax,source_position)])
     
-    # animation function.  This is called sequentially
-    def animate(i):
-        global phi_s
-        phi_s =2*pi*i/200 
-        source_position=4
-
-        X_s,Y_s,Z_s=firstOrder(theta_s,phi_s)
-        
-        first=(X*X_s)+(Y*Y_s)
-    
-        x_pos,x_neg=separateSign(X*X_s)
-        lineXa.set_data(phi, x_pos)
-        lineXb.set_data(phi, x_neg)
-        y_pos,y_neg=separateSign(Y*Y_s)
-        lineYa.set_data(phi, y_pos)
-        lineYb.set_data(phi, y_neg)
-        first_pos,first_neg=separateSign(first) 
-        line1a.set_data(phi,first_pos)
-        line1b.set_data(phi,first_neg)
-        
-        line_c.set_data([phi_s], [source_position])
+    return anim
     
 
-        return lineXa,lineXb, lineYa,lineYb, line1a,line1b,line_c
-        
-    
-    # call the animator.  blit=True means only re-draw the parts that have changed.
-    # interval= time between calculations in ms
-    # frames=  each frames iterations, start again
-    anim = animation.FuncAnimation(fig, animate, init_func=init,
-                                   frames=200, interval=20, blit=True)
+""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+def plotPointSourceMovingFirst(step=1000,theta=0):
+    """
+    plot a polar representation in the horizontal plane of a circle-moving puntual source,
+    encoded with only first order 3D spherical harmonics
+    - narrow line: individual components
+    - broad line: addition of all components 
 
-    
-    return anim
+    Parameters:
+        step: number of points to calculate (default:1000)
+        theta: elevation angle of the plane (default:0 rads - horizontal plane)
+    """
+    # we take only X and Y, Z is zero in the horizontal plane
+    return plotComponentsMoving(1,[3,1],step,theta,y_lim=5,source_position=4)
     
     
 """"""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
@@ -658,95 +564,10 @@ def plotPointSourceMovingSecond(step=1000,theta=0):
         step: number of points to calculate (default:1000)
         theta: elevation angle of the plane (default:0 rads - horizontal plane)
     """
+    # we take only non-zero coefficients
+    return plotComponentsMoving(2,[4,6,8],step,theta,y_lim=7,source_position=6)
     
-    #adapted from http://matplotlib.org/1.3.1/examples/animation/simple_anim.html
-    
-    #plot parameters
-    phi=arange(0,2*pi,2*pi/step)
-    theta=ones(step)*theta
-    phi_s=0
-    theta_s=0
-    
-    #encoding values
-    V,T,R,S,U=      secondOrder(theta,phi)
-    
-    #source coefficients
-    V_s,T_s,R_s,S_s,U_s = secondOrder(theta_s,phi_s)
-
-    # First set up the figure, the axis, and the plot element we want to animate
-
-    fig = plt.figure(figsize=(20,10))
-    ax = plt.axes(polar=True)
-    ax.set_ylim(0,7)
-    
-    lineVa, = ax.plot([], [], color='b')
-    lineVb, = ax.plot([], [], color='r')
-    lineRa, = ax.plot([], [], color='b')
-    lineRb, = ax.plot([], [], color='r') 
-    lineUa, = ax.plot([], [], color='b')
-    lineUb, = ax.plot([], [], color='r') 
-    line2a, = ax.plot([], [], color='b',lw=3)
-    line2b, = ax.plot([], [], color='r',lw=3)
-    
-    line_c, = ax.plot([], [],color='g',lw=5,linestyle='steps--',marker='o')
     
-  
-    # initialization function: plot the background of each frame
-    def init():
-        #initialize empty lines: line_a positive values, line_b negative values, line_c point source
-        lineVa.set_data([], [])
-        lineVb.set_data([], [])
-        lineRa.set_data([], [])
-        lineRb.set_data([], [])
-        lineUa.set_data([], [])
-        lineUb.set_data([], [])
-        line2a.set_data([], [])
-        line2b.set_data([], [])
-        line_c.set_data([], [])
-
-    
-    # animation function.  This is called sequentially
-    def animate(i):
-        global phi_s
-        phi_s =2*pi*i/200 
-        source_position=6
-
-        V_s,T_s,R_s,S_s,U_s = secondOrder(theta_s,phi_s)
-        
-        # we take only non-zero coefficients
-        second=(V*V_s)+(R*R_s)+(U*U_s)
-    
-        v_pos,v_neg=separateSign(V*V_s)
-        lineVa.set_data(phi, v_pos)
-        lineVb.set_data(phi, v_neg)
-        r_pos,r_neg=separateSign(R*R_s)
-        lineRa.set_data(phi, r_pos)
-        lineRb.set_data(phi, r_neg)
-        u_pos,u_neg=separateSign(U*U_s)
-        lineUa.set_data(phi, u_pos)
-        lineUb.set_data(phi, u_neg)        
-        second_pos,second_neg=separateSign(second) 
-        line2a.set_data(phi,second_pos)
-        line2b.set_data(phi,second_neg)
-        
-        line_c.set_data([phi_s], [source_position])
-    
-
-        return lineVa,lineVb, lineRa,lineRb, lineUa,lineUb, line2a,line2b,line_c
-        
-    
-    # call the animator.  blit=True means only re-draw the parts that have changed.
-    # interval= time between calculations in ms
-    # frames=  each frames iterations, start again
-    anim = animation.FuncAnimation(fig, animate, init_func=init,
-                                   frames=200, interval=20, blit=True)
-
-    
-    return anim
-    
-    
-    
-
 """"""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
 def plotPointSourceMovingThird(step=1000,theta=0):
     """
@@ -759,98 +580,9 @@ def plotPointSourceMovingThird(step=1000,theta=0):
         step: number of points to calculate (default:1000)
         theta: elevation angle of the plane (default:0 rads - horizontal plane)
     """
+    # we take only non-zero coefficients
+    return plotComponentsMoving(3,[9,11,13,15],step,theta,y_lim=9,source_position=8)
     
-    #adapted from http://matplotlib.org/1.3.1/examples/animation/simple_anim.html
-    
-    #plot parameters
-    phi=arange(0,2*pi,2*pi/step)
-    theta=ones(step)*theta
-    phi_s=0 
-    theta_s=0
-    
-    #encoding values
-    Q,O,M,K,L,N,P=  thirdOrder(theta,phi)
-    
-    #source coefficients
-    Q_s,O_s,M_s,K_s,L_s,N_s,P_s = thirdOrder(theta_s,phi_s)
-
-    # First set up the figure, the axis, and the plot element we want to animate
-
-    fig = plt.figure(figsize=(20,10))
-    ax = plt.axes(polar=True)
-    ax.set_ylim(0,9)
-    
-    lineQa, = ax.plot([], [], color='b')
-    lineQb, = ax.plot([], [], color='r')
-    lineMa, = ax.plot([], [], color='b')
-    lineMb, = ax.plot([], [], color='r') 
-    lineLa, = ax.plot([], [], color='b')
-    lineLb, = ax.plot([], [], color='r') 
-    linePa, = ax.plot([], [], color='b')
-    linePb, = ax.plot([], [], color='r') 
-    line3a, = ax.plot([], [], color='b',lw=3)
-    line3b, = ax.plot([], [], color='r',lw=3)
-    
-    line_c, = ax.plot([], [],color='g',lw=5,linestyle='steps--',marker='o')
-    
-  
-    # initialization function: plot the background of each frame
-    def init():
-        #initialize empty lines: line_a positive values, line_b negative values, line_c point source
-        lineQa.set_data([], [])
-        lineQb.set_data([], [])
-        lineMa.set_data([], [])
-        lineMb.set_data([], [])
-        lineLa.set_data([], [])
-        lineLb.set_data([], [])
-        linePa.set_data([], [])
-        linePb.set_data([], [])
-        line3a.set_data([], [])
-        line3b.set_data([], [])
-        line_c.set_data([], [])
-
-    
-    # animation function.  This is called sequentially
-    def animate(i):
-        global phi_s
-        phi_s =2*pi*i/200 
-        source_position=8
-
-        Q_s,O_s,M_s,K_s,L_s,N_s,P_s = thirdOrder(theta_s,phi_s)
-        # we take only non-zero coefficients
-        third=(Q*Q_s)+(M*M_s)+(L*L_s)+(P*P_s)
-    
-        q_pos,q_neg=separateSign(Q*Q_s)
-        lineQa.set_data(phi, q_pos)
-        lineQb.set_data(phi, q_neg)
-        m_pos,m_neg=separateSign(M*M_s)
-        lineMa.set_data(phi, m_pos)
-        lineMb.set_data(phi, m_neg)
-        l_pos,l_neg=separateSign(L*L_s)
-        lineLa.set_data(phi, l_pos)
-        lineLb.set_data(phi, l_neg) 
-        p_pos,p_neg=separateSign(P*P_s)
-        linePa.set_data(phi, p_pos)
-        linePb.set_data(phi, p_neg)
-        third_pos,third_neg=separateSign(third) #already normalized
-        line3a.set_data(phi,third_pos)
-        line3b.set_data(phi,third_neg)
-        
-        line_c.set_data([phi_s], [source_position])
-    
-
-        return lineQa,lineQb, lineMa,lineMb, lineLa,lineLb, linePa,linePb, line3a,line3b,line_c
-        
-    
-    # call the animator.  blit=True means only re-draw the parts that have changed.
-    # interval= time between calculations in ms
-    # frames=  each frames iterations, start again
-    anim = animation.FuncAnimation(fig, animate, init_func=init,
-                                   frames=200, interval=20, blit=True)
-
-    
-    return anim    
-
 
 """"""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
 def plotPointSourceMovingDirectivity(step=1000,theta=0):
@@ -865,130 +597,35 @@ def plotPointSourceMovingDirectivity(step=1000,theta=0):
         theta: elevation angle of the plane (default:0 rads - horizontal plane)
     """
     
-    #adapted from http://matplotlib.org/1.3.1/examples/animation/simple_anim.html
-    
     #plot parameters
     phi=arange(0,2*pi,2*pi/step)
     theta=ones(step)*theta
-    phi_s=0
-    theta_s=0
     
     #encoding values
-    W=              nullOrder(theta,phi)
-    X,Y,Z=          firstOrder(theta,phi)
-    V,T,R,S,U=      secondOrder(theta,phi)
-    Q,O,M,K,L,N,P=  thirdOrder(theta,phi)
-    
-    #source coefficients
-    W_s=                            nullOrder(theta_s,phi_s)
-    X_s,Y_s,Z_s=                    firstOrder(theta_s,phi_s)
-    V_s,T_s,R_s,S_s,U_s=            secondOrder(theta_s,phi_s)
-    Q_s,O_s,M_s,K_s,L_s,N_s,P_s=    thirdOrder(theta_s,phi_s)
-
-    # First set up the figure, the axis, and the plot element we want to animate
-
-    fig = plt.figure(figsize=(20,10))
-    
-    ax1= fig.add_subplot(221,polar=True)
-    ax1.set_ylim(0,1.2)
-    ax1.set_xlabel('m=0')
-    line1a, = ax1.plot([], [], color='b')
-    line1b, = ax1.plot([], [],color='r')
-    line1c, = ax1.plot([], [],color='g',lw=5,linestyle='steps--',marker='o')
-    
-    
-    ax2=fig.add_subplot(222,polar=True)
-    ax2.set_ylim(0,1.2)
-    ax2.set_xlabel('m=1')
-    line2a, = ax2.plot([], [], color='b')
-    line2b, = ax2.plot([], [],color='r')
-    line2c, = ax2.plot([], [],color='g',lw=5,linestyle='steps--',marker='o')
-    
-    ax3=fig.add_subplot(223,polar=True)
-    ax3.set_ylim(0,1.2)
-    ax3.set_xlabel('m=2')
-    line3a, = ax3.plot([], [], color='b')
-    line3b, = ax3.plot([], [],color='r')
-    line3c, = ax3.plot([], [],color='g',lw=5,linestyle='steps--',marker='o')    
+    Y=encode(theta,phi,3)
     
-    ax4=fig.add_subplot(224,polar=True)
-    ax4.set_ylim(0,1.2)
-    ax4.set_xlabel('m=3')
-    line4a, = ax4.plot([], [], color='b')
-    line4b, = ax4.plot([], [],color='r')
-    line4c, = ax4.plot([], [],color='g',lw=5,linestyle='steps--',marker='o')   
-     
+    #all frames: each level is the dot product of the truncated encodings,
+    #that is the cumulative sum of the channels up to the last one of the level
+    B,phi_s=circleFrames(Y,0,3)
+    levels=cumsum(B,axis=1)[:,[0,3,8,15]]
     
+    # normalize each decoding by the number of channels
+    levels/=array([1.,4.,9.,16.])[:,newaxis]
 
-    # initialization function: plot the background of each frame
-    def init():
-        #initialize empty lines: line_a positive values, line_b negative values, line_c point source
-        line1a.set_data([], [])
-        line1b.set_data([], [])
-        line1c.set_data([], [])
-        
-        line2a.set_data([], [])
-        line2b.set_data([], [])
-        line2c.set_data([], [])
-
-        line3a.set_data([], [])
-        line3b.set_data([], [])
-        line3c.set_data([], [])
-        
-        line4a.set_data([], [])
-        line4b.set_data([], [])
-        line4c.set_data([], [])
-
-    
-    # animation function.  This is called sequentially
-    def animate(i):
-        global phi_s
-        phi_s =2*pi*i/200 
-        source_position=1
-
-        X_s,Y_s,Z_s=                    firstOrder(theta_s,phi_s)
-        V_s,T_s,R_s,S_s,U_s=            secondOrder(theta_s,phi_s)
-        Q_s,O_s,M_s,K_s,L_s,N_s,P_s=    thirdOrder(theta_s,phi_s)
-        
-        zero=(W*W_s)
-        first=(zero+(X*X_s)+(Y*Y_s)+(Z*Z_s))
-        second=(first+(V*V_s)+(T*T_s)+(R*R_s)+(S*S_s)+(U*U_s))
-        third=(second+(Q*Q_s)+(O*O_s)+(M*M_s)+(K*K_s)+(L*L_s)+(N*N_s)+(P*P_s))
-
-        # normalize each decoding by the number of channels
-        first_pos,first_neg=separateSign(zero/1)
-        line1a.set_data(phi, first_pos)
-        line1b.set_data(phi, first_neg)
-        line1c.set_data([phi_s], [source_position])
-        
-        second_pos,second_neg=separateSign(first/4)
-        line2a.set_data(phi, second_pos)
-        line2b.set_data(phi, second_neg)
-        line2c.set_data([phi_s], [source_position])
-
-        third_pos,third_neg=separateSign(second/9)
-        line3a.set_data(phi, third_pos)
-        line3b.set_data(phi, third_neg)
-        line3c.set_data([phi_s], [source_position])
-        
-        all_pos,all_neg=separateSign(third/16)
-        line4a.set_data(phi, all_pos)
-        line4b.set_data(phi, all_neg)
-        line4c.set_data([phi_s],[source_position]) 
-
-
-        return line1a,line1b,line1c, line2a,line2b,line2c, line3a,line3b,line3c, line4a,line4b,line4c
-        
+    # set up the figure, the axis, and the plot elements we want to animate
+    fig = plt.figure(figsize=(20,10))
+    axes=[]
+    for n in range(4):
+        ax=fig.add_subplot(2,2,n+1,polar=True)
+        ax.set_ylim(0,1.2)
+        ax.set_xlabel('m='+str(n))
+        axes.append(ax)
     
-    # call the animator.  blit=True means only re-draw the parts that have changed.
-    # interval= time between calculations in ms
-    # frames=  each frames iterations, start again
-    anim = animation.FuncAnimation(fig, animate, init_func=init,
-                                   frames=200, interval=20, blit=True)
-
+    anim=animateFrames(fig,[(ax,None) for ax in axes],levels,phi,phi_s,[(ax,1) for ax in axes])
     
     return anim
     
+    
 
 """"""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
 def plotPointSourceDirectivity(step=1000):
@@ -1008,22 +645,16 @@ def plotPointSourceDirectivity(step=1000):
     theta_s=0
     
     #encoding values
-    W=              nullOrder(theta,phi)
-    X,Y,Z=          firstOrder(theta,phi)
-    V,T,R,S,U=      secondOrder(theta,phi)
-    Q,O,M,K,L,N,P=  thirdOrder(theta,phi)
+    Y=encode(theta,phi,3)
     
     #source coefficients
-    W_s =                            nullOrder(theta_s,phi_s)
-    X_s,Y_s,Z_s =                    firstOrder(theta_s,phi_s)
-    V_s,T_s,R_s,S_s,U_s =            secondOrder(theta_s,phi_s)
-    Q_s,O_s,M_s,K_s,L_s,N_s,P_s =    thirdOrder(theta_s,phi_s)
+    Y_s=coefficientCache.get(theta_s,phi_s,3)
     
     #coefficient times encoding functions
-    zero =       (W*W_s)
-    first =      zero+(X*X_s)+(Y*Y_s)+(Z*Z_s)
-    second =     first+(V*V_s)+(T*T_s)+(R*R_s)+(S*S_s)+(U*U_s)
-    third =      second+(Q*Q_s)+(O*O_s)+(M*M_s)+(K*K_s)+(L*L_s)+(N*N_s)+(P*P_s)
+    zero =       Y[:,:1].dot(Y_s[:1])
+    first =      Y[:,:4].dot(Y_s[:4])
+    second =     Y[:,:9].dot(Y_s[:9])
+    third =      Y.dot(Y_s)
 
     # normalize each decoding by the number of channels
     plt.figure()
@@ -30,60 +30,147 @@ Provides utility functions for reading and plotting ambisonics channel values
   
 - Plot differences between python implementation as defined in plotSphericalHarmonics.py
   and scsynth values obtained from the textfile
+
+- Compute per-channel error statistics over a full-sphere grid, with structure:
+      azimuth , elevation , ch0 , ch1 , ...  , chN
+
+- Parsed files are cached next to the text file as a binary .npy sidecar,
+  named after the text file size and modification time:
+      <filepath>.<size>-<mtime_ns>.npy
+  so that opening the same dump again is a memory-mapped load
     
 """""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
 
-import csv
+import glob
+import os
 import matplotlib.pyplot as plt
 import numpy as np
 import plotSphericalHarmonics as psh
 
+def sidecarPath(filepath):
+    """
+    path of the binary cache for the given text file, keyed on its size and modification time
+    """
+    st=os.stat(filepath)
+    return '%s.%d-%d.npy' % (filepath,st.st_size,st.st_mtime_ns)
+
+def loadAmbiCSV(filepath,cache=True):
+    """
+    load a [angle, ch0, ch1, ... chN] text file into a (rows, N+2) float array
+    
+    the whole file is parsed in a single vectorized call; if cache is True, the result is
+    stored in a .npy sidecar and later calls return a read-only memory map of it
+    
+    Parameters:
+        filepath: path to the text file
+        cache: read/write the .npy sidecar (default:True)
+    """
+    if cache:
+        sidecar=sidecarPath(filepath)
+        if os.path.exists(sidecar):
+            return np.load(sidecar,mmap_mode='r')
+
+    # ignore empty trailing fields (lines ending with a delimiter)
+    with open(filepath,'r') as f:
+        firstLine=f.readline()
+    numColumns=len(firstLine.rstrip().rstrip(',').split(','))
+
+    data=np.loadtxt(filepath,delimiter=',',usecols=range(numColumns),dtype=np.float64,ndmin=2)
+
+    if cache:
+        try:
+            # remove sidecars of older versions of the file
+            for old in glob.glob(glob.escape(filepath)+'.*-*.npy'):
+                os.remove(old)
+            tmp=sidecar+'.tmp'
+            with open(tmp,'wb') as f:
+                np.save(f,data)
+            os.replace(tmp,sidecar)
+        except (IOError,OSError):
+            # read-only location: just return the parsed values
+            return data
+        return np.load(sidecar,mmap_mode='r')
+
+    return data
+
+def ambiErrorStats(azimuth,elevation,amb,percentiles=(50,95,99)):
+    """
+    compare scsynth values with the python encoding, for many directions at once
+    
+    the reference coefficients of all directions are computed in a single psh.encode() call;
+    the ambisonics order is deduced from the number of channels in amb
+    
+    Parameters:
+        azimuth: azimuth angles (rads), broadcastable against elevation
+        elevation: elevation angles (rads)
+        amb: scsynth values, (directions, channels) array
+        percentiles: error percentiles to compute (default:(50,95,99))
+    
+    Returns a dictionary of arrays:
+        reference: python values, (directions, channels)
+        error: absolute errors, (directions, channels)
+        max, rms: per-channel maximum and rms errors, (channels,)
+        percentiles: per-channel percentiles, (len(percentiles), channels)
+    """
+    amb=np.asarray(amb,dtype=np.float64)
+    order=int(np.sqrt(amb.shape[1]))-1
+    
+    reference=psh.encode(elevation,azimuth,order)
+    error=np.abs(reference-amb)
+    
+    return {'reference':reference,
+            'error':error,
+            'max':error.max(axis=0),
+            'rms':np.sqrt(np.mean(error**2,axis=0)),
+            'percentiles':np.percentile(error,percentiles,axis=0)}
+
+def ambiErrorGrid(filepaths,percentiles=(50,95,99),plot=True):
+    """
+    compare scsynth values with the python encoding over a grid of directions on the sphere
+    
+    each file follows the structure:
+        azimuth , elevation , ch0 , ch1 , ...  , chN
+    any number of channels (AmbEnc1, AmbEnc2, AmbEnc3) is accepted
+    
+    Parameters:
+        filepaths: path to the text file, or list of paths (e.g. one per elevation)
+        percentiles: error percentiles to compute (default:(50,95,99))
+        plot: plot the error of each channel over the sphere (default:True)
+    
+    Returns the dictionary computed by ambiErrorStats
+    """
+    if isinstance(filepaths,str):
+        filepaths=[filepaths]
+    data=np.concatenate([loadAmbiCSV(f) for f in filepaths])
+    azimuth=data[:,0]
+    elevation=data[:,1]
+    
+    stats=ambiErrorStats(azimuth,elevation,data[:,2:],percentiles)
+    
+    if plot:
+        numChannels=data.shape[1]-2
+        side=int(np.sqrt(numChannels))
+        plt.figure()
+        for n in np.arange(numChannels):
+            plt.subplot(side,side,n+1)
+            plt.scatter(azimuth,elevation,c=stats['error'][:,n],s=2,lw=0)
+            plt.colorbar()
+    
+    return stats
+
 def ambiErrorAzi(filepath):
     
-    azimuth=[];
-    azimuthString=[] # empty list
     numChannels=16;
-    amb=[];
-    ambString=[] # empty list
-    f3=[];
     
     """""""""""""""""""""""""""""
     load file values into python
     """""""""""""""""""""""""""""
 
-    
-    with open(filePath, 'r') as csvfile:
-        reader = csv.reader(csvfile, delimiter=',')
-        for row in reader:
-#            azimuth in first row
-            azimuthString.append(row[0])
-#            ambisonic channels in enxt 16 rows 
-            ambString.append(row[1:numChannels+1])
-
-    """""""""""""""""""""""""""""
-    some casting and array arrangement
-    """""""""""""""""""""""""""""
-    #cast amb into float
-    array=[]    
-    for i in ambString:
-        for j in i:
-            array.append(float(j))
-        amb.append(array)
-        array=[]
-    # traspose in order to plot
-    amb=np.asarray(amb)
-    amb=amb.T
-    
-    # cast azimuth into floats
-    for i in np.arange(len(azimuthString)):
-        azimuth.append(float(azimuthString[i]))
-        
-    # cast values into floats
-    for a in azimuth:
-        f3.append(psh.AmbisonicsThirdOrder(0,float(a)))
-    # traspose in order to plot
-    f3=np.asarray(f3)
-    f3=f3.T
+    data=loadAmbiCSV(filepath)
+    # azimuth in first column
+    azimuth=data[:,0]
+    # python simulated values, all directions at once
+    stats=ambiErrorStats(azimuth,0,data[:,1:numChannels+1])
     
     """""""""""""""""""""""""""""
     plot supercollider values versus python simulated values 
@@ -93,59 +180,27 @@ def ambiErrorAzi(filepath):
     for n in np.arange(numChannels): 
         plt.subplot(4,4,n+1)
         # plot levels
-#        plt.plot(azimuth,f3[n],'b')
-#        plt.plot(azimuth,amb[n],'k')
+#        plt.plot(azimuth,stats['reference'][:,n],'b')
+#        plt.plot(azimuth,data[:,n+1],'k')
         # errors
-        plt.plot(azimuth,abs(np.subtract(f3[n],amb[n])),'r')
+        plt.plot(azimuth,stats['error'][:,n],'r')
 
-    return   
+    return stats   
     
 def ambiErrorEle(filepath):
     
-    elevation=[];
-    elevationString=[] # empty list
     numChannels=16;
-    amb=[];
-    ambString=[] # empty list
-    f3=[];
     
     """""""""""""""""""""""""""""
     load file values into python
     """""""""""""""""""""""""""""
     
-    with open(filePath, 'r') as csvfile:
-        reader = csv.reader(csvfile, delimiter=',')
-        for row in reader:
-#            elevation in first row
-            elevationString.append(row[0])
-#            ambisonic channels in enxt 16 rows 
-            ambString.append(row[1:numChannels+1])
-
-    """""""""""""""""""""""""""""
-    some casting and array arrangement
-    """""""""""""""""""""""""""""
-    #cast amb into float
-    array=[]    
-    for i in ambString:
-        for j in i:
-            array.append(float(j))
-        amb.append(array)
-        array=[]
-    # traspose in order to plot
-    amb=np.asarray(amb)
-    amb=amb.T
-    
-    # cast elevation into floats
-    for i in np.arange(len(elevationString)):
-        elevation.append(float(elevationString[i]))
-        
-    # cast values into floats
-    for a in elevation:
-        f3.append(psh.AmbisonicsThirdOrder(float(a),0))
-    # traspose in order to plot
-    f3=np.asarray(f3)
-    f3=f3.T
-
+    data=loadAmbiCSV(filepath)
+    # elevation in first column
+    elevation=data[:,0]
+    # python simulated values, all directions at once
+    stats=ambiErrorStats(0,elevation,data[:,1:numChannels+1])
+    
     """""""""""""""""""""""""""""
     plot supercollider values versus python simulated values 
     """""""""""""""""""""""""""""
@@ -154,10 +209,10 @@ def ambiErrorEle(filepath):
         plt.subplot(4,4,n+1)
 
         # plot levels
-#        plt.plot(elevation,f3[n],'b')
-#        plt.plot(elevation,amb[n],'k')
+#        plt.plot(elevation,stats['reference'][:,n],'b')
+#        plt.plot(elevation,data[:,n+1],'k')
         # errors
-        plt.plot(elevation,abs(np.subtract(f3[n],amb[n])),'r')
+        plt.plot(elevation,stats['error'][:,n],'r')
 
-    return   
+    return stats   
 
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+
+Copyright ANDRÉS PÉREZ LÓPEZ, January 2014
+contact@andresperezlopez.com
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+            SHAPE ENCODERS
+
+Batched ports of the source shape encoders in Extensions/Ambisonics:
+    ringEncode          AmbREnc     horizontal ring at a given elevation
+    semiMeridianEncode  AmbSMEnc    half meridian from nadir to zenith, at a given azimuth
+                        AmbSMrEnc   (upper=True) quarter meridian from horizon to zenith
+    meridianEncode      AmbMEnc     full meridian through the given azimuth
+                        AmbMrEnc    (upper=True) half meridian from horizon to horizon, over the zenith
+    extendedEncode      AmbXEnc     spherical rectangle of size da x de around a direction
+
+all of them are averages of the point source encoding (plotSphericalHarmonics.encode)
+over their shape: uniform along the arcs, weighted by area for the extended source.
+Every shape is separable in azimuth and elevation, so each coefficient is
+    (elevation factor of n,|m|) * (cos(m*a) or sin(|m|*a)) * sinc(|m|*da/2)
+where the elevation factors only depend on the elevation range: they are computed
+with Gauss-Legendre quadrature (exact to double precision up to high orders) and cached
+per range, so that only new spread values are integrated.
+
+as in the SuperCollider classes, angles are in radians, channels in ACN order, N3D normalization
+
+"""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+import numpy as np
+import plotSphericalHarmonics as psh
+
+
+# same as AmbXEnc.delta: zero lengths are replaced by this value
+DELTA=0.001
+
+# elevation factors, by (order, weighted, start, end)
+_elevationFactors={}
+ELEVATION_CACHE_SIZE=65536
+
+def quadrature(order):
+    """
+    Gauss-Legendre nodes and weights on [-1,1], enough to integrate order n harmonics exactly
+    """
+    return np.polynomial.legendre.leggauss(order+12)
+
+def elevationFactors(start,end,order=3,weighted=False):
+    """
+    (N, channels) mean of the m>=0 harmonics at azimuth 0 over elevations [start,end],
+    uniform along the arc or, if weighted, by area (cos(elevation));
+    the m<0 columns are left undefined
+
+    distinct (start,end) pairs are integrated once, and then kept in a cache
+    """
+    start,end=np.broadcast_arrays(np.asarray(start,dtype=np.float64),np.asarray(end,dtype=np.float64))
+    ranges=np.column_stack((start.ravel(),end.ravel()))
+    unique,inverse=np.unique(np.round(ranges,12),axis=0,return_inverse=True)
+    inverse=inverse.ravel()
+    keys=[(order,weighted,s,e) for s,e in unique.tolist()]
+    missing=[i for i,key in enumerate(keys) if key not in _elevationFactors]
+
+    if missing:
+        if len(_elevationFactors)+len(missing)>ELEVATION_CACHE_SIZE:
+            _elevationFactors.clear()
+        x,w=quadrature(order)
+        s,e=unique[missing,0],unique[missing,1]
+        t=(s+e)[:,None]/2.+(e-s)[:,None]/2.*x[None,:]
+        weights=np.broadcast_to(w,t.shape)*(np.cos(t) if weighted else 1.)
+        Y=psh.encode(t,0.,order).reshape(t.shape+(-1,))
+        factors=np.einsum('nk,nkc->nc',weights,Y)/weights.sum(axis=1)[:,None]
+        for i,row in zip(missing,factors):
+            _elevationFactors[keys[i]]=row
+
+    table=np.array([_elevationFactors[key] for key in keys]).reshape(len(keys),-1)
+    return table[inverse]
+
+def applyAzimuth(E,azimuth,width,order):
+    """
+    combine elevation factors with the mean of cos(m*a'), sin(m*a') over [azimuth-width/2, azimuth+width/2]
+    """
+    azimuth,width=np.broadcast_arrays(np.asarray(azimuth,dtype=np.float64),np.asarray(width,dtype=np.float64))
+    azimuth=azimuth.ravel()
+    width=width.ravel()
+    Y=np.empty((E.shape[0],psh.numChannels(order)))
+    for n in range(order+1):
+        Y[:,psh.acn(n,0)]=E[:,psh.acn(n,0)]
+    for m in range(1,order+1):
+        # sin(x)/x, with x=m*width/2
+        spread=np.sinc(m*width/(2*np.pi))
+        c=np.cos(m*azimuth)*spread
+        s=np.sin(m*azimuth)*spread
+        for n in range(m,order+1):
+            Y[:,psh.acn(n,m)]=E[:,psh.acn(n,m)]*c
+            Y[:,psh.acn(n,-m)]=E[:,psh.acn(n,m)]*s
+    return Y
+
+def _shape(*args):
+    return np.broadcast(*[np.asarray(a) for a in args]).size
+
+def ringEncode(elevation,order=3):
+    """
+    AmbREnc: (N, channels) coefficients of horizontal rings at the given elevations
+    """
+    elevation=np.asarray(elevation,dtype=np.float64)
+    return applyAzimuth(elevationFactors(elevation,elevation,order),0.,2*np.pi,order)
+
+def semiMeridianEncode(azimuth,order=3,upper=False):
+    """
+    AmbSMEnc: (N, channels) coefficients of half meridians from nadir to zenith at the given azimuths;
+    upper=True for AmbSMrEnc, quarter meridians from the horizon to the zenith
+    """
+    n=_shape(azimuth)
+    start=0. if upper else -np.pi/2
+    E=elevationFactors(np.full(n,start),np.full(n,np.pi/2),order)
+    return applyAzimuth(E,azimuth,0.,order)
+
+def meridianEncode(azimuth,order=3,upper=False):
+    """
+    AmbMEnc: (N, channels) coefficients of full meridians through the given azimuths;
+    upper=True for AmbMrEnc, half meridians from the horizon at azimuth to the opposite one
+
+    elevations beyond pi/2 are the other side of the meridian, at azimuth+pi
+    """
+    n=_shape(azimuth)
+    start,end=(0.,np.pi) if upper else (-np.pi/2,3*np.pi/2)
+    E=elevationFactors(np.full(n,start),np.full(n,end),order)
+    return applyAzimuth(E,azimuth,0.,order)
+
+def extendedEncode(azimuth,dAzimuth,elevation,dElevation,preserveArea=False,order=3):
+    """
+    AmbXEnc: (N, channels) coefficients of extended sources covering
+    [azimuth-dAzimuth/2, azimuth+dAzimuth/2] x [elevation-dElevation/2, elevation+dElevation/2]
+
+    all parameters are broadcasted against each other; the preprocessing is the same
+    as in AmbXEnc: zero lengths are replaced by DELTA, the elevation is limited so that
+    the shape does not go over the poles, and with preserveArea the azimuth length is
+    scaled by 1/cos(elevation), overflowing into the elevation length beyond 2*pi
+    """
+    a,da,e,de,preserve=[x.ravel() for x in np.broadcast_arrays(
+        *[np.asarray(v,dtype=np.float64) for v in (azimuth,dAzimuth,elevation,dElevation,preserveArea)])]
+
+    # nonZeroLengths, limitElevation, preserveArea
+    da=np.where(da==0,DELTA,da)
+    de=np.where(de==0,DELTA,de)
+    e=np.maximum(np.minimum(e,np.pi/2-de/2),-np.pi/2+de/2)
+    preserve=preserve!=0
+    da=np.where(preserve,da/np.cos(e),da)
+    excess=preserve&(da>2*np.pi)
+    de=np.where(excess,de*da/(2*np.pi),de)
+    da=np.where(excess,2*np.pi,da)
+    e=np.where(excess,np.maximum(np.minimum(e,np.pi/2-de/2),-np.pi/2+de/2),e)
+
+    E=elevationFactors(e-de/2,e+de/2,order,weighted=True)
+    return applyAzimuth(E,a,da,order)
@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+"""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+
+Copyright ANDRÉS PÉREZ LÓPEZ, January 2014
+contact@andresperezlopez.com
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+            SPATDIF TRAJECTORY SIMPLIFICATION
+
+Remove the redundant position messages of SpatDIF logs, keeping every trajectory within
+an angular and a distance tolerance of the original one
+
+- each entity trajectory (the /spatdif/<kind>/<name>/position ... aed messages) is simplified
+  by comparing the dropped messages with the position the receiver would have at their times:
+  with 'hold', in a single forward pass, keeping each message which leaves the tolerances
+  of the held one (the held position does not depend on the next message);
+  with 'linear', Douglas-Peucker style: between two kept messages, the one furthest away,
+  if beyond the tolerances, is kept and both halves are simplified again
+- the position between kept messages depends on the receiver (interpolation):
+      'hold'    the last received position, as SpatialRender and offlineRender do (default)
+      'linear'  the great circle arc between both directions (and the distance line),
+                at constant speed in time, for interpolating players
+- angular errors are great circle distances in degrees, distance errors in meters
+- every other message is kept, in the same order; blocks left without messages are removed
+
+command line usage:
+    python simplifySpatDif.py TimeFileLog.txt simplified.txt --angle 1 --distance 0.1
+
+"""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+import os
+import numpy as np
+import spatDif
+from spatDifArchive import isPosition,positionAddress
+from vbap import cartesian
+
+
+INTERPOLATIONS=('hold','linear')
+
+def _angles(u,v):
+    """
+    great circle distance in degrees between (N, 3) unit vectors
+    """
+    cross=np.cross(u,v)
+    return np.degrees(np.arctan2(np.sqrt(np.einsum('ij,ij->i',cross,cross)),np.einsum('ij,ij->i',u,v)))
+
+def reconstruct(times,directions,distance,i,j,k,interpolation='hold'):
+    """
+    directions and distances the receiver has at the times of the messages k (array),
+    having received the messages i and j only
+    """
+    if interpolation=='hold':
+        return np.broadcast_to(directions[i],(len(k),3)),np.broadcast_to(distance[i],(len(k),))
+    span=times[j]-times[i]
+    f=(times[k]-times[i])/span if span>0 else np.zeros(len(k))
+    u,v=directions[i],directions[j]
+    omega=np.arctan2(np.sqrt((np.cross(u,v)**2).sum()),u.dot(v))
+    if omega<1e-9:
+        d=np.broadcast_to(u,(len(k),3))
+    elif omega>np.pi-1e-9:
+        # antipodal directions: no single arc, the path is unknown
+        d=np.full((len(k),3),np.nan)
+    else:
+        d=(np.sin((1-f)*omega)[:,None]*u+np.sin(f*omega)[:,None]*v)/np.sin(omega)
+    return d,distance[i]+f*(distance[j]-distance[i])
+
+def simplifyTrajectory(times,azimuth,elevation,distance,angularTolerance=1.,distanceTolerance=0.1,
+                       interpolation='hold'):
+    """
+    boolean mask of the position messages to keep
+
+    Parameters:
+        times: (N,) message times, non decreasing
+        azimuth, elevation: (N,) directions in degrees
+        distance: (N,) distances
+        angularTolerance: maximum great circle error in degrees (default:1)
+        distanceTolerance: maximum distance error (default:0.1)
+        interpolation: 'hold' or 'linear', see the module description
+    """
+    if interpolation not in INTERPOLATIONS:
+        raise ValueError('unknown interpolation %s, should be one of %s' % (interpolation,', '.join(INTERPOLATIONS)))
+    times=np.asarray(times,dtype=np.float64)
+    distance=np.asarray(distance,dtype=np.float64)
+    directions=cartesian(azimuth,elevation)
+    n=len(times)
+    keep=np.zeros(n,dtype=bool)
+    keep[:1]=True
+    keep[-1:]=True
+    angularTolerance=max(angularTolerance,1e-12)
+    distanceTolerance=max(distanceTolerance,1e-12)
+
+    if interpolation=='hold':
+        _holdPass(directions,distance,keep,angularTolerance,distanceTolerance)
+        return keep
+
+    stack=[(0,n-1)]
+    while stack:
+        i,j=stack.pop()
+        if j-i<2:
+            continue
+        k=np.arange(i+1,j)
+        d,r=reconstruct(times,directions,distance,i,j,k,interpolation)
+        score=np.maximum(_angles(directions[k],d)/angularTolerance,np.abs(distance[k]-r)/distanceTolerance)
+        score[np.isnan(score)]=np.inf
+        m=int(np.argmax(score))
+        if score[m]>1.:
+            keep[k[m]]=True
+            stack.append((i,k[m]))
+            stack.append((k[m],j))
+    return keep
+
+# chunk sizes of the 'hold' forward pass
+MIN_CHUNK=16
+MAX_CHUNK=4096
+
+def _holdPass(directions,distance,keep,angularTolerance,distanceTolerance):
+    """
+    greedy forward pass for 'hold': the held position only depends on the last kept message,
+    so the first message beyond the tolerances is the next one to keep
+
+    messages are compared in chunks, whose size follows the distance between kept messages,
+    so that the whole trajectory costs O(n) vectorized work; angles are compared through
+    the chord between both unit vectors, 2*sin(angle/2), which is accurate for small tolerances
+    """
+    n=len(distance)
+    chord=(2*np.sin(np.radians(min(angularTolerance,180.))/2))**2
+    held=0
+    start=1
+    chunk=MIN_CHUNK
+    while start<n-1:
+        end=min(start+chunk,n-1)
+        delta=directions[start:end]-directions[held]
+        beyond=np.flatnonzero(((delta*delta).sum(axis=1)>chord)|
+                              (np.abs(distance[start:end]-distance[held])>distanceTolerance))
+        if len(beyond):
+            held=start+int(beyond[0])
+            keep[held]=True
+            chunk=min(MAX_CHUNK,max(MIN_CHUNK,2*(int(beyond[0])+1)))
+            start=held+1
+        else:
+            chunk=min(MAX_CHUNK,2*chunk)
+            start=end
+
+def trajectoryError(times,azimuth,elevation,distance,keep,interpolation='hold'):
+    """
+    (angular, distance) errors of every message of a simplified trajectory
+    """
+    times=np.asarray(times,dtype=np.float64)
+    distance=np.asarray(distance,dtype=np.float64)
+    directions=cartesian(azimuth,elevation)
+    kept=np.flatnonzero(keep)
+    if interpolation=='hold':
+        # every message against the last kept one
+        held=kept[np.searchsorted(kept,np.arange(len(times)),side='right')-1]
+        return _angles(directions,directions[held]),np.abs(distance-distance[held])
+    angular=np.zeros(len(times))
+    radial=np.zeros(len(times))
+    for i,j in zip(kept[:-1],kept[1:]):
+        k=np.arange(i+1,j)
+        if len(k):
+            d,r=reconstruct(times,directions,distance,i,j,k,interpolation)
+            angular[k]=_angles(directions[k],d)
+            radial[k]=np.abs(distance[k]-r)
+    return angular,radial
+
+def _positions(logpath):
+    """
+    (times, azimuth, elevation, distance) arrays of every entity with aed position messages
+    """
+    columns={}
+    for time,commands in spatDif.SpatDifReader(logpath,cache=False).blocks():
+        if time is None:
+            continue
+        for command in commands:
+            if isPosition(command):
+                columns.setdefault(command[0],[]).append((time,command[1],command[2],command[3]))
+    return dict((address,np.array(values).T) for address,values in columns.items())
+
+def simplifyLog(inpath,outpath,angularTolerance=1.,distanceTolerance=0.1,interpolation='hold'):
+    """
+    write a simplified copy of a SpatDIF log; returns a dictionary of statistics:
+    messages, positions and blocks before and after, file sizes, and the maximum errors
+
+    the log is read twice, so that only the positions are kept in memory;
+    positions logged before the first /spatdif/time line are always kept
+    """
+    keep={}
+    stats={'angularError':0.,'distanceError':0.,'entities':{}}
+    for address,(times,azimuth,elevation,distance) in _positions(inpath).items():
+        mask=simplifyTrajectory(times,azimuth,elevation,distance,angularTolerance,distanceTolerance,interpolation)
+        angular,radial=trajectoryError(times,azimuth,elevation,distance,mask,interpolation)
+        keep[address]=mask
+        stats['entities'][positionAddress.match(address).group(2)]=(len(mask),int(mask.sum()))
+        stats['angularError']=max(stats['angularError'],float(angular.max()))
+        stats['distanceError']=max(stats['distanceError'],float(radial.max()))
+
+    counters=dict.fromkeys(('messagesIn','messagesOut','positionsIn','positionsOut','blocksIn','blocksOut'),0)
+    def blocks(reader):
+        positions=dict.fromkeys(keep,0)
+        for time,commands in reader.blocks():
+            counters['blocksIn']+=1
+            counters['messagesIn']+=len(commands)
+            kept=[]
+            for command in commands:
+                if time is not None and command[0] in keep and isPosition(command):
+                    counters['positionsIn']+=1
+                    n=positions[command[0]]
+                    positions[command[0]]=n+1
+                    if not keep[command[0]][n]:
+                        continue
+                    counters['positionsOut']+=1
+                kept.append(command)
+            if kept:
+                counters['blocksOut']+=1
+                counters['messagesOut']+=len(kept)
+                yield time,kept
+
+    reader=spatDif.SpatDifReader(inpath,cache=False)
+    spatDif.writeLog(outpath,reader.meta,blocks(reader))
+
+    stats.update(counters)
+    stats['bytesIn']=os.path.getsize(inpath)
+    stats['bytesOut']=os.path.getsize(outpath)
+    stats['ratio']=stats['messagesIn']/float(max(stats['messagesOut'],1))
+    return stats
+
+
+if __name__=='__main__':
+    import argparse
+    parser=argparse.ArgumentParser(description='remove redundant position messages from a SpatDIF log')
+    parser.add_argument('inpath')
+    parser.add_argument('outpath')
+    parser.add_argument('--angle',type=float,default=1.,help='angular tolerance in degrees')
+    parser.add_argument('--distance',type=float,default=0.1,help='distance tolerance')
+    parser.add_argument('--interpolation',choices=INTERPOLATIONS,default='hold')
+    args=parser.parse_args()
+    stats=simplifyLog(args.inpath,args.outpath,args.angle,args.distance,args.interpolation)
+    print('messages: %d -> %d (%.1fx), positions: %d -> %d, blocks: %d -> %d, bytes: %d -> %d'
+          % (stats['messagesIn'],stats['messagesOut'],stats['ratio'],stats['positionsIn'],stats['positionsOut'],
+             stats['blocksIn'],stats['blocksOut'],stats['bytesIn'],stats['bytesOut']))
+    print('maximum errors: %.3f degrees, %.3f' % (stats['angularError'],stats['distanceError']))
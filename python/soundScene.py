@@ -0,0 +1,600 @@
+# -*- coding: utf-8 -*-
+"""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+
+Copyright ANDRÉS PÉREZ LÓPEZ, January 2014
+contact@andresperezlopez.com
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+            SOUND SCENE
+
+Python port of the Scene Simulator (SSWorld, SSObject and Motion.sc) for scenes with
+thousands of objects, which writes their trajectories as SpatDIF logs
+
+- the state of all objects is kept in contiguous arrays (struct of arrays):
+      loc, vel, accel, regLoc    (objects, 3) cartesian, in meters
+      mass, gravity, friction    (objects,)
+      motion                     (objects,) index in MOTIONS
+  plus one array per motion parameter, so that SoundScene.step() advances every
+  object with a few array operations per motion type, instead of one call per object
+
+- motions, with the same arguments and step rules as in Motion.sc:
+      static    vel+=accel, loc+=vel, accel=0
+      rect      (vel) vel+=accel, loc+=vel/stepFreq, accel=0
+      random    (maxValue=1, period=1 s) new random vel and accel every period
+      brown     (step=0.01) independent brownian walks per axis, folded into the world
+      shm       (amp=[1,1,1], T=[1,1,1]) loc=center+amp*sin(2pi*t/T)
+      orbit     (angularVel=1, dir='dex') rotation around the z axis
+  gravity and friction are applied before the motion, as SSObject.update does
+
+- after the motions, objects outside the world are reflected back into it, with their
+  velocity inverted and damped, as SSWorld.contain; this is a single clamp/reflect over
+  the (objects, 3) arrays
+
+- with collide=True, objects closer than the sum of their sizes bounce on each other
+  (bottom-up scenes): close pairs are found with a uniform grid (SpatialHash), whose
+  cells are as large as the largest interaction distance, so that each object is only
+  compared with the objects in its own and neighbour cells, in O(objects) time
+
+- as SSWorld.update, a position message is only sent when the difference with the
+  last sent position exceeds rDiff, aziDiff or eleDiff; the messages of each step
+  are yielded by SoundScene.blocks() in the format of spatDif.writeLog()
+
+usage:
+    scene=SoundScene()
+    scene.addObjects(10000,loc=np.random.uniform(-5,5,(10000,3)))
+    scene.setMotion(slice(None),'orbit',0.5,'lev')
+    scene.writeLog('TimeFileLog.txt',duration=60)
+
+"""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+import numpy as np
+import spatDif
+
+
+MOTIONS=('static','rect','random','brown','shm','orbit')
+
+# SSWorld defaults
+DIM=(10.,10.,5.)
+GRAVITY=(0.,0.,0.98)
+MAX_VEL=100.
+DAMPING=0.25
+FRICTION=0.01
+STEP_FREQ=60
+R_DIFF=0.05
+AZI_DIFF=np.radians(1.)
+ELE_DIFF=np.radians(5.)
+SWEET_SPOT_SIZE=2.
+
+# SSObject size of point shapes
+POINT_SIZE=0.05
+
+# Shm.initShm: periods not greater than 0 are replaced by this value
+MIN_PERIOD=0.0000001
+
+def fold(x,lo,hi,out=None):
+    """
+    SimpleNumber.fold: reflect x back into [lo, hi] as many times as needed
+    """
+    x,lo,hi=np.broadcast_arrays(x,lo,hi)
+    r=hi-lo
+    with np.errstate(invalid='ignore',divide='ignore'):
+        m=np.mod(x-lo,2*r)
+    m=np.where(m>r,2*r-m,m)
+    return np.add(np.where(r>0,m,0.),lo,out=out)
+
+OFFSETS=np.array([(i,j,k) for i in (-1,0,1) for j in (-1,0,1) for k in (-1,0,1)])
+# neighbour cells to test for pairs: the cell itself and the half of the rest with a positive
+# first nonzero offset, so that every pair of cells is only visited once
+HALF_OFFSETS=np.array([o for o in OFFSETS if not o.any() or o[np.flatnonzero(o)[0]]>0])
+
+def spherical(xyz):
+    """
+    rho, azimuth and elevation (radians) of (N, 3) cartesian vectors, as Cartesian.asSpherical
+    """
+    x,y,z=xyz[:,0],xyz[:,1],xyz[:,2]
+    rhoXY=np.hypot(x,y)
+    return np.hypot(rhoXY,z),np.arctan2(y,x),np.arctan2(z,rhoXY)
+
+
+class SpatialHash(object):
+    """
+    uniform grid over a set of points, for neighbour queries in O(points) time
+
+    the points are sorted by the key of their cell, and each occupied cell is
+    a contiguous range of that order; queries look for the keys of the neighbour cells
+    with a binary search, so the grid size is not limited by the world size
+
+    Parameters:
+        points: (N, 3) positions
+        cellSize: grid cell size, not smaller than the largest query radius
+
+    usage:
+        grid=SpatialHash(scene.loc,0.5)
+        i,j=grid.pairs(0.5) # every pair of points closer than 0.5, with i<j
+    """
+    def __init__(self,points,cellSize):
+        self.points=np.asarray(points,dtype=np.float64)
+        self.cellSize=float(cellSize)
+        self.cells=np.floor(self.points/self.cellSize).astype(np.int64)
+        # keys of the cells, with room for the neighbours of the border cells
+        self._origin=self.cells.min(axis=0)-1 if len(self.points) else np.zeros(3,dtype=np.int64)
+        self._shape=(self.cells.max(axis=0)-self._origin+2) if len(self.points) else np.ones(3,dtype=np.int64)
+        keys=self.key(self.cells)
+        self.order=np.argsort(keys,kind='stable')
+        self._sortedKeys=keys[self.order]
+        self.keys,self.starts,self.counts=np.unique(self._sortedKeys,return_index=True,return_counts=True)
+
+    def key(self,cells):
+        """
+        key of the given cells, -1 for cells outside the grid
+        """
+        c=cells-self._origin
+        inside=((c>=0)&(c<self._shape)).all(axis=-1)
+        return np.where(inside,(c[...,0]*self._shape[1]+c[...,1])*self._shape[2]+c[...,2],-1)
+
+    def _offsetKey(self,offset):
+        # keys are linear in the cell coordinates
+        return (offset[0]*self._shape[1]+offset[1])*self._shape[2]+offset[2]
+
+    def _candidates(self,keys):
+        """
+        (query, point) index pairs of the points in the cells of the given keys
+        """
+        position=np.minimum(np.searchsorted(self.keys,keys),len(self.keys)-1)
+        query=np.flatnonzero(self.keys[position]==keys)
+        starts=self.starts[position[query]]
+        counts=self.counts[position[query]]
+        # positions in self.order of every point of every found cell
+        within=np.arange(counts.sum())-np.repeat(np.cumsum(counts)-counts,counts)
+        return np.repeat(query,counts),self.order[np.repeat(starts,counts)+within]
+
+    def pairs(self,radius):
+        """
+        (i, j) arrays of the indices of every pair of points closer than radius, with i<j;
+        radius can also be an (N,) array of per point radii, pairs being closer than the sum of theirs
+        """
+        if len(self.points)<2:
+            return np.zeros(0,dtype=np.int64),np.zeros(0,dtype=np.int64)
+        radius=np.asarray(radius,dtype=np.float64)
+        I,J=[],[]
+        for offset in HALF_OFFSETS:
+            # the grid has a margin of one cell, so neighbour keys are always valid;
+            # queries in key order make the binary searches much faster
+            i,j=self._candidates(self._sortedKeys+self._offsetKey(offset))
+            i=self.order[i]
+            if not offset.any():
+                keep=i<j
+                i,j=i[keep],j[keep]
+            else:
+                i,j=np.minimum(i,j),np.maximum(i,j)
+            d=self.points[j]-self.points[i]
+            limit=radius[i]+radius[j] if radius.ndim else radius
+            close=np.einsum('ij,ij->i',d,d)<limit**2
+            I.append(i[close])
+            J.append(j[close])
+        return np.concatenate(I),np.concatenate(J)
+
+    def neighbours(self,point,radius):
+        """
+        indices of the points closer than radius to the given position
+        """
+        point=np.asarray(point,dtype=np.float64)
+        cells=np.floor(point/self.cellSize).astype(np.int64)+OFFSETS
+        found=self._candidates(self.key(cells))[1]
+        d=self.points[found]-point
+        return np.sort(found[np.einsum('ij,ij->i',d,d)<radius**2])
+
+
+class SoundScene(object):
+    """
+    vectorized SSWorld
+
+    Parameters:
+        dim: world size [x, y, z] in meters; x and y are centered, z goes from 0 to dim[2] (default:[10,10,5])
+        gravity: gravity acceleration vector (default:[0,0,0.98])
+        maxVel, damping: as SSWorld (default:100, 0.25)
+        friction: velocity loss per step of the objects with friction (default:0.01)
+        stepFreq: steps per second (default:60)
+        sweetSpotSize: minimum distance sent in position messages (default:2)
+        seed: seed of the random, brownian motions
+        collide: make close objects bounce on each other (default:False)
+
+    usage:
+        scene=SoundScene(seed=0)
+        first=scene.addObjects(1000)
+        scene.setMotion(np.arange(first,first+1000),'brown',0.005)
+        for time,commands in scene.blocks(600):
+            ...
+    """
+    # array name: (columns, dtype, initial value)
+    FIELDS={
+        'loc':(3,np.float64,0.),
+        'vel':(3,np.float64,0.),
+        'accel':(3,np.float64,0.),
+        'regLoc':(3,np.float64,0.),
+        'mass':(0,np.float64,1.),
+        'size':(0,np.float64,POINT_SIZE),
+        'hasGravity':(0,bool,False),
+        'hasFriction':(0,bool,False),
+        'channel':(0,np.int64,0),
+        'motion':(0,np.int8,0),
+        'maxValue':(0,np.float64,1.),       # random
+        'period':(0,np.int64,1),            # random, in steps
+        'count':(0,np.int64,0),             # random, shm
+        'brownStep':(0,np.float64,0.01),    # brown
+        'brownLoc':(3,np.float64,0.),       # brown
+        'amp':(3,np.float64,1.),            # shm
+        'T':(3,np.float64,1.),              # shm
+        'center':(3,np.float64,0.),         # shm
+        'angularVel':(0,np.float64,1.),     # orbit
+        'direction':(0,np.float64,-1.),     # orbit: 1 lev, -1 dex
+    }
+
+    def __init__(self,dim=DIM,gravity=GRAVITY,maxVel=MAX_VEL,damping=DAMPING,friction=FRICTION,
+                 stepFreq=STEP_FREQ,sweetSpotSize=SWEET_SPOT_SIZE,seed=None,collide=False):
+        self.dim=np.array(dim,dtype=np.float64)
+        self.gravity=np.array(gravity,dtype=np.float64)
+        self.maxVel=maxVel
+        self.damping=damping
+        self.friction=friction
+        self.stepFreq=stepFreq
+        self.sweetSpotSize=sweetSpotSize
+        self.rDiff=R_DIFF
+        self.aziDiff=AZI_DIFF
+        self.eleDiff=ELE_DIFF
+        self.random=np.random.default_rng(seed)
+        self.collide=collide
+        self.numObjects=0
+        self.numSteps=0
+        self.names=[]
+        self._nameSet=set()
+        self._addresses=[]
+        self._pending=[]
+        self._allocate(0)
+
+    def _allocate(self,capacity):
+        """
+        (re)allocate the object arrays with room for capacity objects, keeping their contents
+        """
+        self._capacity=capacity
+        for name,(columns,dtype,value) in self.FIELDS.items():
+            shape=(capacity,columns) if columns else (capacity,)
+            array=np.full(shape,value,dtype=dtype)
+            old=self.__dict__.get('_'+name)
+            if old is not None:
+                array[:self.numObjects]=old[:self.numObjects]
+            self.__dict__['_'+name]=array
+
+    def __getattr__(self,name):
+        # views of the object arrays, e.g. scene.loc is (numObjects, 3)
+        if name in SoundScene.FIELDS:
+            return self.__dict__['_'+name][:self.numObjects]
+        raise AttributeError(name)
+
+    def addObjects(self,n,loc=0.,vel=0.,accel=0.,mass=1.,gravity=False,friction=False,names=None,channels=None,
+                   size=POINT_SIZE):
+        """
+        add n objects with static motion, as SSObject.new; all parameters are broadcasted
+        to the n objects; returns the index of the first one
+
+        default names and channels are the object indices, as in SSWorld.add
+        (with a * appended if the name is already used)
+        """
+        first=self.numObjects
+        if first+n>self._capacity:
+            self._allocate(max(first+n,2*self._capacity,64))
+        self.numObjects=first+n
+        new=slice(first,first+n)
+        self.loc[new]=loc
+        self.vel[new]=vel
+        self.accel[new]=accel
+        self.regLoc[new]=self.loc[new]
+        self.mass[new]=mass
+        self.size[new]=size
+        self.hasGravity[new]=gravity
+        self.hasFriction[new]=friction
+        self.channel[new]=np.arange(first,first+n) if channels is None else channels
+        self.motion[new]=0
+
+        for i in range(n):
+            name=None if names is None else str(names[i])
+            if name is None or name in self._nameSet:
+                name=str(first+i)
+                if name in self._nameSet:
+                    name+='*'
+            self.names.append(name)
+            self._nameSet.add(name)
+            source='/spatdif/source/'+name
+            self._addresses.append(source+'/position')
+            self._pending.append(['/spatdifcmd/addEntity',name])
+            self._pending.append([source+'/media/type','jack'])
+            self._pending.append([source+'/media/channel',int(self.channel[first+i])])
+        self._pending.extend(self.positionCommands(np.arange(first,first+n)))
+        return first
+
+    def addObject(self,loc=0.,vel=0.,accel=0.,mass=1.,gravity=False,friction=False,name=None,channel=None,
+                  size=POINT_SIZE):
+        """
+        add a single object, see addObjects(); returns its index
+        """
+        return self.addObjects(1,loc,vel,accel,mass,gravity,friction,
+                               None if name is None else [name],None if channel is None else [channel],size)
+
+    def setMotion(self,indices,motionType='static',*args):
+        """
+        set the motion of the given objects, with the arguments of SSObject.setMotion
+        (broadcasted to all of them):
+            'static'
+            'rect', [vel]             added to the current velocity
+            'random', [maxValue, period]   period in seconds
+            'brown', [step]           fraction of the world size
+            'shm', [[ampX,ampY,ampZ], [TX,TY,TZ]]
+            'orbit', [angularVel, 'lev'|'dex']
+        """
+        if motionType not in MOTIONS:
+            raise ValueError('unknown motion %s, should be one of %s' % (motionType,', '.join(MOTIONS)))
+        indices=np.arange(self.numObjects)[indices]
+        self.motion[indices]=MOTIONS.index(motionType)
+
+        if motionType=='rect':
+            if args:
+                self.vel[indices]+=np.asarray(args[0],dtype=np.float64)
+        elif motionType=='random':
+            self.maxValue[indices]=args[0] if args else 1.
+            seconds=args[1] if len(args)>1 else 1.
+            # whole steps, so that the countdown always reaches 0
+            self.period[indices]=np.maximum(np.rint(np.asarray(seconds)*self.stepFreq),1)
+            self.count[indices]=0
+        elif motionType=='brown':
+            self.brownStep[indices]=args[0] if args else 0.01
+            # Pbrown starts at a random value in the range
+            lo,hi=self.bounds()
+            self.brownLoc[indices]=self.random.uniform(lo,hi,(len(indices),3))
+        elif motionType=='shm':
+            self.amp[indices]=args[0] if args else 1.
+            T=np.array(np.broadcast_to(args[1] if len(args)>1 else 1.,(len(indices),3)),dtype=np.float64)
+            self.T[indices]=np.where(T<=0,MIN_PERIOD,T)
+            self.center[indices]=self.loc[indices]
+            self.count[indices]=0
+        elif motionType=='orbit':
+            self.angularVel[indices]=args[0] if args else 1.
+            directions=np.broadcast_to(np.asarray(args[1] if len(args)>1 else 'dex'),(len(indices),))
+            self.direction[indices]=np.where(directions=='lev',1.,-1.)
+
+    def bounds(self):
+        """
+        lower and upper world limits: x and y centered, z from 0
+        """
+        lo=np.array([-self.dim[0]/2,-self.dim[1]/2,0.])
+        hi=np.array([self.dim[0]/2,self.dim[1]/2,self.dim[2]])
+        return lo,hi
+
+    @property
+    def time(self):
+        return self.numSteps/float(self.stepFreq)
+
+    """""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+    # SIMULATION
+    """""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+
+    def _objectsOf(self,motionType):
+        return np.flatnonzero(self.motion==MOTIONS.index(motionType))
+
+    def step(self):
+        """
+        advance every object one step (1/stepFreq seconds), as SSWorld.update;
+        returns the indices of the objects whose position has to be sent
+        """
+        step=float(self.stepFreq)
+        loc,vel,accel=self.loc,self.vel,self.accel
+
+        # SSObject.update
+        g=np.flatnonzero(self.hasGravity)
+        if len(g):
+            accel[g]+=self.gravity[None,:]/step/self.mass[g][:,None]
+        vel[self.hasFriction]*=1-self.friction
+
+        i=self._objectsOf('static')
+        if len(i):
+            vel[i]+=accel[i]
+            loc[i]+=vel[i]
+            accel[i]=0.
+
+        i=self._objectsOf('rect')
+        if len(i):
+            vel[i]+=accel[i]
+            loc[i]+=vel[i]/step
+            accel[i]=0.
+
+        i=self._objectsOf('random')
+        if len(i):
+            count=self.count
+            new=i[count[i]==0]
+            if len(new):
+                m=self.maxValue[new][:,None]
+                vel[new]=self.random.uniform(-1.,1.,(len(new),3))*m
+                accel[new]=self.random.uniform(-1.,1.,(len(new),3))*m
+                count[new]=self.period[new]
+            vel[i]+=accel[i]
+            loc[i]+=vel[i]/step
+            count[i]-=1
+
+        i=self._objectsOf('brown')
+        if len(i):
+            lo,hi=self.bounds()
+            brown=self.brownLoc
+            loc[i]=brown[i]
+            stepSize=self.brownStep[i][:,None]*self.dim[None,:]
+            brown[i]=fold(brown[i]+self.random.uniform(-1.,1.,(len(i),3))*stepSize,lo,hi)
+
+        i=self._objectsOf('shm')
+        if len(i):
+            count=self.count
+            phase=2*np.pi*count[i][:,None]/(self.T[i]*step)
+            loc[i]=self.center[i]+self.amp[i]*np.sin(phase)
+            count[i]+=1
+
+        i=self._objectsOf('orbit')
+        if len(i):
+            w=self.angularVel[i]*self.direction[i]
+            angle=w/step
+            c,s=np.cos(angle),np.sin(angle)
+            x,y=loc[i,0],loc[i,1]
+            loc[i,0],loc[i,1]=c*x-s*y,s*x+c*y
+            vel[i,0]=-w*loc[i,1]
+            vel[i,1]=w*loc[i,0]
+
+        self.contain()
+        if self.collide:
+            self.bounce()
+        self.numSteps+=1
+        return self.registerChanges()
+
+    def contains(self):
+        """
+        boolean array of the objects inside the world bounds (the ones used by contain())
+        """
+        lo,hi=self.bounds()
+        return ((self.loc>=lo)&(self.loc<=hi)).all(axis=1)
+
+    def contain(self):
+        """
+        fold every object outside the world back into it, inverting and damping its
+        velocity along the crossed axes, as SSWorld.contain
+        """
+        lo,hi=self.bounds()
+        loc,vel=self.loc,self.vel
+        outside=(loc<lo)|(loc>hi)
+        if outside.any():
+            vel[outside]*=-(1-self.damping)
+            np.copyto(loc,fold(loc,lo,hi),where=outside)
+
+    def collisions(self):
+        """
+        (i, j) indices of the pairs of objects closer than the sum of their sizes
+        """
+        if self.numObjects<2:
+            return np.zeros(0,dtype=np.int64),np.zeros(0,dtype=np.int64)
+        size=self.size
+        grid=SpatialHash(self.loc,2*size.max())
+        return grid.pairs(size)
+
+    def bounce(self):
+        """
+        elastic collisions between the objects in contact which get closer, with
+        the velocity along their normal damped as in the walls; returns the colliding pairs
+        """
+        i,j=self.collisions()
+        if len(i)==0:
+            return i,j
+        loc,vel,mass=self.loc,self.vel,self.mass
+        normal=loc[j]-loc[i]
+        normal/=np.maximum(np.sqrt(np.einsum('ij,ij->i',normal,normal)),1e-12)[:,None]
+        approach=np.einsum('ij,ij->i',vel[j]-vel[i],normal)
+        hit=approach<0
+        i,j,normal,approach=i[hit],j[hit],normal[hit],approach[hit]
+        # impulse of each collision, shared by inverse mass; objects with several contacts add them up
+        impulse=-(2-self.damping)*approach/(1/mass[i]+1/mass[j])
+        np.add.at(vel,i,-(impulse/mass[i])[:,None]*normal)
+        np.add.at(vel,j,(impulse/mass[j])[:,None]*normal)
+        return i,j
+
+    def registerChanges(self):
+        """
+        indices of the objects which moved more than rDiff, aziDiff or eleDiff since their last
+        sent position, as SSWorld.update; their registered location is updated
+        """
+        rho,azimuth,elevation=spherical(np.abs(self.regLoc-self.loc))
+        changed=np.flatnonzero((rho>self.rDiff)|(azimuth>self.aziDiff)|(elevation>self.eleDiff))
+        self.regLoc[changed]=self.loc[changed]
+        return changed
+
+    """""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+    # SPATDIF OUTPUT
+    """""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+
+    def positionCommands(self,indices):
+        """
+        /spatdif/source/<name>/position azi ele r aed commands of the given objects,
+        in degrees, with distances inside the sweet spot sent as sweetSpotSize
+        """
+        rho,azimuth,elevation=spherical(self.loc[indices])
+        rho=np.maximum(rho,self.sweetSpotSize).tolist()
+        azimuth=np.degrees(azimuth).tolist()
+        elevation=np.degrees(elevation).tolist()
+        addresses=self._addresses
+        return [[addresses[i],a,e,r,'aed'] for i,a,e,r in zip(indices.tolist(),azimuth,elevation,rho)]
+
+    def positionLines(self,indices,precision=None):
+        """
+        the position commands of the given objects already written as log lines, as spatDif.formatLine,
+        or with a fixed number of decimals (about three times faster)
+        """
+        rho,azimuth,elevation=spherical(self.loc[indices])
+        rho=np.maximum(rho,self.sweetSpotSize).tolist()
+        azimuth=np.degrees(azimuth).tolist()
+        elevation=np.degrees(elevation).tolist()
+        addresses=[self._addresses[i] for i in indices.tolist()]
+        if precision is not None:
+            line='%%s %%.%df %%.%df %%.%df aed \n' % (precision,precision,precision)
+            return ''.join([line % values for values in zip(addresses,azimuth,elevation,rho)])
+        f=spatDif.formatArgument
+        return ''.join([address+' '+f(a)+' '+f(e)+' '+f(r)+' aed \n'
+                        for address,a,e,r in zip(addresses,azimuth,elevation,rho)])
+
+    def _run(self,numSteps):
+        """
+        run numSteps steps, yielding the time, the commands of the objects added before
+        and the indices of the objects to send for every step
+        """
+        for n in range(numSteps):
+            time=self.time
+            pending=self._pending
+            self._pending=[]
+            yield time,pending,self.step()
+
+    def blocks(self,numSteps):
+        """
+        run numSteps steps, yielding (time, commands) for every step with messages,
+        as SpatDifReader.blocks(); messages of objects added before are sent with the first step
+        """
+        for time,commands,changed in self._run(numSteps):
+            commands.extend(self.positionCommands(changed))
+            if commands:
+                yield time,commands
+
+    def writeLog(self,filepath,numSteps=None,duration=None,meta=('/spatdif/version 0.3',),precision=None):
+        """
+        simulate numSteps steps (or duration seconds), writing the scene into a SpatDIF log
+
+        Parameters:
+            filepath: path to the new log file
+            numSteps, duration: length of the simulation, in steps or seconds
+            meta: list of meta section lines
+            precision: decimals of the positions; by default the log is the same as
+                spatDif.writeLog(filepath,meta,scene.blocks(numSteps)), with the shortest exact floats
+        """
+        if numSteps is None:
+            numSteps=int(round(duration*self.stepFreq))
+        with open(filepath,'w') as f:
+            for line in meta:
+                f.write(line+'\n')
+            f.write(spatDif.META_END+'\n\n')
+            for time,commands,changed in self._run(numSteps):
+                if commands or len(changed):
+                    f.write(spatDif.TIME_ADDRESS+' '+spatDif.formatArgument(time)+'\n')
+                    f.write(''.join(spatDif.formatLine(command) for command in commands))
+                    f.write(self.positionLines(changed,precision))
@@ -0,0 +1,242 @@
+# -*- coding: utf-8 -*-
+"""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+
+Copyright ANDRÉS PÉREZ LÓPEZ, January 2014
+contact@andresperezlopez.com
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+            SOUNDFIELD ROTATION
+
+Rotation of ACN/N3D B-format, as rendered by offlineRender.py or by SpatialRender,
+driven by the orientation sent by OrientationController (yaw, pitch, roll)
+
+- orientations are (yaw, pitch, roll) in radians, as OrientationController gives them
+  (azimuth, elevation, roll) in the SSWorld coordinates: yaw around z, positive to the left,
+  pitch up, and roll around the x (front) axis, applied in that order
+- each order n of the soundfield is rotated by its own (2n+1)x(2n+1) matrix, built with
+  the Ivanic-Ruedenberg recurrence from the 3x3 rotation; the whole rotation is the
+  block-diagonal (channels, channels) matrix of all of them, for any order
+- matrices are cached per orientation, quantized to a given resolution (0.5 degrees by default),
+  so that a head tracker returning to known orientations reuses them
+- rotating the soundfield costs one (frames, channels) x (channels, channels) product per
+  block, whatever the number of sources; when the orientation changes the block is
+  crossfaded between the previous and the new rotation
+
+usage, for head-tracked binaural (the soundfield rotated against the head orientation):
+    rotation=SoundfieldRotation(order=1,blockSize=128,inverse=True)
+    controller: rotation.setOrientation(yaw,pitch,roll)
+    audio: stereo=decoder.process(rotation.process(block))
+
+"""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+import collections
+import numpy as np
+import plotSphericalHarmonics as psh
+
+
+DEFAULT_RESOLUTION=np.radians(0.5)
+
+def rotationMatrix(yaw,pitch=0.,roll=0.):
+    """
+    3x3 matrix turning the front direction (x axis) towards (yaw, pitch) and rolling around it
+    """
+    cy,sy=np.cos(yaw),np.sin(yaw)
+    cp,sp=np.cos(pitch),np.sin(pitch)
+    cr,sr=np.cos(roll),np.sin(roll)
+    Rz=np.array([[cy,-sy,0.],[sy,cy,0.],[0.,0.,1.]])
+    # positive pitch takes the front up: rotation of -pitch around the y (left) axis
+    Ry=np.array([[cp,0.,-sp],[0.,1.,0.],[sp,0.,cp]])
+    Rx=np.array([[1.,0.,0.],[0.,cr,-sr],[0.,sr,cr]])
+    return Rz.dot(Ry).dot(Rx)
+
+def _P(i,a,b,l,r,previous):
+    # Ivanic-Ruedenberg helper; r and previous are indexed from -1 and -(l-1)
+    if b==l:
+        return r[i+1,2]*previous[a+l-1,2*l-2]-r[i+1,0]*previous[a+l-1,0]
+    if b==-l:
+        return r[i+1,2]*previous[a+l-1,0]+r[i+1,0]*previous[a+l-1,2*l-2]
+    return r[i+1,1]*previous[a+l-1,b+l-1]
+
+def _orderRotation(l,r,previous):
+    """
+    (2l+1, 2l+1) rotation of the order l harmonics, from the order 1 and l-1 ones
+    """
+    M=np.empty((2*l+1,2*l+1))
+    for m in range(-l,l+1):
+        d=1. if m==0 else 0.
+        for n in range(-l,l+1):
+            denominator=(2.*l)*(2.*l-1.) if abs(n)==l else float((l+n)*(l-n))
+            u=np.sqrt((l+m)*(l-m)/denominator)
+            v=0.5*np.sqrt((1.+d)*(l+abs(m)-1.)*(l+abs(m))/denominator)*(1.-2.*d)
+            w=-0.5*np.sqrt((l-abs(m)-1.)*(l-abs(m))/denominator)*(1.-d)
+            value=0.
+            if u:
+                value+=u*_P(0,m,n,l,r,previous)
+            if v:
+                if m==0:
+                    V=_P(1,1,n,l,r,previous)+_P(-1,-1,n,l,r,previous)
+                elif m>0:
+                    V=_P(1,m-1,n,l,r,previous)*np.sqrt(1.+(m==1))-_P(-1,-m+1,n,l,r,previous)*(m!=1)
+                else:
+                    V=_P(1,m+1,n,l,r,previous)*(m!=-1)+_P(-1,-m-1,n,l,r,previous)*np.sqrt(1.+(m==-1))
+                value+=v*V
+            if w:
+                if m>0:
+                    W=_P(1,m+1,n,l,r,previous)+_P(-1,-m-1,n,l,r,previous)
+                else:
+                    W=_P(1,m-1,n,l,r,previous)-_P(-1,-m+1,n,l,r,previous)
+                value+=w*W
+            M[m+l,n+l]=value
+    return M
+
+def shRotation(R,order=3):
+    """
+    (channels, channels) block-diagonal matrix M rotating ACN/N3D coefficients by the 3x3 rotation R:
+    M . encode(d) = encode(R . d) for every direction d
+    """
+    M=np.zeros((psh.numChannels(order),psh.numChannels(order)))
+    M[0,0]=1.
+    if order==0:
+        return M
+    # order 1 harmonics are proportional to (y, z, x)
+    permutation=[1,2,0]
+    r=np.asarray(R,dtype=np.float64)[np.ix_(permutation,permutation)]
+    M[1:4,1:4]=r
+    previous=r
+    for l in range(2,order+1):
+        previous=_orderRotation(l,r,previous)
+        M[l*l:(l+1)*(l+1),l*l:(l+1)*(l+1)]=previous
+    return M
+
+
+class RotationCache(object):
+    """
+    LRU cache of soundfield rotation matrices, keyed on quantized (yaw, pitch, roll) and order
+
+    Parameters:
+        resolution: quantization step in rads (default:0.5 degrees)
+        maxsize: maximum number of cached matrices (default:4096)
+    """
+    def __init__(self,resolution=DEFAULT_RESOLUTION,maxsize=4096):
+        self.resolution=float(resolution)
+        self.maxsize=int(maxsize)
+        self.hits=0
+        self.misses=0
+        self._table=collections.OrderedDict()
+        # cells are slightly adjusted so that they wrap exactly at 2*pi
+        self._steps=int(np.rint(2*np.pi/self.resolution))
+        self._step=2*np.pi/self._steps
+
+    def __len__(self):
+        return len(self._table)
+
+    def quantize(self,yaw,pitch,roll):
+        """
+        integer grid indices of the given orientation
+        """
+        return tuple(int(np.rint(angle/self._step))%self._steps for angle in (yaw,pitch,roll))
+
+    def get(self,yaw,pitch=0.,roll=0.,order=3):
+        """
+        rotation matrix of an orientation, as a read-only (channels, channels) array
+        """
+        key=self.quantize(yaw,pitch,roll)+(order,)
+        M=self._table.get(key)
+        if M is None:
+            self.misses+=1
+            M=shRotation(rotationMatrix(*[k*self._step for k in key[:3]]),order)
+            M.flags.writeable=False
+            self._table[key]=M
+            if len(self._table)>self.maxsize:
+                self._table.popitem(last=False)
+        else:
+            self.hits+=1
+            self._table.move_to_end(key)
+        return M
+
+    def clear(self):
+        """
+        remove all cached matrices and reset the counters
+        """
+        self._table.clear()
+        self.hits=0
+        self.misses=0
+
+    def info(self):
+        """
+        return a dictionary with the cache counters, to help tuning resolution and maxsize
+        """
+        total=self.hits+self.misses
+        return {'hits':self.hits,'misses':self.misses,'size':len(self._table),'maxsize':self.maxsize,
+                'resolution':self.resolution,'hitRate':self.hits/float(total) if total else 0.}
+
+# shared by the SoundfieldRotation instances
+rotationCache=RotationCache()
+
+
+class SoundfieldRotation(object):
+    """
+    block based rotation of B-format streams
+
+    Parameters:
+        order: ambisonics order of the streams (default:3)
+        blockSize: maximum frames per block
+        inverse: rotate the soundfield against the orientation (head tracking) instead of with it
+        cache: RotationCache to take the matrices from (default: the shared rotationCache)
+
+    usage:
+        rotation=SoundfieldRotation(3,512)
+        rotation.setOrientation(np.pi/2) # the front source is now at the left
+        out=rotation.process(block) # (frames, channels)
+    """
+    def __init__(self,order=3,blockSize=512,inverse=False,cache=None):
+        self.order=order
+        self.numChannels=psh.numChannels(order)
+        self.blockSize=blockSize
+        self.inverse=inverse
+        self.cache=rotationCache if cache is None else cache
+        self._ramp=(np.arange(blockSize)/float(blockSize))[:,None]
+        self._previous=np.empty((blockSize,self.numChannels))
+        self.setOrientation(0.,0.,0.)
+        self._last=self._matrix
+
+    def setOrientation(self,yaw,pitch=0.,roll=0.):
+        """
+        orientation of the next blocks, in radians
+        """
+        M=self.cache.get(yaw,pitch,roll,self.order)
+        # coefficients are rows of the blocks: out = block . M^T (M^-1 = M^T)
+        self._matrix=M if self.inverse else M.T
+
+    def process(self,block,out=None):
+        """
+        rotate a (frames, channels) B-format block; extra channels are ignored
+        """
+        frames=block.shape[0]
+        x=block[:,:self.numChannels]
+        if out is None:
+            out=np.empty((frames,self.numChannels))
+        np.dot(x,self._matrix,out=out)
+        if self._last is not self._matrix:
+            # crossfade from the previous rotation: out = previous + ramp * (new - previous)
+            ramp=self._ramp[:frames] if frames==self.blockSize else (np.arange(frames)/float(frames))[:,None]
+            previous=self._previous[:frames] if frames<=self.blockSize else np.empty((frames,self.numChannels))
+            np.dot(x,self._last,out=previous)
+            out-=previous
+            out*=ramp
+            out+=previous
+            self._last=self._matrix
+        return out
@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+"""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+
+Copyright ANDRÉS PÉREZ LÓPEZ, January 2014
+contact@andresperezlopez.com
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+            SPATDIF LOG READER
+
+Streaming reader and writer for the text logs written by SpatDifLogger.sc
+
+- file structure:
+      /spatdif/version 0.3
+      /spatdif/meta/...
+      ################################
+      /spatdif/time t
+      /spatdif/source/name/position azi ele r aed
+      ...
+  empty lines and lines starting with # are ignored,
+  and any token from a # on is considered a comment
+
+- the file is read line by line: blocks of commands sharing the same timestamp
+  are yielded one at a time, so memory use does not depend on the log length
+
+- the byte offset of every /spatdif/time line is stored in a .npy sidecar,
+  named after the log size and modification time:
+      <filepath>.<size>-<mtime_ns>.idx.npy
+  so that a log can be opened and seeked to any instant without parsing it again
+
+"""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+import glob
+import os
+import numpy as np
+
+
+TIME_ADDRESS='/spatdif/time'
+META_END='################################'
+
+def parseArgument(token):
+    """
+    cast a message argument into float if possible, leave it as a string otherwise
+    """
+    try:
+        return float(token)
+    except ValueError:
+        return token
+
+def parseLine(line):
+    """
+    split a log line into [address, arg1, arg2, ...], removing comments;
+    return None for empty or comment lines
+    """
+    tokens=line.split()
+    if '#' in tokens:
+        tokens=tokens[:tokens.index('#')]
+    if not tokens or tokens[0][0]=='#':
+        return None
+    return [tokens[0]]+[parseArgument(t) for t in tokens[1:]]
+
+def formatArgument(value):
+    """
+    inverse of parseArgument: integral values are written without decimals, as sclang does,
+    other floats with the shortest representation that reads back to the same value
+    """
+    if isinstance(value,float):
+        if value.is_integer() and abs(value)<1e15:
+            return str(int(value))
+        return repr(value)
+    return str(value)
+
+def formatLine(command):
+    """
+    write a [address, arg1, arg2, ...] command as a log line, as SpatDifLogger.writeLine does
+    """
+    return ''.join(formatArgument(value)+' ' for value in command)+'\n'
+
+def writeLog(filepath,meta,blocks):
+    """
+    write a SpatDIF log file
+    
+    Parameters:
+        filepath: path to the new log file
+        meta: list of meta section lines
+        blocks: iterable of (time, commands), as yielded by SpatDifReader.blocks()
+    """
+    with open(filepath,'w') as f:
+        for line in meta:
+            f.write(line+'\n')
+        f.write(META_END+'\n\n')
+        for time,commands in blocks:
+            if time is not None:
+                f.write(TIME_ADDRESS+' '+formatArgument(time)+'\n')
+            for command in commands:
+                f.write(formatLine(command))
+
+def isMeta(address):
+    """
+    test if the given address belongs to the meta section (version or meta)
+    """
+    words=address.split('/')
+    return len(words)>2 and (words[2]=='meta' or words[2]=='version')
+
+def indexPath(filepath):
+    """
+    path of the time index for the given log, keyed on its size and modification time
+    """
+    st=os.stat(filepath)
+    return '%s.%d-%d.idx.npy' % (filepath,st.st_size,st.st_mtime_ns)
+
+def buildIndex(filepath):
+    """
+    scan the log once and return a (blocks, 2) array with the time and the byte offset
+    of each /spatdif/time line
+    """
+    prefix=TIME_ADDRESS.encode()
+    index=[]
+    offset=0
+    with open(filepath,'rb') as f:
+        for line in f:
+            if line.startswith(prefix):
+                index.append((float(line.split()[1]),offset))
+            offset+=len(line)
+    return np.array(index,dtype=np.float64).reshape(-1,2)
+
+def loadIndex(filepath,cache=True):
+    """
+    return the time index of the given log, reading it from (or writing it to) the .npy sidecar
+    """
+    if cache:
+        sidecar=indexPath(filepath)
+        if os.path.exists(sidecar):
+            return np.load(sidecar,mmap_mode='r')
+
+    index=buildIndex(filepath)
+
+    if cache:
+        try:
+            # remove indexes of older versions of the file
+            for old in glob.glob(glob.escape(filepath)+'.*-*.idx.npy'):
+                os.remove(old)
+            tmp=sidecar+'.tmp'
+            with open(tmp,'wb') as f:
+                np.save(f,index)
+            os.replace(tmp,sidecar)
+        except (IOError,OSError):
+            # read-only location: keep the index in memory
+            pass
+
+    return index
+
+
+class SpatDifReader(object):
+    """
+    streaming reader of a SpatDIF log
+
+    Parameters:
+        filepath: path to the log file
+        cache: read/write the time index sidecar (default:True)
+
+    usage:
+        reader=SpatDifReader('TimeFileLog.txt')
+        for time,commands in reader.blocks(start=60.):
+            ...
+    """
+    def __init__(self,filepath,cache=True):
+        self.filepath=filepath
+        self.cache=cache
+        self._index=None
+        self._meta=None
+
+    @property
+    def index(self):
+        """
+        (blocks, 2) array with the time and byte offset of each /spatdif/time line
+        """
+        if self._index is None:
+            self._index=loadIndex(self.filepath,self.cache)
+        return self._index
+
+    @property
+    def times(self):
+        return self.index[:,0]
+
+    @property
+    def offsets(self):
+        return self.index[:,1].astype(np.int64)
+
+    @property
+    def duration(self):
+        return float(self.times[-1]) if len(self.index) else 0.
+
+    @property
+    def meta(self):
+        """
+        list of meta section lines (version, extensions, info...), as strings
+        """
+        if self._meta is None:
+            self._meta=[]
+            with open(self.filepath,'r') as f:
+                for line in f:
+                    if line.startswith(TIME_ADDRESS):
+                        break
+                    command=parseLine(line)
+                    if command is not None and isMeta(command[0]):
+                        self._meta.append(line.strip())
+        return self._meta
+
+    def seek(self,time):
+        """
+        byte offset of the last block starting at or before the given time
+        (the first block if time is before the beginning of the log)
+        """
+        i=int(np.searchsorted(self.times,time,side='right'))-1
+        return int(self.index[max(i,0),1]) if len(self.index) else 0
+
+    def blocks(self,start=None,end=None,offset=None):
+        """
+        generator of (time, commands) tuples, where commands is a list of [address, args...];
+        commands logged before the first /spatdif/time line are yielded with time None
+
+        Parameters:
+            start: first block time; the log is seeked through the index (default: beginning)
+            end: stop before the first block later than end (default: end of file)
+            offset: byte offset of a /spatdif/time line to start from, instead of start
+        """
+        with open(self.filepath,'rb') as f:
+            if offset is not None:
+                f.seek(offset)
+            elif start is not None:
+                f.seek(self.seek(start))
+            time=None
+            commands=[]
+            for line in f:
+                command=parseLine(line.decode('utf-8'))
+                if command is None:
+                    continue
+                if command[0]==TIME_ADDRESS:
+                    if time is not None or commands:
+                        yield time,commands
+                    time=command[1]
+                    if end is not None and time>end:
+                        return
+                    commands=[]
+                elif not isMeta(command[0]):
+                    commands.append(command)
+            if time is not None or commands:
+                yield time,commands
+
+    def __iter__(self):
+        return self.blocks()
@@ -0,0 +1,259 @@
+# -*- coding: utf-8 -*-
+"""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+
+Copyright ANDRÉS PÉREZ LÓPEZ, January 2014
+contact@andresperezlopez.com
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+            SPATDIF COLUMNAR ARCHIVE
+
+Compact binary format for SpatDIF scenes logged by SpatDifLogger.sc
+
+- all position messages of an entity (/spatdif/source/name/position azi ele r aed)
+  are stored as a (4, N) float64 matrix with rows:
+      time, azimuth, elevation, distance
+  so that each row is a contiguous array which can be memory-mapped
+
+- every other message is kept as text, together with the meta section;
+  each message has a sequence number, so the original log can be written back
+  with the same blocks and message order (see SpatDifArchive.writeLog)
+
+- file structure:
+      'SDIFCOL1' , header size (uint64) , json header , arrays
+  every array is aligned to 64 bytes and described in the header
+  by its offset, dtype and shape
+
+"""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+import array
+import json
+import re
+import struct
+import numpy as np
+import spatDif
+
+
+MAGIC=b'SDIFCOL1'
+ALIGNMENT=64
+POSITION_ROWS=('time','azimuth','elevation','distance')
+
+# /spatdif/<kind>/<name>/position
+positionAddress=re.compile(r'^/spatdif/([^/]+)/([^/]+)/position$')
+
+def isPosition(command):
+    """
+    test if the given command is an aed position message which can be stored in columns
+    """
+    return (len(command)==5 and positionAddress.match(command[0]) is not None
+            and all(isinstance(v,float) for v in command[1:4]) and command[4]=='aed')
+
+def _align(n):
+    return (n+ALIGNMENT-1)//ALIGNMENT*ALIGNMENT
+
+def writeArchive(logpath,archivepath):
+    """
+    convert a SpatDIF text log into a columnar archive
+
+    the log is streamed, so only the position columns and the other messages (as text lines)
+    are kept in memory until the archive is written
+
+    Parameters:
+        logpath: path to the text log
+        archivepath: path to the new archive
+    """
+    reader=spatDif.SpatDifReader(logpath,cache=False)
+
+    blockTimes=array.array('d')
+    blockStarts=array.array('q')
+    entities={} # (kind,name) -> [seq, time, azi, ele, dist] arrays
+    other=[] # [seq, line]
+    seq=0
+
+    for time,commands in reader.blocks():
+        if time is not None:
+            blockTimes.append(time)
+            blockStarts.append(seq)
+        for command in commands:
+            if isPosition(command):
+                match=positionAddress.match(command[0])
+                key=match.group(1),match.group(2)
+                if key not in entities:
+                    entities[key]=[array.array('q')]+[array.array('d') for r in POSITION_ROWS]
+                columns=entities[key]
+                columns[0].append(seq)
+                columns[1].append(time if time is not None else np.nan)
+                columns[2].append(command[1])
+                columns[3].append(command[2])
+                columns[4].append(command[3])
+            else:
+                other.append([seq,spatDif.formatLine(command).rstrip('\n')])
+            seq+=1
+
+    # arrays to write, in order: (description, ndarray)
+    arrays=[('blockTimes',np.frombuffer(blockTimes,dtype=np.float64)),
+            ('blockStarts',np.frombuffer(blockStarts,dtype=np.int64))]
+    entityList=[]
+    for i,(key,columns) in enumerate(entities.items()):
+        entityList.append({'kind':key[0],'name':key[1],'count':len(columns[0])})
+        arrays.append(('seq%d'%i,np.frombuffer(columns[0],dtype=np.int64)))
+        arrays.append(('positions%d'%i,np.array([np.frombuffer(c,dtype=np.float64) for c in columns[1:]]).reshape(4,-1)))
+
+    header={'version':1,
+            'meta':reader.meta,
+            'numMessages':seq,
+            'entities':entityList,
+            'other':other,
+            'arrays':{}}
+
+    # the header holds the offsets of the arrays, which depend on the header size:
+    # reserve space with placeholder offsets and grow until it fits
+    headerSize=ALIGNMENT
+    while True:
+        offset=_align(len(MAGIC)+8+headerSize)
+        for name,data in arrays:
+            header['arrays'][name]={'offset':offset,'dtype':data.dtype.str,'shape':list(data.shape)}
+            offset=_align(offset+data.nbytes)
+        encoded=json.dumps(header).encode('utf-8')
+        if len(encoded)<=headerSize:
+            break
+        headerSize=_align(len(encoded))
+
+    with open(archivepath,'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack('<Q',headerSize))
+        f.write(encoded.ljust(headerSize,b' '))
+        for name,data in arrays:
+            f.seek(header['arrays'][name]['offset'])
+            f.write(np.ascontiguousarray(data).tobytes())
+        f.truncate(offset)
+
+    return SpatDifArchive(archivepath)
+
+
+class SpatDifArchive(object):
+    """
+    read-only access to a columnar archive, with every array memory-mapped
+
+    usage:
+        archive=SpatDifArchive('scene.sdc')
+        t,azi,ele,r=archive.positions('bass')
+    """
+    def __init__(self,archivepath):
+        self.archivepath=archivepath
+        with open(archivepath,'rb') as f:
+            if f.read(len(MAGIC))!=MAGIC:
+                raise ValueError('%s is not a SpatDIF columnar archive' % archivepath)
+            headerSize,=struct.unpack('<Q',f.read(8))
+            self.header=json.loads(f.read(headerSize).decode('utf-8'))
+        self._arrays={}
+
+    def _array(self,name):
+        if name not in self._arrays:
+            desc=self.header['arrays'][name]
+            shape=tuple(desc['shape'])
+            if 0 in shape:
+                self._arrays[name]=np.empty(shape,dtype=desc['dtype'])
+            else:
+                self._arrays[name]=np.memmap(self.archivepath,dtype=desc['dtype'],mode='r',
+                                             offset=desc['offset'],shape=shape)
+        return self._arrays[name]
+
+    @property
+    def meta(self):
+        return self.header['meta']
+
+    @property
+    def entities(self):
+        """
+        list of (kind, name) tuples, e.g. ('source','bass')
+        """
+        return [(e['kind'],e['name']) for e in self.header['entities']]
+
+    @property
+    def blockTimes(self):
+        return self._array('blockTimes')
+
+    def _entityIndex(self,name,kind):
+        for i,e in enumerate(self.header['entities']):
+            if e['name']==name and e['kind']==kind:
+                return i
+        raise KeyError('%s/%s' % (kind,name))
+
+    def positions(self,name,kind='source'):
+        """
+        (4, N) memory-mapped matrix of the entity positions, with rows time, azimuth, elevation, distance
+        """
+        return self._array('positions%d'%self._entityIndex(name,kind))
+
+    def sequence(self,name,kind='source'):
+        """
+        message sequence numbers of the entity positions
+        """
+        return self._array('seq%d'%self._entityIndex(name,kind))
+
+    def messages(self):
+        """
+        generator of all messages in the original order, as (seq, command) tuples
+        """
+        other=self.header['other']
+        positions=[]
+        for i,e in enumerate(self.header['entities']):
+            address='/spatdif/%s/%s/position' % (e['kind'],e['name'])
+            positions.append((address,self._array('seq%d'%i),self._array('positions%d'%i)))
+
+        # merge all entities and the text messages by sequence number
+        owner=np.full(self.header['numMessages'],-1,dtype=np.int64)
+        row=np.zeros(self.header['numMessages'],dtype=np.int64)
+        for i,(address,seq,data) in enumerate(positions):
+            owner[seq]=i
+            row[seq]=np.arange(seq.size)
+        o=0
+        for s in range(self.header['numMessages']):
+            i=owner[s]
+            if i<0:
+                yield s,spatDif.parseLine(other[o][1])
+                o+=1
+            else:
+                address,seq,data=positions[i]
+                r=row[s]
+                yield s,[address,float(data[1,r]),float(data[2,r]),float(data[3,r]),'aed']
+
+    def blocks(self):
+        """
+        generator of (time, commands) tuples, as SpatDifReader.blocks()
+        """
+        times=self.blockTimes
+        starts=self._array('blockStarts')
+        b=-1 # current block; -1 for messages before the first /spatdif/time
+        commands=[]
+        for s,command in self.messages():
+            while b+1<len(starts) and starts[b+1]<=s:
+                if b>=0 or commands:
+                    yield (float(times[b]) if b>=0 else None),commands
+                b+=1
+                commands=[]
+            commands.append(command)
+        while b<len(starts):
+            if b>=0 or commands:
+                yield (float(times[b]) if b>=0 else None),commands
+            b+=1
+            commands=[]
+
+    def writeLog(self,logpath):
+        """
+        write the archive back as a SpatDIF text log
+        """
+        spatDif.writeLog(logpath,self.meta,self.blocks())
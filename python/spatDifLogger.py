@@ -0,0 +1,326 @@
+# -*- coding: utf-8 -*-
+"""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+
+Copyright ANDRÉS PÉREZ LÓPEZ, January 2014
+contact@andresperezlopez.com
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+            SPATDIF LOGGER
+
+Python version of SpatDifLogger.sc for high message rates: it listens to the /spatdif/...
+OSC traffic on a UDP port and writes the same text logs, readable by spatDif.py and
+SpatDifPlayer
+
+- the event loop only timestamps the received packets and appends them to a bounded
+  queue; a background thread decodes and formats them, and writes the lines in large
+  buffered chunks (bufferSize bytes, or every flushInterval seconds), so that receiving
+  never waits for the disk
+- a /spatdif/time line is written before a message if more than deltaTime seconds passed
+  since the last written one, so the messages received within deltaTime share a time line,
+  and sustained traffic still gets one at least every deltaTime seconds
+  (SpatDifLogger.writeLine compares with the previous message instead, and never writes
+  a time line while messages keep arriving closer than deltaTime)
+- logs are rotated after maxBytes bytes and/or maxDuration seconds: every file has its own
+  meta header and times starting at 0, so each one can be played back alone
+      TimeFileLog_<stamp>.txt, TimeFileLog_<stamp>_001.txt, ...
+- the socket receive buffer is enlarged to absorb bursts; packets arriving with
+  the queue full are dropped and counted, and stats() reports the received, written
+  and dropped counters and the current and maximum queue depths
+
+float arguments are written with 9 significant digits, enough for the float32 OSC arguments
+
+command line usage:
+    python spatDifLogger.py --port 57120 --path logs --max-size 100 --max-duration 3600
+
+"""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+import asyncio
+import collections
+import os
+import socket
+import threading
+import time as _time
+import oscCodec
+import spatDif
+
+
+DEFAULT_PORT=57120
+META_INFO=('author','host','date','session','location','annotation')
+
+def formatValue(value):
+    """
+    text of a message argument, as SpatDifLogger.writeLine writes it
+    """
+    if isinstance(value,float):
+        if value.is_integer() and abs(value)<1e15:
+            return str(int(value))
+        return '%.9g' % value
+    return str(value)
+
+def formatMessage(message):
+    return ''.join([formatValue(value)+' ' for value in message])+'\n'
+
+def metaHeader(extensions=(),**info):
+    """
+    meta section of a log, as SpatDifLogger.init writes it (info fields in META_INFO)
+    """
+    header='/spatdif/version 0.3\n\n'
+    if extensions:
+        header+='/spatdif/meta/extensions '+''.join(str(e)+' ' for e in extensions)
+    header+='\n'
+    for field in META_INFO:
+        if info.get(field) is not None:
+            header+='/spatdif/meta/info/'+field+' '+str(info[field])+'\n'
+    return header+'\n'+spatDif.META_END+'\n\n'
+
+
+class SpatDifLogger(asyncio.DatagramProtocol):
+    """
+    asyncio datagram protocol logging the received /spatdif messages
+
+    Parameters:
+        path: folder of the logs (default: current folder)
+        filename: name of the first log (default: TimeFileLog_<date stamp>.txt)
+        extensions, author, host, date, session, location, annotation: meta section, as SpatDifLogger.sc
+        deltaTime: minimum time between /spatdif/time lines (default:0.01)
+        maxBytes: rotate the log after this size (default: None, no limit)
+        maxDuration: rotate the log after these seconds (default: None, no limit)
+        bufferSize: bytes formatted before each write (default:1MB)
+        flushInterval: maximum seconds between writes (default:0.5)
+        maxQueue: maximum packets waiting to be written; more are dropped (default:1000000)
+        receiveBuffer: socket receive buffer size in bytes (default:8MB)
+
+    usage:
+        transport,logger=await loop.create_datagram_endpoint(lambda:SpatDifLogger('logs'),
+                                                             local_addr=('127.0.0.1',57120))
+        ...
+        logger.close()
+        print(logger.stats())
+    """
+    def __init__(self,path='.',filename=None,extensions=(),author=None,host=None,date=None,session=None,
+                 location=None,annotation=None,deltaTime=0.01,maxBytes=None,maxDuration=None,
+                 bufferSize=1<<20,flushInterval=0.5,maxQueue=1000000,receiveBuffer=8<<20):
+        self.path=path
+        if filename is None:
+            filename='TimeFileLog_'+_time.strftime('%y%m%d_%H%M%S')+'.txt'
+        self.filename=filename
+        self.header=metaHeader(extensions,author=author,host=host,date=date,session=session,
+                               location=location,annotation=annotation)
+        self.deltaTime=deltaTime
+        self.maxBytes=maxBytes
+        self.maxDuration=maxDuration
+        self.bufferSize=bufferSize
+        self.flushInterval=flushInterval
+        self.maxQueue=maxQueue
+        self.receiveBuffer=receiveBuffer
+        self.log=True
+
+        self.filenames=[]
+        self.received=0
+        self.dropped=0
+        self.messages=0
+        self.errors=0
+        self.bytes=0
+        self.maxQueueDepth=0
+        self._queue=collections.deque()
+        self._wake=threading.Event()
+        self._running=True
+        self._file=None
+        self._openFile()
+        self._thread=threading.Thread(target=self._writer,name='SpatDifLogger',daemon=True)
+        self._thread.start()
+
+    def connection_made(self,transport):
+        self.transport=transport
+        sock=transport.get_extra_info('socket')
+        if sock is not None and self.receiveBuffer:
+            try:
+                sock.setsockopt(socket.SOL_SOCKET,socket.SO_RCVBUF,self.receiveBuffer)
+            except OSError:
+                pass
+
+    def datagram_received(self,data,addr):
+        if not self.log:
+            return
+        self.received+=1
+        queue=self._queue
+        depth=len(queue)
+        if depth>=self.maxQueue:
+            self.dropped+=1
+            return
+        queue.append((_time.monotonic(),data))
+        if depth==0:
+            self._wake.set()
+        elif depth>=self.maxQueueDepth:
+            self.maxQueueDepth=depth+1
+
+    """""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+    # WRITER THREAD
+    """""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+
+    def _openFile(self):
+        """
+        start a new log file, with its meta header and times from 0
+        """
+        name=self.filename
+        if self.filenames:
+            root,ext=os.path.splitext(self.filename)
+            name='%s_%03d%s' % (root,len(self.filenames),ext)
+        filepath=os.path.join(self.path,name)
+        if self.path and not os.path.isdir(self.path):
+            os.makedirs(self.path)
+        self._file=open(filepath,'w',buffering=self.bufferSize)
+        self._file.write(self.header)
+        self._fileBytes=len(self.header)
+        self._empty=True
+        self._offset=None
+        self._lastTime=None
+        self.filenames.append(filepath)
+
+    def _closeFile(self):
+        self._file.close()
+        if self._empty:
+            # as SpatDifLogger.close: logs without messages are removed
+            os.remove(self.filenames.pop())
+
+    def _rotate(self,time):
+        """
+        test if the log has to be rotated before a message received at time
+        """
+        if self._empty:
+            return False
+        if self.maxBytes is not None and self._fileBytes>=self.maxBytes:
+            return True
+        return self.maxDuration is not None and time-self._offset>=self.maxDuration
+
+    def _writer(self):
+        chunks=[]
+        pending=0
+        lastWrite=_time.monotonic()
+        queue=self._queue
+        while True:
+            if not queue:
+                if not self._running:
+                    break
+                self._wake.wait(self.flushInterval)
+                self._wake.clear()
+            while queue:
+                time,data=queue.popleft()
+                try:
+                    messages=oscCodec.decode(data)[1]
+                except (ValueError,IndexError,UnicodeDecodeError):
+                    self.errors+=1
+                    continue
+                for message in messages:
+                    # as SpatDifLogger.oscRecFunc: only the spatdif route is logged
+                    if message[0].split('/')[1:2]!=['spatdif']:
+                        continue
+                    if self._rotate(time):
+                        self._file.write(''.join(chunks))
+                        chunks=[]
+                        pending=0
+                        self._closeFile()
+                        self._openFile()
+                    if self._offset is None:
+                        self._offset=time
+                        self._lastTime=time-2*self.deltaTime
+                    line=formatMessage(message)
+                    if time-self._lastTime>self.deltaTime:
+                        line=spatDif.TIME_ADDRESS+' '+formatValue(time-self._offset)+'\n'+line
+                        self._lastTime=time
+                    self._empty=False
+                    chunks.append(line)
+                    pending+=len(line)
+                    self._fileBytes+=len(line)
+                    self.messages+=1
+                if pending>=self.bufferSize:
+                    break
+            now=_time.monotonic()
+            if chunks and (pending>=self.bufferSize or now-lastWrite>=self.flushInterval or not queue):
+                text=''.join(chunks)
+                self._file.write(text)
+                self.bytes+=len(text)
+                chunks=[]
+                pending=0
+            if now-lastWrite>=self.flushInterval:
+                self._file.flush()
+                lastWrite=now
+        self._closeFile()
+
+    """""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+    # CONTROL
+    """""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+
+    def stats(self):
+        """
+        dictionary of counters: packets received and dropped, messages written, decoding errors,
+        bytes written, queue depth (current and maximum) and log files
+        """
+        return {'received':self.received,'dropped':self.dropped,'messages':self.messages,'errors':self.errors,
+                'bytes':self.bytes,'queueDepth':len(self._queue),'maxQueueDepth':self.maxQueueDepth,
+                'files':list(self.filenames)}
+
+    def close(self):
+        """
+        stop receiving, write everything queued and close the log
+        """
+        self.log=False
+        transport=getattr(self,'transport',None)
+        if transport is not None:
+            transport.close()
+        self._running=False
+        self._wake.set()
+        self._thread.join()
+
+async def runLogger(host='0.0.0.0',port=DEFAULT_PORT,duration=None,reportInterval=None,**kwargs):
+    """
+    log the traffic on host:port for duration seconds (forever if None), printing
+    the counters every reportInterval seconds; returns the final counters
+    """
+    loop=asyncio.get_running_loop()
+    transport,logger=await loop.create_datagram_endpoint(lambda:SpatDifLogger(**kwargs),local_addr=(host,port))
+    start=loop.time()
+    try:
+        while duration is None or loop.time()-start<duration:
+            wait=reportInterval or 1.
+            if duration is not None:
+                wait=min(wait,duration-(loop.time()-start))
+            await asyncio.sleep(max(wait,0.))
+            if reportInterval:
+                print(logger.stats())
+    finally:
+        logger.close()
+    return logger.stats()
+
+
+if __name__=='__main__':
+    import argparse
+    parser=argparse.ArgumentParser(description='log SpatDIF OSC messages')
+    parser.add_argument('--host',default='0.0.0.0')
+    parser.add_argument('--port',type=int,default=DEFAULT_PORT)
+    parser.add_argument('--path',default='.')
+    parser.add_argument('--filename',default=None)
+    parser.add_argument('--max-size',type=float,default=None,help='rotate after this size in MB')
+    parser.add_argument('--max-duration',type=float,default=None,help='rotate after these seconds')
+    parser.add_argument('--duration',type=float,default=None,help='stop after these seconds')
+    parser.add_argument('--report',type=float,default=10.,help='seconds between counter reports')
+    args=parser.parse_args()
+    maxBytes=None if args.max_size is None else int(args.max_size*(1<<20))
+    try:
+        print(asyncio.run(runLogger(args.host,args.port,args.duration,args.report,path=args.path,
+                                    filename=args.filename,maxBytes=maxBytes,maxDuration=args.max_duration)))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,340 @@
+# -*- coding: utf-8 -*-
+"""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+
+Copyright ANDRÉS PÉREZ LÓPEZ, January 2014
+contact@andresperezlopez.com
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+            VBAP
+
+Vector Base Amplitude Panning gains, as the vbapEncoder SynthDef of SpatialRender
+(VBAPSpeakerArray + VBAP.ar), for many source directions at once
+
+- the speaker pairs (2D) or triplets (3D) and the inverses of their bases are computed
+  once per layout; 2D layouts, as VBAPSpeakerArray.new(2, [-30,30,0,-110,110]),
+  ignore the source elevation
+
+- a grid over azimuth (and elevation in 3D) keeps, for each cell, the few pairs/triplets
+  which cover it, so that each direction only tests its cell candidates;
+  directions found outside all their candidates (only possible at grid resolution
+  scale) fall back to testing every pair/triplet
+
+- as VBAPSpeakerArray, 3D layouts whose speakers surround the listener are used as they are;
+  only when the hull of the speakers does not enclose the listener, imaginary speakers are
+  added at the zenith and/or nadir, and their gains are shared among the real speakers
+  next to them, so that no direction is left silent
+
+- gains are normalized in power, and all azimuths and elevations are in degrees,
+  positive azimuth to the left as in the rest of 3Dj
+
+command line usage:
+    python vbap.py
+checks that the gains keep unit energy over the sphere, zenith and nadir included,
+for some reference layouts
+
+"""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+import itertools
+import numpy as np
+
+
+def speakerLayout(layout):
+    """
+    (speakers, 2) array of azimuth, elevation in degrees, from a list of azimuths
+    or a list of [azimuth, elevation] pairs
+    """
+    layout=np.array(layout,dtype=np.float64)
+    if layout.ndim==1:
+        layout=np.column_stack((layout,np.zeros(len(layout))))
+    if layout.ndim!=2 or layout.shape[1]!=2:
+        raise ValueError('layout must be a list of azimuths or of [azimuth, elevation] pairs')
+    return layout
+
+def cartesian(azimuth,elevation):
+    """
+    (N, 3) unit vectors of the given directions in degrees
+    """
+    azi=np.radians(azimuth)
+    ele=np.radians(elevation)
+    return np.column_stack((np.cos(ele)*np.cos(azi),np.cos(ele)*np.sin(azi),np.sin(ele)))
+
+def triangulate(points,tolerance=1e-9):
+    """
+    faces of the convex hull of points on the unit sphere, as a (triplets, 3) array of indices
+
+    every triplet is checked against every point, which is fine for speaker layouts
+    (a 64 speaker layout takes a few hundred ms)
+    """
+    triplets=np.array(list(itertools.combinations(range(len(points)),3)),dtype=np.int64).reshape(-1,3)
+    a,b,c=points[triplets[:,0]],points[triplets[:,1]],points[triplets[:,2]]
+    normals=np.cross(b-a,c-a)
+    length=np.sqrt((normals**2).sum(axis=1))
+    valid=length>tolerance
+    triplets,a,normals=triplets[valid],a[valid],normals[valid]/length[valid][:,None]
+    # a face has every point on the same side of its plane
+    offsets=(normals*a).sum(axis=1)
+    side=normals.dot(points.T)-offsets[:,None]
+    outer=(side<=tolerance).all(axis=1)|(side>=-tolerance).all(axis=1)
+    triplets,normals,offsets=triplets[outer],normals[outer],offsets[outer]
+
+    # faces with more than 3 speakers (e.g. the squares of a cube) give overlapping triplets:
+    # replace them with a fan of triangles around the polygon
+    flip=np.where(offsets<0,-1.,1.)
+    planes=np.round(np.column_stack((normals*flip[:,None],offsets*flip)),6)
+    planes,group=np.unique(planes,axis=0,return_inverse=True)
+    group=group.ravel()
+    faces=[]
+    for g in range(len(planes)):
+        members=triplets[group==g]
+        if len(members)==1:
+            faces.append(members)
+            continue
+        vertices=np.unique(members)
+        centered=points[vertices]-points[vertices].mean(axis=0)
+        u=centered[0]/np.sqrt((centered[0]**2).sum())
+        v=np.cross(planes[g,:3],u)
+        polygon=vertices[np.argsort(np.arctan2(centered.dot(v),centered.dot(u)))]
+        faces.append(np.column_stack((np.repeat(polygon[0],len(polygon)-2),polygon[1:-1],polygon[2:])))
+    return np.vstack(faces) if faces else triplets
+
+def adjacentPairs(azimuth):
+    """
+    (pairs, 2) array of indices of the speakers adjacent in azimuth, closing the circle
+    """
+    order=np.argsort(np.mod(azimuth,360.))
+    return np.column_stack((order,np.roll(order,-1)))
+
+def enclosesOrigin(points,tolerance=1e-9):
+    """
+    True if the origin is strictly inside the convex hull of points on the unit sphere
+    """
+    faces=triangulate(points)
+    if len(faces)==0:
+        return False
+    a,b,c=points[faces[:,0]],points[faces[:,1]],points[faces[:,2]]
+    normals=np.cross(b-a,c-a)
+    normals/=np.sqrt((normals**2).sum(axis=1))[:,None]
+    # the centroid is inside any hull with volume: the origin must be on its side of every face
+    centroid=points.mean(axis=0)
+    origin=-(normals*a).sum(axis=1)
+    inner=((centroid-a)*normals).sum(axis=1)
+    return bool(((np.abs(origin)>tolerance)&(origin*inner>0)).all())
+
+def imaginarySpeakers(layout):
+    """
+    zenith and/or nadir directions to add to a 3D layout so that its hull encloses the listener;
+    none if the real speakers already surround it, as VBAPSpeakerArray assumes
+    """
+    points=cartesian(layout[:,0],layout[:,1])
+    options=([],[(0.,90.)],[(0.,-90.)],[(0.,90.),(0.,-90.)])
+    for extra in options:
+        extra=np.array(extra).reshape(-1,2)
+        if enclosesOrigin(np.vstack((points,cartesian(extra[:,0],extra[:,1])))):
+            return extra
+    return extra
+
+
+class VBAP(object):
+    """
+    VBAP gains for a speaker layout
+
+    Parameters:
+        layout: list of azimuths, or of [azimuth, elevation] pairs, in degrees
+        dim: 2 (pairs, elevation ignored) or 3 (triplets) (default: 2 if every elevation is 0)
+        resolution: lookup grid cell size in degrees (default:2)
+
+    usage:
+        vbap=VBAP([-30,30,0,-110,110])
+        g=vbap.gains(azimuth,elevation) # (directions, 5)
+    """
+    def __init__(self,layout,dim=None,resolution=2.):
+        self.layout=speakerLayout(layout)
+        if dim is None:
+            dim=2 if not self.layout[:,1].any() else 3
+        if dim not in (2,3):
+            raise ValueError('dim should be 2 or 3')
+        self.dim=dim
+        self.resolution=resolution
+        self.numSpeakers=len(self.layout)
+
+        if dim==2:
+            if self.numSpeakers<2:
+                raise ValueError('2D VBAP needs at least 2 speakers')
+            points=cartesian(self.layout[:,0],np.zeros(self.numSpeakers))[:,:2]
+            self.sets=adjacentPairs(self.layout[:,0])
+        else:
+            # imaginary speakers are appended after the real ones
+            points=cartesian(*np.vstack((self.layout,imaginarySpeakers(self.layout))).T)
+            self.sets=triangulate(points)
+            if len(self.sets)==0:
+                raise ValueError('3D VBAP needs at least 3 speakers not in a plane through the center')
+        self.points=points
+        self._shareImaginary()
+        # g = inverse . direction, for every pair/triplet (sets with a singular base are dropped)
+        bases=points[self.sets].transpose(0,2,1)
+        valid=np.abs(np.linalg.det(bases))>1e-9
+        self.sets=self.sets[valid]
+        self.inverses=np.linalg.inv(bases[valid])
+        self._buildGrid()
+
+    def _shareImaginary(self):
+        """
+        (imaginary, real) amplitude shares of each imaginary speaker among the real speakers
+        it forms triplets with
+        """
+        n=self.numSpeakers
+        self.shares=np.zeros((len(self.points)-n,n))
+        for e in range(len(self.points)-n):
+            neighbours=np.unique(self.sets[(self.sets==n+e).any(axis=1)])
+            neighbours=neighbours[neighbours<n]
+            if len(neighbours):
+                self.shares[e,neighbours]=1./len(neighbours)
+
+    def _cells(self,azimuth,elevation):
+        """
+        grid cell index of each direction
+        """
+        a=np.floor(np.mod(azimuth,360.)/self._aziStep).astype(np.int64)%self._aziCells
+        if self.dim==2:
+            return a
+        e=np.clip(np.floor((np.asarray(elevation)+90.)/self._eleStep).astype(np.int64),0,self._eleCells-1)
+        return e*self._aziCells+a
+
+    def _vectors(self,azimuth,elevation):
+        if self.dim==2:
+            return cartesian(azimuth,np.zeros(np.shape(azimuth)))[:,:2]
+        return cartesian(azimuth,elevation)
+
+    def _bestSets(self,vectors,candidates=None):
+        """
+        for each vector, the candidate set (row of candidates, -1 for padding; None for all sets)
+        with the largest minimum gain, and that gain
+        """
+        if candidates is None:
+            score=np.einsum('tij,vj->vti',self.inverses,vectors).min(axis=2)
+            best=score.argmax(axis=1)
+            return best,score[np.arange(len(vectors)),best]
+        valid=candidates>=0
+        g=np.einsum('vkij,vj->vki',self.inverses[np.where(valid,candidates,0)],vectors)
+        score=np.where(valid,g.min(axis=2),-np.inf)
+        k=score.argmax(axis=1)
+        rows=np.arange(len(vectors))
+        return candidates[rows,k],score[rows,k]
+
+    def _buildGrid(self):
+        self._aziCells=int(np.ceil(360./self.resolution))
+        self._aziStep=360./self._aziCells
+        self._eleCells=1 if self.dim==2 else int(np.ceil(180./self.resolution))
+        self._eleStep=180./self._eleCells
+
+        # sample each cell on a 3x3 (2D: 3) lattice including its borders,
+        # and keep every set which is the best one for some sample
+        s=np.linspace(0.,1.,3)
+        a=(np.arange(self._aziCells)[:,None]+s[None,:])*self._aziStep
+        if self.dim==2:
+            azimuth=a.ravel()
+            elevation=np.zeros(azimuth.size)
+            cells=np.repeat(np.arange(self._aziCells),len(s))
+        else:
+            e=(np.arange(self._eleCells)[:,None]+s[None,:])*self._eleStep-90.
+            E,A=np.meshgrid(e.ravel(),a.ravel(),indexing='ij')
+            elevation,azimuth=E.ravel(),A.ravel()
+            eCell=np.repeat(np.arange(self._eleCells),len(s))
+            aCell=np.repeat(np.arange(self._aziCells),len(s))
+            EC,AC=np.meshgrid(eCell,aCell,indexing='ij')
+            cells=(EC*self._aziCells+AC).ravel()
+
+        best=np.empty(len(azimuth),dtype=np.int64)
+        vectors=self._vectors(azimuth,elevation)
+        chunk=max(1,(1<<20)//len(self.sets))
+        for i in range(0,len(vectors),chunk):
+            best[i:i+chunk]=self._bestSets(vectors[i:i+chunk])[0]
+
+        pairs=np.unique(cells*len(self.sets)+best)
+        cellOf,setOf=pairs//len(self.sets),pairs%len(self.sets)
+        counts=np.bincount(cellOf,minlength=self._aziCells*self._eleCells)
+        width=counts.max()
+        self.candidates=np.full((len(counts),width),-1,dtype=np.int64)
+        starts=np.concatenate(([0],np.cumsum(counts)[:-1]))
+        self.candidates[cellOf,np.arange(len(pairs))-starts[cellOf]]=setOf
+
+    def gains(self,azimuth,elevation=0.):
+        """
+        (directions, speakers) power normalized gains for the given directions in degrees
+        """
+        azimuth=np.atleast_1d(np.asarray(azimuth,dtype=np.float64))
+        elevation=np.broadcast_to(np.asarray(elevation,dtype=np.float64),azimuth.shape)
+        vectors=self._vectors(azimuth,elevation)
+        best,score=self._bestSets(vectors,self.candidates[self._cells(azimuth,elevation)])
+
+        # directions outside all the candidates of their cell
+        missed=np.flatnonzero(score<-1e-9)
+        if len(missed):
+            best[missed]=self._bestSets(vectors[missed])[0]
+
+        rows=np.arange(len(vectors))
+        g=np.einsum('vij,vj->vi',self.inverses[best],vectors)
+        np.maximum(g,0.,out=g)
+        g/=np.maximum(np.sqrt((g**2).sum(axis=1)),1e-12)[:,None]
+        gains=np.zeros((len(vectors),len(self.points)))
+        gains[rows[:,None],self.sets[best]]=g
+        if len(self.shares)==0:
+            return gains
+        # imaginary speakers: their gains go to their neighbours, and the power is normalized again
+        real=gains[:,:self.numSpeakers]+gains[:,self.numSpeakers:].dot(self.shares)
+        real/=np.maximum(np.sqrt((real**2).sum(axis=1)),1e-12)[:,None]
+        return real
+
+# VBAP instances already built in this session, by layout
+_instances={}
+
+def layoutVBAP(layout,dim=None,resolution=2.):
+    """
+    VBAP instance for the given layout, built only the first time it is requested
+    """
+    layout=speakerLayout(layout)
+    key=(tuple(np.round(layout,6).ravel()),dim,resolution)
+    if key not in _instances:
+        _instances[key]=VBAP(layout,dim,resolution)
+    return _instances[key]
+
+
+def checkEnergy(layout,dim=None,step=2.):
+    """
+    maximum deviation from 1 of the gains energy (sum of squared gains) over a grid of directions
+    every step degrees, poles included
+    """
+    vbap=layoutVBAP(layout,dim)
+    elevation,azimuth=np.meshgrid(np.arange(-90.,90.+step/2,step),np.arange(0.,360.,step),indexing='ij')
+    energy=(vbap.gains(azimuth.ravel(),elevation.ravel())**2).sum(axis=1)
+    return float(np.abs(energy-1.).max())
+
+# layouts checked from the command line: cube at +-35 degrees, rings at 0 and 40 degrees, 5.0 with heights
+CHECK_LAYOUTS={
+    'cube':[[a,e] for e in (-35.,35.) for a in (45.,135.,-135.,-45.)],
+    'rings 0+40':[[a,0.] for a in range(0,360,45)]+[[a,40.] for a in range(0,360,90)],
+    '5.0+2':[[-30,0],[30,0],[0,0],[-110,0],[110,0],[-45,30],[45,30]],
+    '2D 5.0':[-30,30,0,-110,110],
+}
+
+if __name__=='__main__':
+    failed=False
+    for name,layout in CHECK_LAYOUTS.items():
+        error=checkEnergy(layout)
+        print('%-12s %d imaginary speakers, energy error %.2e' % (name,len(layoutVBAP(layout).shares),error))
+        failed|=error>1e-9
+    if failed:
+        raise SystemExit('gains energy differs from 1')